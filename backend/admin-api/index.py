@@ -1,21 +1,801 @@
+import base64
+import contextlib
+import csv
+import datetime
+import functools
+import hashlib
+import hmac
+import importlib.util
+import io
 import json
+import operator
 import os
-import psycopg2
-from decimal import Decimal
-from typing import Dict, Any, List, Optional
+import random
+import re
+import sys
+import threading
+import time
+import types
+import weakref
+import zlib
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+class LazyModule(types.ModuleType):
+    '''Заместитель модуля: настоящий импорт выполняется при первом обращении к атрибуту'''
+    def __getattr__(self, attr: str) -> Any:
+        # import_module берёт блокировку импорта модуля, и потоки, первыми обратившиеся к нему одновременно,
+        # ждут один импорт. LazyLoader до Python 3.12.3 отдавал второму потоку недозагруженный модуль
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name: str):
+    '''Модуль, который импортируется при первом обращении к атрибуту; None, если пакет не установлен'''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+psycopg2 = lazy_import('psycopg2')
+orjson = lazy_import('orjson')
+brotli = lazy_import('brotli')
+
+FUNCTION_NAME = 'admin-api'
+CORS_ALLOW_HEADERS = 'Content-Type, X-Auth-Token, X-Read-After-LSN'
+SCHEMA = 't_p90313977_education_center_web'
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+DB_PREPARED_MAX = int(os.environ.get('DB_PREPARED_MAX', '64'))
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '1'))
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '0') == '1'
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()]
+DB_READ_SELECTION = os.environ.get('DB_READ_SELECTION', 'round_robin')
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', '10'))
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+DB_JSON_TYPECASTERS_ENABLED = os.environ.get('DB_JSON_TYPECASTERS', '1') == '1'
+AUTH_TOKEN_KEYS = [secret.encode('utf-8') for secret in os.environ.get('AUTH_TOKEN_SECRET', '').split(',') if secret]
+
+_pool: Dict[str, List[Tuple[Any, float]]] = {}
+_pool_urls: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_pool_stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'prepares': 0, 'replica_reads': 0, 'primary_reads': 0}
+_replicas = {url: {'lag': 0.0, 'latency': None, 'healthy': True, 'checked_at': float('-inf')} for url in DATABASE_READ_URLS}
+_read_primary_until = 0.0
+_replica_turn = 0
+_prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_trace_local = threading.local()
+_cold_start = True
+_cursor_classes: Dict[str, type] = {}
+_column_types: Dict[str, Dict[str, str]] = {}
+_trigram_available: Optional[bool] = None
+ROUTES: Dict[str, List[Tuple[Optional[str], Optional[Callable], Callable]]] = {}
+
+def _is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверка соединения из пула; долго простаивавшие проверяются запросом'''
+    if conn.closed:
+        return False
+    if time.monotonic() - released_at < DB_POOL_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        conn.close()
+        return False
+
+def get_db_connection(url: Optional[str] = None):
+    '''Получение подключения к базе данных из пула контейнера; url - реплика для чтения, по умолчанию основная БД'''
+    with trace_phase('connect'):
+        return _acquire_db_connection(url or os.environ.get('DATABASE_URL'))
+
+def _acquire_db_connection(url: str):
+    '''Соединение из пула адреса либо новое подключение, если свободных нет'''
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise RuntimeError('Database connection pool exhausted')
+    try:
+        while True:
+            with _pool_lock:
+                idle = _pool.get(url)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if _is_connection_alive(conn, released_at):
+                _pool_stats['hits'] += 1
+                return conn
+            _pool_stats['reconnects'] += 1
+        _pool_stats['misses'] += 1
+        conn = psycopg2.connect(url)
+        conn.autocommit = False
+        conn.cursor_factory = traced_cursor_class()
+        with _pool_lock:
+            _prepared[conn] = {}
+            _pool_urls[conn] = url
+        return conn
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_db_connection(conn, cur=None) -> None:
+    '''Возврат подключения в пул; сломанные соединения закрываются'''
+    try:
+        if cur is not None and not cur.closed:
+            cur.close()
+        if not conn.closed:
+            conn.rollback()
+            with _pool_lock:
+                idle = _pool.setdefault(_pool_urls.get(conn, ''), [])
+                if len(idle) < DB_POOL_MAX_SIZE:
+                    idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+    except psycopg2.Error:
+        conn.close()
+    finally:
+        _pool_slots.release()
+
+def get_read_connection(min_lsn: str = ''):
+    '''Соединение с репликой, отстающей не больше DB_REPLICA_MAX_LAG_SECONDS и догнавшей min_lsn; None - читать с основной БД'''
+    if not DATABASE_READ_URLS:
+        return None
+    if time.monotonic() < _read_primary_until:
+        _pool_stats['primary_reads'] += 1
+        return None
+    for url in replica_order():
+        try:
+            conn = get_db_connection(url)
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+            continue
+        try:
+            if replica_ready(conn, url, min_lsn):
+                # Проверка реплики не оставляет открытую транзакцию: первый запрос обработчика можно повторить
+                conn.rollback()
+                _pool_stats['replica_reads'] += 1
+                return conn
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+        release_db_connection(conn)
+    _pool_stats['primary_reads'] += 1
+    return None
+
+def replica_order() -> List[str]:
+    '''Реплики-кандидаты: исправные и те, кого пора перепроверить; по кругу или по задержке проверки'''
+    now = time.monotonic()
+    candidates = [url for url in DATABASE_READ_URLS
+                  if _replicas[url]['healthy'] or now - _replicas[url]['checked_at'] >= DB_REPLICA_CHECK_INTERVAL]
+    if len(candidates) < 2:
+        return candidates
+    if DB_READ_SELECTION == 'least_latency':
+        return sorted(candidates, key=lambda url: _replicas[url]['latency'])
+    global _replica_turn
+    with _pool_lock:
+        _replica_turn = turn = (_replica_turn + 1) % len(candidates)
+    return candidates[turn:] + candidates[:turn]
+
+def replica_ready(conn, url: str, min_lsn: str) -> bool:
+    '''Отставание реплики проверяется раз в DB_REPLICA_CHECK_INTERVAL; min_lsn (X-Read-After-LSN) - при каждом чтении'''
+    state = _replicas[url]
+    now = time.monotonic()
+    with conn.cursor() as cur:
+        if now - state['checked_at'] >= DB_REPLICA_CHECK_INTERVAL:
+            started = time.perf_counter()
+            # Без новых записей replay_timestamp стареет, поэтому реплика, проигравшая всё полученное, не отстаёт
+            cur.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+                """
+            )
+            lag = float(cur.fetchone()[0])
+            latency = time.perf_counter() - started
+            state.update(
+                lag=lag,
+                latency=latency if state['latency'] is None else state['latency'] * 0.7 + latency * 0.3,
+                healthy=lag <= DB_REPLICA_MAX_LAG_SECONDS,
+                checked_at=now
+            )
+        if not state['healthy']:
+            return False
+        if not min_lsn:
+            return True
+        try:
+            cur.execute('SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)', (min_lsn,))
+        except psycopg2.DataError:
+            conn.rollback()
+            return True
+        return cur.fetchone()[0]
+
+def read_after_write(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''После записи чтения контейнера идут в основную БД DB_READ_YOUR_WRITES_SECONDS, а клиент получает LSN записи для X-Read-After-LSN'''
+    global _read_primary_until
+    _read_primary_until = time.monotonic() + DB_READ_YOUR_WRITES_SECONDS
+    with request.conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cur.fetchone()[0]
+    headers = response['headers']
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, X-Read-After-LSN' if exposed else 'X-Read-After-LSN'
+    headers['X-Read-After-LSN'] = lsn
+    return response
+
+def _positional_sql(sql: str) -> str:
+    '''Плейсхолдеры %s в нумерованные $1..$n для PREPARE'''
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${number}{part}' for number, part in enumerate(parts[1:], 1))
+
+def execute_prepared(cur, key: Tuple, sql: str, params=()) -> None:
+    '''Выполнение через prepared statement соединения: PREPARE при первом обращении по ключу, дальше EXECUTE'''
+    statements = _prepared.get(cur.connection) if DB_PREPARED_STATEMENTS else None
+    if statements is None:
+        cur.execute(sql, params or None)
+        return
+    # Состояние до PREPARE: повтор безопасен, только если этот запрос открывает транзакцию
+    idle = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    name = statements.get(key)
+    if name is None:
+        if len(statements) >= DB_PREPARED_MAX:
+            cur.execute(sql, params or None)
+            return
+        name = f'stmt_{len(statements) + 1}'
+        cur.execute(f'PREPARE {name} AS {_positional_sql(sql)}')
+        statements[key] = name
+        _pool_stats['prepares'] += 1
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f'EXECUTE {name}')
+    except psycopg2.Error as error:
+        # 0A000 - план SELECT * устарел после ALTER TABLE; в начале транзакции запрос готовится заново,
+        # иначе соединение закрывается, чтобы в пул не вернулись устаревшие prepared statements
+        if error.pgcode != '0A000':
+            raise
+        if not idle:
+            _prepared.pop(cur.connection, None)
+            cur.connection.close()
+            raise
+        cur.connection.rollback()
+        cur.execute('DEALLOCATE ALL')
+        statements.clear()
+        execute_prepared(cur, key, sql, params)
+
+def get_pool_stats() -> Dict[str, Any]:
+    '''Счётчики попаданий и промахов пула соединений'''
+    with _pool_lock:
+        idle = sum(len(conns) for conns in _pool.values())
+    stats = dict(_pool_stats, idle=idle, max_size=DB_POOL_MAX_SIZE)
+    if _replicas:
+        stats['replica_lag'] = [round(state['lag'], 3) if state['healthy'] else None for state in _replicas.values()]
+    return stats
+
+class RequestTrace:
+    '''Замеры одного запроса: время по фазам, число SQL-операторов и строк'''
+    __slots__ = ('started', 'phases', 'queries', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries = 0
+        self.rows = 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+@contextlib.contextmanager
+def trace_phase(phase: str):
+    '''Учёт времени блока в фазе текущего запроса; без активного замера ничего не делает'''
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - started)
+
+def traced_cursor_class() -> type:
+    '''Класс курсора с замерами; создаётся при первом подключении, чтобы psycopg2 не импортировался на старте'''
+    cls = _cursor_classes.get('traced')
+    if cls is not None:
+        return cls
+    
+    class TracedCursor(psycopg2.extensions.cursor):
+        '''Курсор, учитывающий выполнение (sql) и разбор строк (fetch) в замерах запроса'''
+        def execute(self, query, vars=None):
+            trace = current_trace()
+            if trace is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                trace.queries += 1
+                trace.add('sql', time.perf_counter() - started)
+
+        def fetchone(self):
+            trace = current_trace()
+            if trace is None:
+                return super().fetchone()
+            started = time.perf_counter()
+            row = super().fetchone()
+            trace.add('fetch', time.perf_counter() - started)
+            if row is not None:
+                trace.rows += 1
+            return row
+
+        def fetchmany(self, size=None):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+
+        def fetchall(self):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchall()
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+    
+    _cursor_classes['traced'] = TracedCursor
+    return TracedCursor
+
+def add_server_timing(response: Dict[str, Any], trace: RequestTrace, total: float) -> None:
+    '''Заголовок Server-Timing с фазами запроса, доступный браузеру через CORS'''
+    metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in trace.phases.items()]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    headers = response.setdefault('headers', {})
+    headers['Server-Timing'] = ', '.join(metrics)
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+
+def instrument(handler: Callable) -> Callable:
+    '''Обёртка handler: одна строка JSON-лога на запрос (с выборкой по INSTRUMENTATION_SAMPLE_RATE)'''
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        if not cold_start and random.random() >= INSTRUMENTATION_SAMPLE_RATE:
+            return handler(event, context)
+        
+        trace = RequestTrace()
+        _trace_local.trace = trace
+        try:
+            response = handler(event, context)
+        finally:
+            _trace_local.trace = None
+        total = time.perf_counter() - trace.started
+        
+        body = response.get('body') or ''
+        status = response.get('statusCode', 200)
+        record = {
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'query': event.get('queryStringParameters') or {},
+            'status': status,
+            'cold_start': cold_start,
+            'duration_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()},
+            'sql_count': trace.queries,
+            'rows': trace.rows,
+            'response_bytes': len(body),
+            'pool': get_pool_stats()
+        }
+        if status >= 500:
+            record['error'] = body[:500]
+        print(json.dumps(record, ensure_ascii=False))
+        
+        if SERVER_TIMING_ENABLED:
+            add_server_timing(response, trace, total)
+        return response
+    return wrapper
+
+
+def dumps_json(data: Any) -> str:
+    '''Компактная сериализация ответа в UTF-8; при наличии orjson используется он'''
+    with trace_phase('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data).decode('utf-8')
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def response(status: int, body: str = '', headers: Optional[Dict[str, str]] = None, base64_encoded: bool = False) -> Dict[str, Any]:
+    '''Ответ шлюзу; заголовки дополняют или переопределяют JSON_HEADERS'''
+    return {
+        'statusCode': status,
+        'headers': dict(JSON_HEADERS, **headers) if headers else dict(JSON_HEADERS),
+        'body': body,
+        'isBase64Encoded': base64_encoded
+    }
+
+def json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return response(status, dumps_json(data), headers)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return json_response(status, {'error': message})
+
+def accepted_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    '''Лучшее из поддерживаемых сжатий по Accept-Encoding: br (если установлен brotli), затем gzip'''
+    accept = headers.get('Accept-Encoding', headers.get('accept-encoding', ''))
+    if not accept:
+        return None
+    weights = {}
+    for part in accept.lower().split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    
+    best, best_weight = None, 0.0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def compress_body(payload: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    '''Сжатие тела в gzip (через zlib, без импорта модуля gzip) или brotli'''
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY if level is None else level)
+    compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress(payload) + compressor.flush()
+
+def encoded_response(response: Dict[str, Any], payload: bytes, encoding: str) -> Dict[str, Any]:
+    '''Ответ со сжатым телом в base64; ETag получает суффикс кодировки, как у разных представлений'''
+    headers = response.setdefault('headers', {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    etag = headers.get('ETag')
+    if etag and etag.endswith('"'):
+        headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    response['body'] = base64.b64encode(payload).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_response(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Сжатие ответа по Accept-Encoding; короче COMPRESSION_MIN_BYTES, бинарные и уже сжатые не трогаются'''
+    body = response.get('body') or ''
+    headers = response.get('headers') or {}
+    if (not RESPONSE_COMPRESSION_ENABLED or response.get('isBase64Encoded') or 'Content-Encoding' in headers
+            or len(body) < COMPRESSION_MIN_BYTES):
+        return response
+    encoding = accepted_encoding(request.headers)
+    if encoding is None:
+        response.setdefault('headers', {})['Vary'] = 'Accept-Encoding'
+        return response
+    with trace_phase('compress'):
+        payload = compress_body(body.encode('utf-8'), encoding)
+    return encoded_response(response, payload, encoding)
+
+def options_response() -> Dict[str, Any]:
+    '''Ответ на CORS preflight; список методов берётся из зарегистрированных маршрутов'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': ', '.join(list(ROUTES) + ['OPTIONS']),
+            'Access-Control-Allow-Headers': CORS_ALLOW_HEADERS,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def normalize_phone(value: str) -> str:
+    '''Цифры телефона в том же виде, что и student_phone_digits (8XXXXXXXXXX и 9XXXXXXXXX -> 7XXXXXXXXXX)'''
+    digits = re.sub(r'\D', '', value)
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits
+
+class Request:
+    '''Запрос шлюза; соединение с БД берётся из пула только при первом обращении'''
+    __slots__ = ('event', 'method', 'query', 'headers', 'entity', 'conn', 'cur', 'read_conn', 'read_cur')
+
+    def __init__(self, event: Dict[str, Any]):
+        self.event = event
+        self.method = event.get('httpMethod', 'GET')
+        self.query = event.get('queryStringParameters') or {}
+        self.headers = event.get('headers') or {}
+        self.entity = self.query.get('entity', '')
+        self.conn = None
+        self.cur = None
+        self.read_conn = None
+        self.read_cur = None
+
+    def header(self, name: str) -> str:
+        return self.headers.get(name, self.headers.get(name.lower(), ''))
+
+    def json(self) -> Any:
+        return json.loads(self.event.get('body') or '{}')
+
+    def db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор запроса'''
+        if self.conn is None:
+            self.conn = get_db_connection()
+            self.cur = self.conn.cursor(cursor_factory=cursor_factory)
+        return self.conn, self.cur
+
+    def read_db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор только для чтения: реплика, если она есть и не отстаёт, иначе основная БД'''
+        if self.read_conn is None and self.conn is None:
+            self.read_conn = get_read_connection(self.header('X-Read-After-LSN'))
+            if self.read_conn is not None:
+                self.read_cur = self.read_conn.cursor(cursor_factory=cursor_factory)
+        if self.read_conn is not None:
+            return self.read_conn, self.read_cur
+        return self.db(cursor_factory)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            release_db_connection(self.conn, self.cur)
+            self.conn = None
+        if self.read_conn is not None:
+            release_db_connection(self.read_conn, self.read_cur)
+            self.read_conn = None
+
+def route(method: str, entity: Optional[str] = None, when: Optional[Callable[[Request], bool]] = None) -> Callable:
+    '''Регистрация обработчика метода; entity и when сужают маршрут, маршрут без условий - запасной'''
+    def register(func: Callable) -> Callable:
+        ROUTES.setdefault(method, []).append((entity, when, func))
+        return func
+    return register
+
+def find_route(request: Request) -> Optional[Callable]:
+    fallback = None
+    for entity, when, func in ROUTES.get(request.method, ()):
+        if entity is None and when is None:
+            fallback = fallback or func
+        elif (entity is None or entity == request.entity) and (when is None or when(request)):
+            return func
+    return fallback
+
+def serve(event: Dict[str, Any], guard: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+    '''Общий цикл запроса: preflight, 405, проверка доступа, обработчик, 500 и возврат соединения в пул'''
+    request = Request(event)
+    if request.method == 'OPTIONS':
+        return options_response()
+    
+    func = find_route(request)
+    if func is None:
+        return error_response(405, 'Method not allowed')
+    if guard is not None and not guard(request.headers):
+        return error_response(401, 'Unauthorized')
+    
+    try:
+        result = func(request)
+        if DATABASE_READ_URLS and request.method != 'GET' and request.conn is not None and result['statusCode'] < 300:
+            result = read_after_write(request, result)
+        return encode_response(request, result)
+    except Exception as e:
+        return error_response(500, str(e))
+    finally:
+        request.close()
 
 def check_auth(headers: Dict[str, Any]) -> bool:
-    '''Проверка токена аутентификации'''
+    '''Проверка подписанного токена auth (v1.<id>.<истекает>.<подпись>) без обращения к БД'''
     auth_token = headers.get('X-Auth-Token', headers.get('x-auth-token', ''))
-    return auth_token.startswith('admin_')
+    payload, _, signature = auth_token.rpartition('.')
+    parts = payload.split('.')
+    # Только ASCII: isdigit() пропускает '²' и арабские цифры, а compare_digest не сравнивает не-ASCII строки
+    if len(parts) != 3 or parts[0] != 'v1' or not signature.isascii():
+        return False
+    if not all(part.isascii() and part.isdecimal() for part in parts[1:]):
+        return False
+    if int(parts[2]) <= time.time():
+        return False
+    # Проверяются все ключи AUTH_TOKEN_SECRET, чтобы ротация не разлогинивала администраторов
+    for key in AUTH_TOKEN_KEYS:
+        expected = hmac.new(key, payload.encode('ascii'), hashlib.sha256).digest()
+        if hmac.compare_digest(base64.urlsafe_b64encode(expected).decode('ascii').rstrip('='), signature):
+            return True
+    return False
+
+DATE_TYPE_OIDS = (1082, 1083, 1114, 1184, 1266)
+NUMERIC_TYPE_OID = 1700
+
+def _cast_text(value: Optional[str], cur) -> Optional[str]:
+    return value
+
+def _cast_timestamp(value: Optional[str], cur) -> Optional[str]:
+    return value.replace(' ', 'T', 1) if value is not None else None
+
+def _cast_timestamptz(value: Optional[str], cur) -> Optional[str]:
+    if value is None:
+        return None
+    value = value.replace(' ', 'T', 1)
+    if value[-3] in '+-':
+        value += ':00'
+    return value
+
+def _cast_numeric(value: Optional[str], cur) -> Optional[float]:
+    return float(value) if value is not None else None
+
+def json_ready_cursor_class() -> type:
+    '''Курсор, у которого даты и numeric сразу приходят в JSON-совместимом виде'''
+    cls = _cursor_classes.get('json_ready')
+    if cls is not None:
+        return cls
+    
+    typecasters = [
+        psycopg2.extensions.new_type((1082, 1083, 1266), 'JSON_DATE', _cast_text),
+        psycopg2.extensions.new_type((1114,), 'JSON_TIMESTAMP', _cast_timestamp),
+        psycopg2.extensions.new_type((1184,), 'JSON_TIMESTAMPTZ', _cast_timestamptz),
+        psycopg2.extensions.new_type((NUMERIC_TYPE_OID,), 'JSON_NUMERIC', _cast_numeric)
+    ]
+    
+    class JsonReadyCursor(traced_cursor_class()):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            for caster in typecasters:
+                psycopg2.extensions.register_type(caster, self)
+    
+    _cursor_classes['json_ready'] = JsonReadyCursor
+    return JsonReadyCursor
+
+def cursor_factory() -> Optional[type]:
+    '''Курсор для чтения сущностей: JSON-готовые типы, если они включены'''
+    return json_ready_cursor_class() if DB_JSON_TYPECASTERS_ENABLED else None
+
+_row_converters: Dict[Tuple, Callable[[tuple], Dict]] = {}
+
+def build_row_converter(description, json_ready: bool = False) -> Callable[[tuple], Dict]:
+    '''План преобразования строк в словари: конвертеры выбираются один раз по OID типов колонок'''
+    key = (json_ready,) + tuple((col[0], col[1]) for col in description)
+    convert = _row_converters.get(key)
+    if convert:
+        return convert
+    
+    columns = tuple(col[0] for col in description)
+    converters = []
+    if not json_ready:
+        for i, col in enumerate(description):
+            if col[1] in DATE_TYPE_OIDS:
+                converters.append((i, operator.methodcaller('isoformat')))
+            elif col[1] == NUMERIC_TYPE_OID:
+                converters.append((i, float))
+    
+    if not converters:
+        def convert(row: tuple) -> Dict:
+            return dict(zip(columns, row))
+    else:
+        def convert(row: tuple) -> Dict:
+            values = list(row)
+            for i, cast in converters:
+                if values[i] is not None:
+                    values[i] = cast(values[i])
+            return dict(zip(columns, values))
+    
+    _row_converters[key] = convert
+    return convert
+
+def fetch_dicts(cur) -> List[Dict]:
+    '''Чтение всех строк курсора в виде JSON-совместимых словарей'''
+    convert = build_row_converter(cur.description, isinstance(cur, json_ready_cursor_class()))
+    return [convert(row) for row in cur.fetchall()]
+
+class Entity:
+    '''Сущность админки: таблица, колонки и заранее собранные SQL-запросы'''
+    __slots__ = ('name', 'table', 'qualified', 'columns', 'writable', 'creatable', 'public',
+                 'order_by', 'list_sql', 'by_id_sql', 'changes_sql', 'snapshot_sql')
+
+    def __init__(self, name: str, table: str, columns: Tuple[str, ...], writable: Tuple[str, ...],
+                 order_by: str = 'id', creatable: bool = True, public_where: Optional[str] = None):
+        self.name = name
+        self.table = table
+        self.qualified = f'{SCHEMA}.{table}'
+        self.columns = columns
+        self.writable = writable
+        self.creatable = creatable
+        self.public = public_where is not None
+        self.order_by = order_by
+        self.list_sql = f'SELECT * FROM {self.qualified} ORDER BY {order_by}'
+        self.by_id_sql = f'SELECT * FROM {self.qualified} WHERE id = %s'
+        self.changes_sql = (
+            f'SELECT * FROM {self.qualified} WHERE id IN ('
+            f'SELECT row_id FROM {SCHEMA}.row_versions WHERE entity = %s AND change_xid >= %s::xid8 AND NOT deleted'
+            f') ORDER BY {order_by}'
+        )
+        self.snapshot_sql = None
+        if self.public:
+            self.snapshot_sql = (
+                f"SELECT '[' || COALESCE(string_agg(row_to_json(t)::text, ',' ORDER BY t.id), '') || ']' FROM {self.qualified} t {public_where}"
+            )
+
+ENTITIES = {entity.name: entity for entity in (
+    Entity('teachers', 'teachers',
+           ('id', 'name', 'photo_url', 'description', 'specialization', 'experience', 'sort_order', 'created_at', 'updated_at'),
+           ('name', 'photo_url', 'description', 'specialization', 'experience', 'sort_order'),
+           public_where='WHERE name IS NOT NULL'),
+    Entity('schedule', 'schedule',
+           ('id', 'time', 'title', 'description', 'teacher_id', 'sort_order', 'capacity', 'slot_start', 'slot_end', 'created_at', 'updated_at'),
+           ('time', 'title', 'description', 'teacher_id', 'sort_order', 'capacity'),
+           public_where=''),
+    Entity('calendar', 'calendar_events',
+           ('id', 'date', 'title', 'description', 'event_type', 'sort_order', 'recurrence_rule', 'recurrence_end', 'created_at', 'updated_at'),
+           ('date', 'title', 'description', 'event_type', 'sort_order', 'recurrence_rule')),
+    Entity('contacts', 'contacts',
+           ('id', 'type', 'value', 'icon', 'label', 'sort_order', 'created_at', 'updated_at'),
+           ('type', 'value', 'icon', 'label', 'sort_order'),
+           public_where=''),
+    Entity('reviews', 'reviews',
+           ('id', 'author_name', 'author_photo', 'rating', 'review_text', 'date', 'is_published', 'sort_order', 'created_at', 'updated_at'),
+           ('author_name', 'author_photo', 'rating', 'review_text', 'date', 'is_published', 'sort_order'),
+           public_where='WHERE is_published'),
+    Entity('results', 'results',
+           ('id', 'title', 'description', 'image_url', 'metric_value', 'metric_label', 'sort_order', 'created_at', 'updated_at'),
+           ('title', 'description', 'image_url', 'metric_value', 'metric_label', 'sort_order')),
+    Entity('bookings', 'student_bookings',
+           ('id', 'student_name', 'student_phone', 'student_email', 'selected_teacher', 'selected_subject', 'selected_time', 'status', 'created_at', 'updated_at',
+            'student_phone_digits'),
+           ('student_name', 'student_phone', 'student_email', 'selected_teacher', 'selected_subject', 'selected_time', 'status'),
+           order_by='created_at DESC, id DESC'),
+    Entity('notifications', 'notification_settings',
+           ('id', 'notification_type', 'is_enabled', 'value', 'created_at', 'updated_at'),
+           ('notification_type', 'is_enabled', 'value'),
+           order_by='notification_type', creatable=False)
+)}
+
+PUBLIC_ENTITIES = tuple(name for name, entity in ENTITIES.items() if entity.public)
+
+BULK_MAX_ROWS = int(os.environ.get('BULK_MAX_ROWS', '1000'))
 
-def get_db_connection():
-    '''Создание подключения к базе данных'''
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
-    conn.autocommit = False
-    return conn
+BOOKING_PAGE_PARAMS = ('limit', 'cursor', 'status', 'date_from', 'date_to', 'subject', 'teacher', 'total')
+BOOKING_PAGE_DEFAULT_LIMIT = 50
+BOOKING_PAGE_MAX_LIMIT = 500
+SEARCH_MIN_LENGTH = 2
+SEARCH_VECTORS = {
+    'bookings': ('simple', "to_tsvector('simple', coalesce(student_name, '') || ' ' || coalesce(student_email, '') || ' ' || translate(coalesce(student_email, ''), '@.', '  '))"),
+    'reviews': ('russian', "to_tsvector('russian', coalesce(author_name, '') || ' ' || coalesce(review_text, ''))")
+}
+SNAPSHOT_GZIP_LEVEL = 9
+SNAPSHOT_BROTLI_QUALITY = 11
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '2000'))
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8'
+}
+STATS_BUCKETS = ('day', 'week', 'month')
+STATS_DIMENSIONS = ('subject', 'teacher', 'status')
+STATS_DEFAULT_DAYS = 30
+STATS_MAX_DAYS = 1100
+FUNNEL_STAGES = ('new', 'confirmed', 'completed')
+FUNNEL_STATUS_STAGE = {'new': 0, 'in_progress': 1, 'confirmed': 1, 'completed': 2}
+BOOKING_PARTITIONS_AHEAD = int(os.environ.get('BOOKING_PARTITIONS_AHEAD', '3'))
+BOOKING_RETENTION_MONTHS = int(os.environ.get('BOOKING_RETENTION_MONTHS', '36'))
+BOOKING_ARCHIVE_RETENTION_MONTHS = int(os.environ.get('BOOKING_ARCHIVE_RETENTION_MONTHS', '120'))
 
+@instrument
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     API для управления данными администратором
@@ -27,251 +807,881 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     - /reviews - отзывы
     - /results - результаты
     - /bookings - заявки учеников
+    GET ?entity=bookings&limit=&cursor= - постраничный список заявок (keyset по created_at, id); первая страница отдаёт водяной знак since
+      фильтры: status=new,confirmed, date_from=, date_to=, subject=, teacher=; total=estimate|exact
+    GET ?fields=id,name - выбор колонок для любой сущности
+    GET ?entity=bookings&format=csv|ndjson - выгрузка заявок (gzip) с теми же фильтрами
+    GET ?entity=bookings|reviews&search= - ранжированный поиск (имя, телефон, email / автор, текст), cursor= для следующей страницы
+    GET ?entity=...&since=0 - все строки и водяной знак since; since=<знак> - только изменённые строки и id удалённых
+    GET ?entity=stats&date_from=&date_to=&bucket=day|week|month&group=subject|teacher|status - ряды заявок,
+      итоги по предметам, преподавателям, статусам и воронка new→confirmed→completed из сводок booking_stats
+    POST ?entity=snapshots - принудительная пересборка снимков публичного контента
+    POST ?entity=stats - пересчёт сводок заявок по таблице и архиву
+    POST ?entity=partitions - обслуживание месячных секций заявок (по расписанию): секции на BOOKING_PARTITIONS_AHEAD
+      месяцев вперёд, перенос месяцев старше BOOKING_RETENTION_MONTHS в архив, очистка архива старше BOOKING_ARCHIVE_RETENTION_MONTHS
+    Accept-Encoding: br, gzip - ответы длиннее COMPRESSION_MIN_BYTES сжимаются (base64, isBase64Encoded)
+    GET читают с реплик DATABASE_READ_URL; после записи ответ несёт X-Read-After-LSN, и GET с этим заголовком
+      уходит на реплику, только если она догнала запись (иначе - в основную БД)
+    POST/PUT с массивом в теле - пакетное создание/обновление в одной транзакции
+    PUT ?entity=teachers&action=reorder {"ids": [3, 1, 2]} - пакетная перестановка sort_order
     '''
-    method: str = event.get('httpMethod', 'GET')
-    path_params = event.get('pathParams', {})
-    query_params = event.get('queryStringParameters', {}) or {}
-    headers = event.get('headers', {})
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    return serve(event, guard=check_auth)
+
+def get_entity(name: str) -> Entity:
+    entity = ENTITIES.get(name)
+    if entity is None:
+        raise ValueError(f'Unknown entity: {name}')
+    return entity
+
+@route('GET', when=lambda request: bool(request.query.get('format')))
+def get_export(request: Request) -> Dict[str, Any]:
+    conn, _ = request.read_db()
+    return export_bookings(conn, request.entity, request.query['format'], request.query)
+
+@route('GET', when=lambda request: bool(request.query.get('search')))
+def get_search(request: Request) -> Dict[str, Any]:
+    _, cur = request.read_db(cursor_factory())
+    try:
+        result = search_entities(cur, request.entity, request.query)
+    except ValueError as e:
+        return error_response(400, str(e))
+    return json_response(200, result)
+
+@route('GET', when=lambda request: 'since' in request.query)
+def get_changes_since(request: Request) -> Dict[str, Any]:
+    _, cur = request.read_db(cursor_factory())
+    try:
+        result = get_changes(cur, request.entity, request.query['since'])
+    except ValueError as e:
+        return error_response(400, str(e))
+    return json_response(200, result)
+
+@route('GET', 'stats')
+def get_stats(request: Request) -> Dict[str, Any]:
+    _, cur = request.read_db()
+    return json_response(200, get_booking_stats(cur, request.query))
+
+@route('GET', 'bookings', when=lambda request: not request.query.get('id') and any(param in request.query for param in BOOKING_PAGE_PARAMS))
+def get_bookings_page(request: Request) -> Dict[str, Any]:
+    _, cur = request.read_db(cursor_factory())
+    try:
+        result = list_bookings(cur, request.query)
+    except ValueError as e:
+        # Некорректные limit, cursor, даты или fields - ошибка клиента, а не сервера
+        return error_response(400, str(e))
+    return json_response(200, result)
+
+@route('GET')
+def get_admin_entities(request: Request) -> Dict[str, Any]:
+    _, cur = request.read_db(cursor_factory())
+    entity_id = request.query.get('id', '')
+    if entity_id:
+        result = get_entity_by_id(cur, request.entity, entity_id)
+    else:
+        result = get_entities(cur, request.entity, request.query.get('fields'))
+    return json_response(200, result)
+
+@route('POST', 'snapshots')
+def post_snapshots(request: Request) -> Dict[str, Any]:
+    conn, cur = request.db()
+    return json_response(201, rebuild_snapshots(cur, conn, request.json().get('entities')))
+
+@route('POST', 'stats')
+def post_stats(request: Request) -> Dict[str, Any]:
+    conn, cur = request.db()
+    return json_response(201, rebuild_booking_stats(cur, conn))
+
+@route('POST', 'partitions')
+def post_partitions(request: Request) -> Dict[str, Any]:
+    conn, cur = request.db()
+    return json_response(201, maintain_booking_partitions(cur, conn))
+
+@route('POST')
+def post_entities(request: Request) -> Dict[str, Any]:
+    body_data = request.json()
+    conn, cur = request.db(cursor_factory())
+    if isinstance(body_data, list):
+        result = bulk_create_entities(cur, conn, request.entity, body_data)
+    else:
+        result = create_entity(cur, conn, request.entity, body_data)
+    return json_response(201, result)
+
+@route('PUT', when=lambda request: request.query.get('action') == 'reorder')
+def put_reorder(request: Request) -> Dict[str, Any]:
+    conn, cur = request.db()
+    return json_response(200, reorder_entities(cur, conn, request.entity, request.json().get('ids', [])))
+
+@route('PUT')
+def put_entities(request: Request) -> Dict[str, Any]:
+    body_data = request.json()
+    conn, cur = request.db(cursor_factory())
+    if isinstance(body_data, list):
+        result = bulk_update_entities(cur, conn, request.entity, body_data)
+    else:
+        result = update_entity(cur, conn, request.entity, request.query.get('id', ''), body_data)
+    return json_response(200, result)
+
+def parse_fields(entity: str, fields: Optional[str], required: Tuple[str, ...] = ()) -> str:
+    '''Список колонок для SELECT по параметру fields='''
+    if not fields:
+        return '*'
+    allowed = ENTITIES[entity].columns
+    columns = []
+    for name in list(required) + fields.split(','):
+        name = name.strip()
+        if not name or name in columns:
+            continue
+        if name not in allowed:
+            raise ValueError(f'Unknown field: {name}')
+        columns.append(name)
+    return ', '.join(columns)
+
+def encode_cursor(sort_key: Any, row_id: int) -> str:
+    '''Непрозрачный курсор страницы из ключа последней строки'''
+    raw = json.dumps([sort_key, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def parse_page_limit(query_params: Dict[str, Any]) -> int:
+    '''Размер страницы: целое от 1 до BOOKING_PAGE_MAX_LIMIT, по умолчанию BOOKING_PAGE_DEFAULT_LIMIT'''
+    value = query_params.get('limit')
+    if not value:
+        return BOOKING_PAGE_DEFAULT_LIMIT
+    if not (value.isascii() and value.isdecimal()) or not 1 <= int(value) <= BOOKING_PAGE_MAX_LIMIT:
+        raise ValueError(f'limit must be an integer from 1 to {BOOKING_PAGE_MAX_LIMIT}')
+    return int(value)
+
+def cursor_timestamp(value: Any) -> str:
+    '''Ключ курсора заявок: проверяется здесь, чтобы подделанный курсор не доходил до ::timestamp в SQL'''
+    return datetime.datetime.fromisoformat(value).isoformat()
+
+def parse_query_date(query_params: Dict[str, Any], name: str) -> str:
+    try:
+        return datetime.date.fromisoformat(query_params[name]).isoformat()
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid {name}')
+
+def decode_cursor(cursor: str, key_type: Callable[[Any], Any] = str) -> Tuple[Any, int]:
+    '''Разбор курсора страницы'''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_key, row_id = json.loads(raw)
+        if not isinstance(row_id, int):
+            raise TypeError(row_id)
+        return key_type(sort_key), row_id
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def build_booking_filters(query_params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    '''Условия WHERE для заявок: статус, период создания, предмет, преподаватель'''
+    conditions = []
+    params = []
     
-    if not check_auth(headers):
-        return {
-            'statusCode': 401,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'Unauthorized'}),
-            'isBase64Encoded': False
-        }
+    status = query_params.get('status')
+    if status:
+        conditions.append('status = ANY(%s)')
+        params.append([value.strip() for value in status.split(',') if value.strip()])
+    if query_params.get('date_from'):
+        conditions.append('created_at >= %s::date')
+        params.append(parse_query_date(query_params, 'date_from'))
+    if query_params.get('date_to'):
+        conditions.append("created_at < %s::date + INTERVAL '1 day'")
+        params.append(parse_query_date(query_params, 'date_to'))
+    if query_params.get('subject'):
+        conditions.append('selected_subject = %s')
+        params.append(query_params['subject'])
+    if query_params.get('teacher'):
+        conditions.append('selected_teacher = %s')
+        params.append(query_params['teacher'])
     
-    conn = None
-    cur = None
+    return conditions, params
+
+def count_bookings(cur, conditions: List[str], params: List[Any], exact: bool) -> int:
+    '''Количество заявок под фильтром: точное или оценка планировщика'''
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    query = f"SELECT 1 FROM t_p90313977_education_center_web.student_bookings {where}"
+    if exact:
+        cur.execute(f"SELECT COUNT(*) FROM ({query}) q", params)
+        return cur.fetchone()[0]
+    cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def list_bookings(cur, query_params: Dict[str, Any]) -> Dict:
+    '''Постраничный список заявок с keyset-пагинацией по (created_at, id)'''
+    limit = parse_page_limit(query_params)
+    columns = parse_fields('bookings', query_params.get('fields'), ('id', 'created_at'))
+    conditions, params = build_booking_filters(query_params)
+    
+    result = {}
+    if query_params.get('total') in ('estimate', 'exact'):
+        result['total'] = count_bookings(cur, conditions, params, query_params['total'] == 'exact')
+    
+    if not query_params.get('cursor'):
+        # Водяной знак для дельт since= берётся до чтения первой страницы: изменения между ними придут в дельте повторно
+        cur.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text')
+        result['since'] = cur.fetchone()[0]
+    else:
+        created_at, row_id = decode_cursor(query_params['cursor'], cursor_timestamp)
+        # Отдельное условие по created_at отсекает секции новее курсора
+        conditions.append('created_at <= %s::timestamp AND (created_at, id) < (%s::timestamp, %s)')
+        params.extend([created_at, created_at, row_id])
+    
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    query = f"""
+        SELECT {columns} FROM t_p90313977_education_center_web.student_bookings
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """
+    cur.execute(query, params + [limit + 1])
+    items = fetch_dicts(cur)
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]['created_at'], items[-1]['id'])
+    
+    result['items'] = items
+    result['next_cursor'] = next_cursor
+    return result
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def trigram_available(cur) -> bool:
+    '''Установлено ли pg_trgm (см. V0012); проверяется один раз на контейнер'''
+    global _trigram_available
+    if _trigram_available is None:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        _trigram_available = bool(cur.fetchone()[0])
+    return _trigram_available
+
+def build_search_match(cur, entity: str, term: str) -> Tuple[str, List[Any], str, List[Any]]:
+    '''Условие совпадения и выражение ранга для поисковой строки: цифры ищутся по телефону, слова - по префиксам'''
+    if entity == 'bookings' and re.fullmatch(r'[\d\s()+-]+', term):
+        digits = re.sub(r'\D', '', term)
+        if len(digits) >= 3:
+            prefix = normalize_phone(term)
+            if prefix[0] == '8':
+                prefix = '7' + prefix[1:]
+            match = '(student_phone_digits LIKE %s OR reverse(student_phone_digits) LIKE %s)'
+            return match, [prefix + '%', digits[::-1] + '%'], 'CASE WHEN student_phone_digits = %s THEN 1 ELSE 0.5 END', [prefix]
+    
+    if entity == 'bookings' and '@' in term:
+        email = term.lower()
+        return 'lower(student_email) LIKE %s', [escape_like(email) + '%'], 'CASE WHEN lower(student_email) = %s THEN 1 ELSE 0.5 END', [email]
+    
+    words = re.findall(r'\w+', term.lower())
+    if not words:
+        raise ValueError('Search term has no words')
+    config, vector = SEARCH_VECTORS[entity]
+    tsquery = ' & '.join(f"'{word}':*" for word in words)
+    match = f'{vector} @@ to_tsquery(%s, %s)'
+    rank = f'ts_rank({vector}, to_tsquery(%s, %s))'
+    match_params = [config, tsquery]
+    rank_params = [config, tsquery]
+    if entity == 'bookings':
+        rank += ' + CASE WHEN lower(student_name) = %s THEN 1 ELSE 0 END'
+        rank_params.append(term.lower())
     
+    if entity == 'bookings' and trigram_available(cur):
+        match = f'({match} OR %s <%% student_name OR student_email ILIKE %s)'
+        rank = f'GREATEST({rank}, word_similarity(%s, student_name))'
+        match_params += [term, '%' + escape_like(term) + '%']
+        rank_params.append(term)
+    return match, match_params, rank, rank_params
+
+def search_entities(cur, entity: str, query_params: Dict[str, Any]) -> Dict:
+    '''Ранжированный поиск по заявкам или отзывам с keyset-пагинацией по (рангу, id)'''
+    if entity not in SEARCH_VECTORS:
+        raise ValueError(f'Search is not supported for entity: {entity}')
+    term = query_params.get('search', '').strip()
+    if len(term) < SEARCH_MIN_LENGTH:
+        raise ValueError(f'Search term must be at least {SEARCH_MIN_LENGTH} characters')
+    
+    limit = parse_page_limit(query_params)
+    columns = parse_fields(entity, query_params.get('fields'), ('id',))
+    match, match_params, rank, rank_params = build_search_match(cur, entity, term)
+    
+    conditions, params = build_booking_filters(query_params) if entity == 'bookings' else ([], [])
+    conditions.insert(0, match)
+    params = match_params + params
+    
+    result = {}
+    if entity == 'bookings' and query_params.get('total') in ('estimate', 'exact'):
+        result['total'] = count_bookings(cur, conditions, params, query_params['total'] == 'exact')
+    
+    page = ''
+    page_params = []
+    if query_params.get('cursor'):
+        page = 'WHERE (search_rank, id) < (%s, %s)'
+        page_params = list(decode_cursor(query_params['cursor'], float))
+    
+    cur.execute(
+        f"""
+        SELECT * FROM (
+            SELECT {columns}, ({rank})::float8 AS search_rank
+            FROM {ENTITIES[entity].qualified}
+            WHERE {' AND '.join(conditions)}
+        ) found
+        {page}
+        ORDER BY search_rank DESC, id DESC
+        LIMIT %s
+        """,
+        rank_params + params + page_params + [limit + 1]
+    )
+    items = fetch_dicts(cur)
+    
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]['search_rank'], items[-1]['id'])
+    for item in items:
+        del item['search_rank']
+    
+    result['items'] = items
+    result['next_cursor'] = next_cursor
+    return result
+
+def export_bookings(conn, entity: str, export_format: str, query_params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Выгрузка заявок в CSV/NDJSON: строки читаются серверным курсором пачками и сразу сжимаются'''
+    if entity != 'bookings':
+        raise ValueError(f'Export is not supported for entity: {entity}')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+    
+    columns = parse_fields('bookings', query_params.get('fields'))
+    conditions, params = build_booking_filters(query_params)
+    where = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+    
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    chunks = []
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    rows_count = 0
+    
+    cur = conn.cursor(name='bookings_export', cursor_factory=cursor_factory())
     try:
-        entity = query_params.get('entity', '')
-        entity_id = query_params.get('id', '')
-        
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        if method == 'GET':
-            if entity_id:
-                result = get_entity_by_id(cur, entity, entity_id)
-            else:
-                result = get_entities(cur, entity)
+        cur.execute(
+            f"SELECT {columns} FROM t_p90313977_education_center_web.student_bookings {where} ORDER BY created_at DESC, id DESC",
+            params
+        )
+        convert = None
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if convert is None:
+                convert = build_row_converter(cur.description, isinstance(cur, json_ready_cursor_class()))
+                if export_format == 'csv':
+                    buffer.write('\ufeff')
+                    writer.writerow([col[0] for col in cur.description])
+            if not rows:
+                break
             
-            cur.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps(result),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            result = create_entity(cur, conn, entity, body_data)
+            for row in rows:
+                if export_format == 'csv':
+                    writer.writerow(convert(row).values())
+                else:
+                    buffer.write(dumps_json(convert(row)))
+                    buffer.write('\n')
+            rows_count += len(rows)
             
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps(result),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            result = update_entity(cur, conn, entity, entity_id, body_data)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps(result),
-                'isBase64Encoded': False
-            }
-        
+            chunks.append(compressor.compress(buffer.getvalue().encode('utf-8')))
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        cur.close()
+    
+    chunks.append(compressor.compress(buffer.getvalue().encode('utf-8')))
+    chunks.append(compressor.flush())
+    
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Expose-Headers': 'Content-Disposition, X-Rows-Count',
+            'Content-Type': EXPORT_FORMATS[export_format],
+            'Content-Encoding': 'gzip',
+            'Content-Disposition': f'attachment; filename="bookings.{export_format}"',
+            'X-Rows-Count': str(rows_count)
+        },
+        'body': base64.b64encode(b''.join(chunks)).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def parse_stats_period(query_params: Dict[str, Any]) -> Tuple[datetime.date, datetime.date]:
+    '''Период сводки: date_from и date_to включительно, по умолчанию последние STATS_DEFAULT_DAYS дней'''
+    try:
+        date_to = datetime.date.fromisoformat(query_params['date_to']) if query_params.get('date_to') else datetime.date.today()
+        date_from = datetime.date.fromisoformat(query_params['date_from']) if query_params.get('date_from') else date_to - datetime.timedelta(days=STATS_DEFAULT_DAYS - 1)
+    except ValueError:
+        raise ValueError('Invalid date')
+    if date_from > date_to:
+        raise ValueError('date_from is after date_to')
+    if (date_to - date_from).days >= STATS_MAX_DAYS:
+        raise ValueError(f'Period is longer than {STATS_MAX_DAYS} days')
+    return date_from, date_to
+
+def stats_periods(date_from: datetime.date, date_to: datetime.date, bucket: str) -> List[datetime.date]:
+    '''Начала всех интервалов периода, как их считает date_trunc'''
+    if bucket == 'week':
+        current = date_from - datetime.timedelta(days=date_from.weekday())
+    elif bucket == 'month':
+        current = date_from.replace(day=1)
+    else:
+        current = date_from
+    periods = []
+    while current <= date_to:
+        periods.append(current)
+        if bucket == 'month':
+            current = (current + datetime.timedelta(days=32)).replace(day=1)
         else:
-            return {
-                'statusCode': 405,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            current += datetime.timedelta(days=7 if bucket == 'week' else 1)
+    return periods
+
+def build_funnel(statuses: Dict[str, int]) -> Dict:
+    '''Воронка по текущим статусам: заявка, дошедшая до этапа, учитывается и во всех предыдущих'''
+    reached = [0] * len(FUNNEL_STAGES)
+    for status, count in statuses.items():
+        # Отменённые и неизвестные статусы учитываются только на первом этапе
+        for index in range(FUNNEL_STATUS_STAGE.get(status, 0) + 1):
+            reached[index] += count
     
-    except Exception as e:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    created = reached[0]
+    stages = []
+    for index, name in enumerate(FUNNEL_STAGES):
+        previous = reached[index - 1] if index else created
+        stages.append({
+            'stage': name,
+            'bookings': reached[index],
+            'conversion': round(reached[index] / previous, 4) if previous else 0.0,
+            'share': round(reached[index] / created, 4) if created else 0.0
+        })
+    return {'stages': stages, 'cancelled': statuses.get('cancelled', 0)}
 
-def get_entities(cur, entity: str) -> List[Dict]:
-    '''Получение списка всех сущностей'''
-    table_map = {
-        'teachers': 'teachers',
-        'schedule': 'schedule',
-        'calendar': 'calendar_events',
-        'contacts': 'contacts',
-        'reviews': 'reviews',
-        'results': 'results',
-        'bookings': 'student_bookings',
-        'notifications': 'notification_settings'
+def stats_ranges(date_from: datetime.date, date_to: datetime.date) -> List[datetime.date]:
+    '''Границы полуинтервалов периода: дни до первого целого месяца, целые месяцы, дни после последнего'''
+    end = date_to + datetime.timedelta(days=1)
+    first = date_from if date_from.day == 1 else (date_from.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+    last = end.replace(day=1)
+    if first >= last:
+        return [date_from, end, end, end, end, end]
+    return [date_from, first, first, last, last, end]
+
+def get_booking_stats(cur, query_params: Dict[str, Any]) -> Dict:
+    '''Дашборд заявок из сводок booking_stats: ряд по интервалам, итоги по измерениям и воронка'''
+    date_from, date_to = parse_stats_period(query_params)
+    bucket = query_params.get('bucket') or 'day'
+    if bucket not in STATS_BUCKETS:
+        raise ValueError(f'Unknown bucket: {bucket}')
+    group = query_params.get('group') or 'total'
+    if group != 'total' and group not in STATS_DIMENSIONS:
+        raise ValueError(f'Unknown group: {group}')
+    
+    # Целые месяцы периода берутся из месячных строк, края - из дневных
+    head_from, head_to, months_from, months_to, tail_from, tail_to = stats_ranges(date_from, date_to)
+    source = f"""
+        SELECT dimension, key, period, bookings FROM {SCHEMA}.booking_stats
+        WHERE grain = 'month' AND period >= %s AND period < %s
+        UNION ALL
+        SELECT dimension, key, period, bookings FROM {SCHEMA}.booking_stats
+        WHERE grain = 'day' AND period >= %s AND period < %s
+        UNION ALL
+        SELECT dimension, key, period, bookings FROM {SCHEMA}.booking_stats
+        WHERE grain = 'day' AND period >= %s AND period < %s
+    """
+    source_params = [months_from, months_to, head_from, head_to, tail_from, tail_to]
+    if bucket == 'month':
+        series_source, series_params = source, source_params
+    else:
+        series_source = f"SELECT dimension, key, period, bookings FROM {SCHEMA}.booking_stats WHERE grain = 'day' AND period BETWEEN %s AND %s"
+        series_params = [date_from, date_to]
+    
+    execute_prepared(
+        cur,
+        ('stats', 'rollup', bucket == 'month'),
+        f"""
+        SELECT dimension, key, NULL, SUM(bookings)::int
+        FROM ({source}) totals
+        GROUP BY dimension, key
+        HAVING SUM(bookings) <> 0
+        UNION ALL
+        SELECT dimension, key, date_trunc(%s, period::timestamp)::date::text, SUM(bookings)::int
+        FROM ({series_source}) series
+        WHERE dimension = %s
+        GROUP BY dimension, key, 3
+        HAVING SUM(bookings) <> 0
+        ORDER BY 3 NULLS FIRST, 4 DESC, 2
+        """,
+        source_params + [bucket] + series_params + [group]
+    )
+    
+    totals: Dict[str, List[Dict]] = {dimension: [] for dimension in STATS_DIMENSIONS}
+    counts: Dict[Tuple[str, str], int] = {}
+    bookings = 0
+    for dimension, key, period, count in cur.fetchall():
+        if period is not None:
+            counts[(period, key)] = count
+        elif dimension == 'total':
+            bookings = count
+        else:
+            totals[dimension].append({'key': key, 'bookings': count})
+    
+    periods = [period.isoformat() for period in stats_periods(date_from, date_to, bucket)]
+    if group == 'total':
+        series = [{'period': period, 'bookings': counts.get((period, ''), 0)} for period in periods]
+    else:
+        series = [{'period': period, 'key': key, 'bookings': count} for (period, key), count in counts.items()]
+    
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'bucket': bucket,
+        'group': group,
+        'series': series,
+        'totals': {'bookings': bookings, **totals},
+        'funnel': build_funnel({item['key']: item['bookings'] for item in totals['status']})
     }
+
+def rebuild_booking_stats(cur, conn) -> Dict:
+    '''Пересчёт сводок заявок по таблице и архиву (после правок в обход триггеров, например TRUNCATE)'''
+    cur.execute(f"LOCK TABLE {SCHEMA}.student_bookings, {SCHEMA}.student_bookings_archive IN SHARE MODE")
+    # Месяцы, очищенные из архива по BOOKING_ARCHIVE_RETENTION_MONTHS, пересчитать не из чего - их сводки остаются как есть
+    cutoff = None
+    if BOOKING_ARCHIVE_RETENTION_MONTHS > 0:
+        cur.execute(
+            "SELECT (date_trunc('month', CURRENT_TIMESTAMP) - make_interval(months => %s))::date",
+            (BOOKING_ARCHIVE_RETENTION_MONTHS,)
+        )
+        cutoff = cur.fetchone()[0]
+    cur.execute(f"DELETE FROM {SCHEMA}.booking_stats WHERE %s::date IS NULL OR period >= %s::date", (cutoff, cutoff))
+    cur.execute(
+        f"""
+        INSERT INTO {SCHEMA}.booking_stats (grain, dimension, period, key, bookings)
+        SELECT k.grain, k.dimension, k.period, k.key, COUNT(*)
+        FROM (
+            SELECT created_at, selected_subject, selected_teacher, status FROM {SCHEMA}.student_bookings
+            UNION ALL
+            SELECT created_at, selected_subject, selected_teacher, status FROM {SCHEMA}.student_bookings_archive
+        ) b
+        CROSS JOIN LATERAL {SCHEMA}.booking_stats_keys(b.created_at, b.selected_subject, b.selected_teacher, b.status) k
+        WHERE %s::date IS NULL OR b.created_at >= %s::date
+        GROUP BY k.grain, k.dimension, k.period, k.key
+        """,
+        (cutoff, cutoff)
+    )
+    rows = cur.rowcount
+    conn.commit()
     
-    table = table_map.get(entity)
-    if not table:
-        raise ValueError(f'Unknown entity: {entity}')
+    return {'success': True, 'rows': rows}
+
+def maintain_booking_partitions(cur, conn) -> Dict:
+    '''Обслуживание месячных секций заявок: секции вперёд, архивирование старых месяцев, очистка архива (V0017)'''
+    cur.execute(
+        f"SELECT action, partition_table, row_count FROM {SCHEMA}.maintain_student_bookings(%s, %s, %s)",
+        (BOOKING_PARTITIONS_AHEAD, BOOKING_RETENTION_MONTHS, BOOKING_ARCHIVE_RETENTION_MONTHS)
+    )
+    actions = [{'action': action, 'partition': partition, 'rows': rows} for action, partition, rows in cur.fetchall()]
+    conn.commit()
     
-    if entity == 'bookings':
-        query = f"SELECT * FROM t_p90313977_education_center_web.{table} ORDER BY created_at DESC"
-    elif entity == 'notifications':
-        query = f"SELECT * FROM t_p90313977_education_center_web.{table} ORDER BY notification_type"
+    return {'success': True, 'actions': actions}
+
+def get_entities(cur, entity: str, fields: Optional[str] = None) -> List[Dict]:
+    '''Получение списка всех сущностей'''
+    info = get_entity(entity)
+    if fields:
+        columns = parse_fields(entity, fields)
+        execute_prepared(cur, (entity, 'list', columns), f"SELECT {columns} FROM {info.qualified} ORDER BY {info.order_by}")
     else:
-        query = f"SELECT * FROM t_p90313977_education_center_web.{table} ORDER BY id"
-    cur.execute(query)
-    columns = [desc[0] for desc in cur.description]
-    rows = cur.fetchall()
-    
-    result = []
-    for row in rows:
-        row_dict = {}
-        for i, col in enumerate(columns):
-            val = row[i]
-            if hasattr(val, 'isoformat'):
-                val = val.isoformat()
-            elif isinstance(val, Decimal):
-                val = float(val)
-            row_dict[col] = val
-        result.append(row_dict)
+        execute_prepared(cur, (entity, 'list'), info.list_sql)
+    return fetch_dicts(cur)
+
+def get_changes(cur, entity: str, since: str) -> Dict:
+    '''Дельта сущности после водяного знака since: изменённые строки, id удалённых и новый знак'''
+    info = get_entity(entity)
+    # Водяной знак - xid8: только ASCII-цифры в пределах 64 бит, иначе ошибка приведения в SQL
+    if not (since.isascii() and since.isdecimal()) or int(since) >= 2 ** 64:
+        raise ValueError('Invalid since')
     
-    return result
+    if since == '0':
+        cur.execute('SELECT pg_snapshot_xmin(pg_current_snapshot())::text')
+        watermark, deleted = cur.fetchone()[0], []
+        execute_prepared(cur, (entity, 'list'), info.list_sql)
+    else:
+        execute_prepared(
+            cur,
+            ('row_versions', 'deleted'),
+            f"""
+            SELECT pg_snapshot_xmin(pg_current_snapshot())::text,
+                   ARRAY(SELECT row_id FROM {SCHEMA}.row_versions
+                         WHERE entity = %s AND change_xid >= %s::xid8 AND deleted ORDER BY row_id)
+            """,
+            (entity, since)
+        )
+        watermark, deleted = cur.fetchone()
+        execute_prepared(cur, (entity, 'changes'), info.changes_sql, (entity, since))
+    
+    return {'items': fetch_dicts(cur), 'deleted': deleted, 'since': watermark}
 
 def get_entity_by_id(cur, entity: str, entity_id: str) -> Dict:
     '''Получение одной сущности по ID'''
-    table_map = {
-        'teachers': 'teachers',
-        'schedule': 'schedule',
-        'calendar': 'calendar_events',
-        'contacts': 'contacts',
-        'reviews': 'reviews',
-        'results': 'results',
-        'bookings': 'student_bookings',
-        'notifications': 'notification_settings'
-    }
-    
-    table = table_map.get(entity)
-    if not table:
-        raise ValueError(f'Unknown entity: {entity}')
-    
-    query = f"SELECT * FROM t_p90313977_education_center_web.{table} WHERE id = %s"
-    cur.execute(query, (entity_id,))
-    columns = [desc[0] for desc in cur.description]
+    execute_prepared(cur, (entity, 'get'), get_entity(entity).by_id_sql, (entity_id,))
     row = cur.fetchone()
     
     if row:
-        row_dict = {}
-        for i, col in enumerate(columns):
-            val = row[i]
-            if hasattr(val, 'isoformat'):
-                val = val.isoformat()
-            elif isinstance(val, Decimal):
-                val = float(val)
-            row_dict[col] = val
-        return row_dict
+        return build_row_converter(cur.description, isinstance(cur, json_ready_cursor_class()))(row)
     return {}
 
 def create_entity(cur, conn, entity: str, data: Dict) -> Dict:
     '''Создание новой сущности'''
-    table_map = {
-        'teachers': ('teachers', ['name', 'photo_url', 'description', 'specialization', 'experience', 'sort_order']),
-        'schedule': ('schedule', ['time', 'title', 'description', 'teacher_id', 'sort_order']),
-        'calendar': ('calendar_events', ['date', 'title', 'description', 'event_type', 'sort_order']),
-        'contacts': ('contacts', ['type', 'value', 'icon', 'label', 'sort_order']),
-        'reviews': ('reviews', ['author_name', 'author_photo', 'rating', 'review_text', 'date', 'is_published', 'sort_order']),
-        'results': ('results', ['title', 'description', 'image_url', 'metric_value', 'metric_label', 'sort_order']),
-        'bookings': ('student_bookings', ['student_name', 'student_phone', 'student_email', 'selected_teacher', 'selected_subject', 'selected_time', 'status'])
-    }
-    
-    table_info = table_map.get(entity)
-    if not table_info:
+    info = get_entity(entity)
+    if not info.creatable:
         raise ValueError(f'Unknown entity: {entity}')
     
-    table, fields = table_info
-    
-    columns = [f for f in fields if f in data]
+    columns = [f for f in info.writable if f in data]
     values = [data[f] for f in columns]
     placeholders = ', '.join(['%s'] * len(columns))
     columns_str = ', '.join(columns)
     
-    query = f"INSERT INTO t_p90313977_education_center_web.{table} ({columns_str}) VALUES ({placeholders}) RETURNING id"
-    cur.execute(query, values)
+    query = f"INSERT INTO {info.qualified} ({columns_str}) VALUES ({placeholders}) RETURNING id"
+    execute_prepared(cur, (entity, 'insert', tuple(columns)), query, values)
     new_id = cur.fetchone()[0]
+    if info.public:
+        build_snapshot(cur, entity)
     conn.commit()
     
     return {'id': new_id, 'success': True}
 
 def update_entity(cur, conn, entity: str, entity_id: str, data: Dict) -> Dict:
     '''Обновление существующей сущности'''
-    table_map = {
-        'teachers': ('teachers', ['name', 'photo_url', 'description', 'specialization', 'experience', 'sort_order']),
-        'schedule': ('schedule', ['time', 'title', 'description', 'teacher_id', 'sort_order']),
-        'calendar': ('calendar_events', ['date', 'title', 'description', 'event_type', 'sort_order']),
-        'contacts': ('contacts', ['type', 'value', 'icon', 'label', 'sort_order']),
-        'reviews': ('reviews', ['author_name', 'author_photo', 'rating', 'review_text', 'date', 'is_published', 'sort_order']),
-        'results': ('results', ['title', 'description', 'image_url', 'metric_value', 'metric_label', 'sort_order']),
-        'bookings': ('student_bookings', ['student_name', 'student_phone', 'student_email', 'selected_teacher', 'selected_subject', 'selected_time', 'status']),
-        'notifications': ('notification_settings', ['notification_type', 'is_enabled', 'value'])
-    }
+    info = get_entity(entity)
     
-    table_info = table_map.get(entity)
-    if not table_info:
-        raise ValueError(f'Unknown entity: {entity}')
-    
-    table, fields = table_info
-    
-    columns = [f for f in fields if f in data]
+    columns = [f for f in info.writable if f in data]
     values = [data[f] for f in columns]
     
     set_clause = ', '.join([f"{col} = %s" for col in columns])
     values.append(entity_id)
     
-    query = f"UPDATE t_p90313977_education_center_web.{table} SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
-    cur.execute(query, values)
+    query = f"UPDATE {info.qualified} SET {set_clause} WHERE id = %s"
+    execute_prepared(cur, (entity, 'update', tuple(columns)), query, values)
+    updated = cur.rowcount
+    if info.public:
+        build_snapshot(cur, entity)
+    conn.commit()
+    
+    return {'success': True, 'updated': updated}
+
+def get_column_types(cur, table: str) -> Dict[str, str]:
+    '''Типы колонок таблицы для явных приведений в VALUES; кэшируются на время жизни контейнера'''
+    if table not in _column_types:
+        # Без модификатора типа: явное приведение к varchar(n) молча обрезает строку,
+        # а присваивание колонке проверяет длину так же, как в update_entity
+        cur.execute(
+            """
+            SELECT attname, format_type(atttypid, NULL)
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+            """,
+            (f't_p90313977_education_center_web.{table}',)
+        )
+        _column_types[table] = dict(cur.fetchall())
+    return _column_types[table]
+
+def parse_row_id(value: Any) -> Optional[int]:
+    '''id строки из тела запроса: целое в пределах integer (число или строка ASCII-цифр); None - некорректный'''
+    if isinstance(value, bool) or not str(value).isascii() or not str(value).isdecimal() or int(value) > 2147483647:
+        return None
+    return int(value)
+
+def group_bulk_rows(fields: List[str], rows: List[Any], require_id: bool) -> Tuple[Dict[Tuple[str, ...], List[Tuple[int, Dict]]], List[Dict]]:
+    '''Группировка строк пакета по набору колонок; некорректные строки возвращаются как ошибки'''
+    if len(rows) > BULK_MAX_ROWS:
+        raise ValueError(f'Too many rows: {len(rows)} > {BULK_MAX_ROWS}')
+    
+    groups = {}
+    errors = []
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'index': index, 'error': 'Row must be an object'})
+            continue
+        if require_id and not row.get('id'):
+            errors.append({'index': index, 'error': 'Missing id'})
+            continue
+        if require_id and parse_row_id(row['id']) is None:
+            errors.append({'index': index, 'error': 'Invalid id'})
+            continue
+        columns = tuple(f for f in fields if f in row)
+        if not columns:
+            errors.append({'index': index, 'error': 'No known fields'})
+            continue
+        groups.setdefault(columns, []).append((index, row))
+    return groups, errors
+
+def run_bulk_group(cur, group: List[Tuple[int, Dict]], execute: Callable[[List[Tuple[int, Dict]]], List[Dict]]) -> List[Dict]:
+    '''Группа пакета одним запросом под SAVEPOINT; при ошибке БД (CHECK, приведение типа) группа повторяется
+    построчно, и ошибка достаётся только своей строке, а остальные строки пакета сохраняются'''
+    cur.execute('SAVEPOINT bulk_group')
+    try:
+        results = execute(group)
+        cur.execute('RELEASE SAVEPOINT bulk_group')
+        return results
+    except psycopg2.Error:
+        cur.execute('ROLLBACK TO SAVEPOINT bulk_group')
+    
+    results = []
+    for item in group:
+        try:
+            results += execute([item])
+            cur.execute('RELEASE SAVEPOINT bulk_group')
+        except psycopg2.Error as error:
+            cur.execute('ROLLBACK TO SAVEPOINT bulk_group')
+            results.append({'index': item[0], 'error': error.diag.message_primary or type(error).__name__})
+        cur.execute('SAVEPOINT bulk_group')
+    cur.execute('RELEASE SAVEPOINT bulk_group')
+    return results
+
+def bulk_create_entities(cur, conn, entity: str, rows: List[Any]) -> Dict:
+    '''Пакетное создание: многострочный INSERT ... RETURNING на каждый набор колонок, одна транзакция'''
+    import psycopg2.extras
+    
+    info = get_entity(entity)
+    if not info.creatable:
+        raise ValueError(f'Unknown entity: {entity}')
+    
+    groups, results = group_bulk_rows(info.writable, rows, require_id=False)
+    
+    for columns, group in groups.items():
+        query = f"INSERT INTO {info.qualified} ({', '.join(columns)}) VALUES %s RETURNING id"
+        
+        def insert_rows(part: List[Tuple[int, Dict]]) -> List[Dict]:
+            ids = psycopg2.extras.execute_values(
+                cur, query, [[row[col] for col in columns] for _, row in part], page_size=len(part), fetch=True
+            )
+            return [{'index': index, 'id': new_id} for (index, _), (new_id,) in zip(part, ids)]
+        
+        results += run_bulk_group(cur, group, insert_rows)
+    
+    if any('id' in item for item in results) and info.public:
+        build_snapshot(cur, entity)
+    conn.commit()
+    
+    results.sort(key=lambda item: item['index'])
+    created = sum(1 for item in results if 'id' in item)
+    return {'success': created == len(rows), 'created': created, 'results': results}
+
+def bulk_update_entities(cur, conn, entity: str, rows: List[Any]) -> Dict:
+    '''Пакетное обновление: UPDATE ... FROM (VALUES ...) на каждый набор колонок, одна транзакция'''
+    import psycopg2.extras
+    
+    info = get_entity(entity)
+    groups, results = group_bulk_rows(info.writable, rows, require_id=True)
+    types = get_column_types(cur, info.table)
+    
+    for columns, group in groups.items():
+        set_clause = ', '.join(f'{col} = v.{col}' for col in columns)
+        template = '(' + ', '.join(['%s::integer'] + [f'%s::{types[col]}' for col in columns]) + ')'
+        query = f"""
+            UPDATE {info.qualified} AS t
+            SET {set_clause}
+            FROM (VALUES %s) AS v(id, {', '.join(columns)})
+            WHERE t.id = v.id
+            RETURNING t.id
+        """
+        
+        def update_rows(part: List[Tuple[int, Dict]]) -> List[Dict]:
+            values = [[row['id']] + [row[col] for col in columns] for _, row in part]
+            updated_ids = {row_id for (row_id,) in psycopg2.extras.execute_values(
+                cur, query, values, template=template, page_size=len(part), fetch=True
+            )}
+            return [
+                {'index': index, 'id': int(row['id'])} if int(row['id']) in updated_ids else {'index': index, 'error': 'Not found'}
+                for index, row in part
+            ]
+        
+        results += run_bulk_group(cur, group, update_rows)
+    
+    if any('id' in item for item in results) and info.public:
+        build_snapshot(cur, entity)
+    conn.commit()
+    
+    results.sort(key=lambda item: item['index'])
+    updated = sum(1 for item in results if 'id' in item)
+    return {'success': updated == len(rows), 'updated': updated, 'results': results}
+
+def reorder_entities(cur, conn, entity: str, ids: List[Any]) -> Dict:
+    '''Пакетная перестановка: sort_order получает позицию id в переданном списке'''
+    info = get_entity(entity)
+    if 'sort_order' not in info.writable:
+        raise ValueError(f'Reorder is not supported for entity: {entity}')
+    if len(ids) > BULK_MAX_ROWS:
+        raise ValueError(f'Too many rows: {len(ids)} > {BULK_MAX_ROWS}')
+    
+    results = []
+    positions = {}
+    for index, value in enumerate(ids):
+        row_id = parse_row_id(value)
+        if row_id is None:
+            results.append({'index': index, 'error': 'Invalid id'})
+        elif row_id in positions:
+            results.append({'index': index, 'error': 'Duplicate id'})
+        else:
+            positions[row_id] = index
+    
+    updated_ids = set()
+    if positions:
+        cur.execute(
+            f"""
+            UPDATE {info.qualified} AS t
+            SET sort_order = v.position
+            FROM unnest(%s::integer[], %s::integer[]) AS v(id, position)
+            WHERE t.id = v.id
+            RETURNING t.id
+            """,
+            (list(positions), [index + 1 for index in positions.values()])
+        )
+        updated_ids = {row_id for (row_id,) in cur.fetchall()}
+    for row_id, index in positions.items():
+        if row_id in updated_ids:
+            results.append({'index': index, 'id': row_id})
+        else:
+            results.append({'index': index, 'error': 'Not found'})
+    
+    if updated_ids and info.public:
+        build_snapshot(cur, entity)
+    conn.commit()
+    
+    results.sort(key=lambda item: item['index'])
+    return {'success': len(updated_ids) == len(ids), 'updated': len(updated_ids), 'results': results}
+
+def build_snapshot(cur, entity: str) -> Tuple[int, str]:
+    '''Пересборка снимка публичной сущности в текущей транзакции'''
+    cur.execute(ENTITIES[entity].snapshot_sql)
+    body = cur.fetchone()[0]
+    payload = body.encode('utf-8')
+    body_br = compress_body(payload, 'br', SNAPSHOT_BROTLI_QUALITY) if brotli is not None else None
+    cur.execute(
+        """
+        INSERT INTO t_p90313977_education_center_web.content_snapshots (entity, version, body_gzip, body_br, built_at)
+        VALUES (%s, 1, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (entity) DO UPDATE
+        SET version = content_snapshots.version + 1, body_gzip = EXCLUDED.body_gzip, body_br = EXCLUDED.body_br,
+            built_at = EXCLUDED.built_at
+        RETURNING version
+        """,
+        (entity, psycopg2.Binary(compress_body(payload, 'gzip', SNAPSHOT_GZIP_LEVEL)),
+         psycopg2.Binary(body_br) if body_br is not None else None)
+    )
+    return cur.fetchone()[0], body
+
+def rebuild_snapshots(cur, conn, entities: Optional[List[str]] = None) -> Dict:
+    '''Принудительная пересборка снимков публичного контента'''
+    entities = entities or list(PUBLIC_ENTITIES)
+    for entity in entities:
+        if entity not in PUBLIC_ENTITIES:
+            raise ValueError(f'Unknown entity: {entity}')
+    
+    versions = {entity: build_snapshot(cur, entity)[0] for entity in entities}
     conn.commit()
     
-    return {'success': True, 'updated': cur.rowcount}
\ No newline at end of file
+    return {'success': True, 'versions': versions}
@@ -1,101 +1,772 @@
+import base64
+import collections
+import contextlib
+import functools
+import hashlib
+import hmac
+import importlib.util
 import json
+import math
 import os
-import psycopg2
-from typing import Dict, Any
+import random
+import re
+import sys
+import threading
+import time
+import types
+import weakref
+import zlib
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
+class LazyModule(types.ModuleType):
+    '''Заместитель модуля: настоящий импорт выполняется при первом обращении к атрибуту'''
+    def __getattr__(self, attr: str) -> Any:
+        # import_module берёт блокировку импорта модуля, и потоки, первыми обратившиеся к нему одновременно,
+        # ждут один импорт. LazyLoader до Python 3.12.3 отдавал второму потоку недозагруженный модуль
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name: str):
+    '''Модуль, который импортируется при первом обращении к атрибуту; None, если пакет не установлен'''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+psycopg2 = lazy_import('psycopg2')
+orjson = lazy_import('orjson')
+brotli = lazy_import('brotli')
+
+FUNCTION_NAME = 'auth'
+CORS_ALLOW_HEADERS = 'Content-Type, X-Auth-Token'
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+DB_PREPARED_MAX = int(os.environ.get('DB_PREPARED_MAX', '64'))
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '1'))
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '0') == '1'
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()]
+DB_READ_SELECTION = os.environ.get('DB_READ_SELECTION', 'round_robin')
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', '10'))
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+AUTH_TOKEN_SECRETS = [secret for secret in os.environ.get('AUTH_TOKEN_SECRET', '').split(',') if secret]
+AUTH_TOKEN_TTL_SECONDS = int(os.environ.get('AUTH_TOKEN_TTL_SECONDS', '43200'))
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '600000'))
+LOGIN_CACHE_TTL_SECONDS = float(os.environ.get('LOGIN_CACHE_TTL_SECONDS', '60'))
+LOGIN_CACHE_SIZE = int(os.environ.get('LOGIN_CACHE_SIZE', '1024'))
+LOGIN_FAILURE_WINDOW_SECONDS = int(os.environ.get('LOGIN_FAILURE_WINDOW_SECONDS', '900'))
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '20'))
+PASSWORD_HASH_PREFIX = 'pbkdf2_sha256'
+
+_pool: Dict[str, List[Tuple[Any, float]]] = {}
+_pool_urls: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_pool_stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'prepares': 0, 'replica_reads': 0, 'primary_reads': 0}
+_replicas = {url: {'lag': 0.0, 'latency': None, 'healthy': True, 'checked_at': float('-inf')} for url in DATABASE_READ_URLS}
+_read_primary_until = 0.0
+_replica_turn = 0
+_prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_trace_local = threading.local()
+_cold_start = True
+_cursor_classes: Dict[str, type] = {}
+_cache_key_salt = os.urandom(16)
+ROUTES: Dict[str, List[Tuple[Optional[str], Optional[Callable], Callable]]] = {}
+
+def _is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверка соединения из пула; долго простаивавшие проверяются запросом'''
+    if conn.closed:
+        return False
+    if time.monotonic() - released_at < DB_POOL_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        conn.close()
+        return False
+
+def get_db_connection(url: Optional[str] = None):
+    '''Получение подключения к базе данных из пула контейнера; url - реплика для чтения, по умолчанию основная БД'''
+    with trace_phase('connect'):
+        return _acquire_db_connection(url or os.environ.get('DATABASE_URL'))
+
+def _acquire_db_connection(url: str):
+    '''Соединение из пула адреса либо новое подключение, если свободных нет'''
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise RuntimeError('Database connection pool exhausted')
+    try:
+        while True:
+            with _pool_lock:
+                idle = _pool.get(url)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if _is_connection_alive(conn, released_at):
+                _pool_stats['hits'] += 1
+                return conn
+            _pool_stats['reconnects'] += 1
+        _pool_stats['misses'] += 1
+        conn = psycopg2.connect(url)
+        conn.autocommit = False
+        conn.cursor_factory = traced_cursor_class()
+        with _pool_lock:
+            _prepared[conn] = {}
+            _pool_urls[conn] = url
+        return conn
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_db_connection(conn, cur=None) -> None:
+    '''Возврат подключения в пул; сломанные соединения закрываются'''
+    try:
+        if cur is not None and not cur.closed:
+            cur.close()
+        if not conn.closed:
+            conn.rollback()
+            with _pool_lock:
+                idle = _pool.setdefault(_pool_urls.get(conn, ''), [])
+                if len(idle) < DB_POOL_MAX_SIZE:
+                    idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+    except psycopg2.Error:
+        conn.close()
+    finally:
+        _pool_slots.release()
+
+def get_read_connection(min_lsn: str = ''):
+    '''Соединение с репликой, отстающей не больше DB_REPLICA_MAX_LAG_SECONDS и догнавшей min_lsn; None - читать с основной БД'''
+    if not DATABASE_READ_URLS:
+        return None
+    if time.monotonic() < _read_primary_until:
+        _pool_stats['primary_reads'] += 1
+        return None
+    for url in replica_order():
+        try:
+            conn = get_db_connection(url)
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+            continue
+        try:
+            if replica_ready(conn, url, min_lsn):
+                # Проверка реплики не оставляет открытую транзакцию: первый запрос обработчика можно повторить
+                conn.rollback()
+                _pool_stats['replica_reads'] += 1
+                return conn
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+        release_db_connection(conn)
+    _pool_stats['primary_reads'] += 1
+    return None
+
+def replica_order() -> List[str]:
+    '''Реплики-кандидаты: исправные и те, кого пора перепроверить; по кругу или по задержке проверки'''
+    now = time.monotonic()
+    candidates = [url for url in DATABASE_READ_URLS
+                  if _replicas[url]['healthy'] or now - _replicas[url]['checked_at'] >= DB_REPLICA_CHECK_INTERVAL]
+    if len(candidates) < 2:
+        return candidates
+    if DB_READ_SELECTION == 'least_latency':
+        return sorted(candidates, key=lambda url: _replicas[url]['latency'])
+    global _replica_turn
+    with _pool_lock:
+        _replica_turn = turn = (_replica_turn + 1) % len(candidates)
+    return candidates[turn:] + candidates[:turn]
+
+def replica_ready(conn, url: str, min_lsn: str) -> bool:
+    '''Отставание реплики проверяется раз в DB_REPLICA_CHECK_INTERVAL; min_lsn (X-Read-After-LSN) - при каждом чтении'''
+    state = _replicas[url]
+    now = time.monotonic()
+    with conn.cursor() as cur:
+        if now - state['checked_at'] >= DB_REPLICA_CHECK_INTERVAL:
+            started = time.perf_counter()
+            # Без новых записей replay_timestamp стареет, поэтому реплика, проигравшая всё полученное, не отстаёт
+            cur.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+                """
+            )
+            lag = float(cur.fetchone()[0])
+            latency = time.perf_counter() - started
+            state.update(
+                lag=lag,
+                latency=latency if state['latency'] is None else state['latency'] * 0.7 + latency * 0.3,
+                healthy=lag <= DB_REPLICA_MAX_LAG_SECONDS,
+                checked_at=now
+            )
+        if not state['healthy']:
+            return False
+        if not min_lsn:
+            return True
+        try:
+            cur.execute('SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)', (min_lsn,))
+        except psycopg2.DataError:
+            conn.rollback()
+            return True
+        return cur.fetchone()[0]
+
+def read_after_write(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''После записи чтения контейнера идут в основную БД DB_READ_YOUR_WRITES_SECONDS, а клиент получает LSN записи для X-Read-After-LSN'''
+    global _read_primary_until
+    _read_primary_until = time.monotonic() + DB_READ_YOUR_WRITES_SECONDS
+    with request.conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cur.fetchone()[0]
+    headers = response['headers']
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, X-Read-After-LSN' if exposed else 'X-Read-After-LSN'
+    headers['X-Read-After-LSN'] = lsn
+    return response
+
+def _positional_sql(sql: str) -> str:
+    '''Плейсхолдеры %s в нумерованные $1..$n для PREPARE'''
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${number}{part}' for number, part in enumerate(parts[1:], 1))
+
+def execute_prepared(cur, key: Tuple, sql: str, params=()) -> None:
+    '''Выполнение через prepared statement соединения: PREPARE при первом обращении по ключу, дальше EXECUTE'''
+    statements = _prepared.get(cur.connection) if DB_PREPARED_STATEMENTS else None
+    if statements is None:
+        cur.execute(sql, params or None)
+        return
+    # Состояние до PREPARE: повтор безопасен, только если этот запрос открывает транзакцию
+    idle = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    name = statements.get(key)
+    if name is None:
+        if len(statements) >= DB_PREPARED_MAX:
+            cur.execute(sql, params or None)
+            return
+        name = f'stmt_{len(statements) + 1}'
+        cur.execute(f'PREPARE {name} AS {_positional_sql(sql)}')
+        statements[key] = name
+        _pool_stats['prepares'] += 1
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f'EXECUTE {name}')
+    except psycopg2.Error as error:
+        # 0A000 - план SELECT * устарел после ALTER TABLE; в начале транзакции запрос готовится заново,
+        # иначе соединение закрывается, чтобы в пул не вернулись устаревшие prepared statements
+        if error.pgcode != '0A000':
+            raise
+        if not idle:
+            _prepared.pop(cur.connection, None)
+            cur.connection.close()
+            raise
+        cur.connection.rollback()
+        cur.execute('DEALLOCATE ALL')
+        statements.clear()
+        execute_prepared(cur, key, sql, params)
+
+def get_pool_stats() -> Dict[str, Any]:
+    '''Счётчики попаданий и промахов пула соединений'''
+    with _pool_lock:
+        idle = sum(len(conns) for conns in _pool.values())
+    stats = dict(_pool_stats, idle=idle, max_size=DB_POOL_MAX_SIZE)
+    if _replicas:
+        stats['replica_lag'] = [round(state['lag'], 3) if state['healthy'] else None for state in _replicas.values()]
+    return stats
+
+class RequestTrace:
+    '''Замеры одного запроса: время по фазам, число SQL-операторов и строк'''
+    __slots__ = ('started', 'phases', 'queries', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries = 0
+        self.rows = 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+@contextlib.contextmanager
+def trace_phase(phase: str):
+    '''Учёт времени блока в фазе текущего запроса; без активного замера ничего не делает'''
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - started)
+
+def traced_cursor_class() -> type:
+    '''Класс курсора с замерами; создаётся при первом подключении, чтобы psycopg2 не импортировался на старте'''
+    cls = _cursor_classes.get('traced')
+    if cls is not None:
+        return cls
+    
+    class TracedCursor(psycopg2.extensions.cursor):
+        '''Курсор, учитывающий выполнение (sql) и разбор строк (fetch) в замерах запроса'''
+        def execute(self, query, vars=None):
+            trace = current_trace()
+            if trace is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                trace.queries += 1
+                trace.add('sql', time.perf_counter() - started)
+
+        def fetchone(self):
+            trace = current_trace()
+            if trace is None:
+                return super().fetchone()
+            started = time.perf_counter()
+            row = super().fetchone()
+            trace.add('fetch', time.perf_counter() - started)
+            if row is not None:
+                trace.rows += 1
+            return row
+
+        def fetchmany(self, size=None):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+
+        def fetchall(self):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchall()
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+    
+    _cursor_classes['traced'] = TracedCursor
+    return TracedCursor
+
+def add_server_timing(response: Dict[str, Any], trace: RequestTrace, total: float) -> None:
+    '''Заголовок Server-Timing с фазами запроса, доступный браузеру через CORS'''
+    metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in trace.phases.items()]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    headers = response.setdefault('headers', {})
+    headers['Server-Timing'] = ', '.join(metrics)
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+
+def instrument(handler: Callable) -> Callable:
+    '''Обёртка handler: одна строка JSON-лога на запрос (с выборкой по INSTRUMENTATION_SAMPLE_RATE)'''
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        if not cold_start and random.random() >= INSTRUMENTATION_SAMPLE_RATE:
+            return handler(event, context)
+        
+        trace = RequestTrace()
+        _trace_local.trace = trace
+        try:
+            response = handler(event, context)
+        finally:
+            _trace_local.trace = None
+        total = time.perf_counter() - trace.started
+        
+        body = response.get('body') or ''
+        status = response.get('statusCode', 200)
+        record = {
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'query': event.get('queryStringParameters') or {},
+            'status': status,
+            'cold_start': cold_start,
+            'duration_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()},
+            'sql_count': trace.queries,
+            'rows': trace.rows,
+            'response_bytes': len(body),
+            'pool': get_pool_stats()
+        }
+        if status >= 500:
+            record['error'] = body[:500]
+        print(json.dumps(record, ensure_ascii=False))
+        
+        if SERVER_TIMING_ENABLED:
+            add_server_timing(response, trace, total)
+        return response
+    return wrapper
+
+
+def dumps_json(data: Any) -> str:
+    '''Компактная сериализация ответа в UTF-8; при наличии orjson используется он'''
+    with trace_phase('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data).decode('utf-8')
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def response(status: int, body: str = '', headers: Optional[Dict[str, str]] = None, base64_encoded: bool = False) -> Dict[str, Any]:
+    '''Ответ шлюзу; заголовки дополняют или переопределяют JSON_HEADERS'''
+    return {
+        'statusCode': status,
+        'headers': dict(JSON_HEADERS, **headers) if headers else dict(JSON_HEADERS),
+        'body': body,
+        'isBase64Encoded': base64_encoded
+    }
+
+def json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return response(status, dumps_json(data), headers)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return json_response(status, {'error': message})
+
+def accepted_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    '''Лучшее из поддерживаемых сжатий по Accept-Encoding: br (если установлен brotli), затем gzip'''
+    accept = headers.get('Accept-Encoding', headers.get('accept-encoding', ''))
+    if not accept:
+        return None
+    weights = {}
+    for part in accept.lower().split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    
+    best, best_weight = None, 0.0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def compress_body(payload: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    '''Сжатие тела в gzip (через zlib, без импорта модуля gzip) или brotli'''
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY if level is None else level)
+    compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress(payload) + compressor.flush()
+
+def encoded_response(response: Dict[str, Any], payload: bytes, encoding: str) -> Dict[str, Any]:
+    '''Ответ со сжатым телом в base64; ETag получает суффикс кодировки, как у разных представлений'''
+    headers = response.setdefault('headers', {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    etag = headers.get('ETag')
+    if etag and etag.endswith('"'):
+        headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    response['body'] = base64.b64encode(payload).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_response(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Сжатие ответа по Accept-Encoding; короче COMPRESSION_MIN_BYTES, бинарные и уже сжатые не трогаются'''
+    body = response.get('body') or ''
+    headers = response.get('headers') or {}
+    if (not RESPONSE_COMPRESSION_ENABLED or response.get('isBase64Encoded') or 'Content-Encoding' in headers
+            or len(body) < COMPRESSION_MIN_BYTES):
+        return response
+    encoding = accepted_encoding(request.headers)
+    if encoding is None:
+        response.setdefault('headers', {})['Vary'] = 'Accept-Encoding'
+        return response
+    with trace_phase('compress'):
+        payload = compress_body(body.encode('utf-8'), encoding)
+    return encoded_response(response, payload, encoding)
+
+def options_response() -> Dict[str, Any]:
+    '''Ответ на CORS preflight; список методов берётся из зарегистрированных маршрутов'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': ', '.join(list(ROUTES) + ['OPTIONS']),
+            'Access-Control-Allow-Headers': CORS_ALLOW_HEADERS,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def normalize_phone(value: str) -> str:
+    '''Цифры телефона в том же виде, что и student_phone_digits (8XXXXXXXXXX и 9XXXXXXXXX -> 7XXXXXXXXXX)'''
+    digits = re.sub(r'\D', '', value)
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits
+
+class Request:
+    '''Запрос шлюза; соединение с БД берётся из пула только при первом обращении'''
+    __slots__ = ('event', 'method', 'query', 'headers', 'entity', 'conn', 'cur', 'read_conn', 'read_cur')
+
+    def __init__(self, event: Dict[str, Any]):
+        self.event = event
+        self.method = event.get('httpMethod', 'GET')
+        self.query = event.get('queryStringParameters') or {}
+        self.headers = event.get('headers') or {}
+        self.entity = self.query.get('entity', '')
+        self.conn = None
+        self.cur = None
+        self.read_conn = None
+        self.read_cur = None
+
+    def header(self, name: str) -> str:
+        return self.headers.get(name, self.headers.get(name.lower(), ''))
+
+    def json(self) -> Any:
+        return json.loads(self.event.get('body') or '{}')
+
+    def db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор запроса'''
+        if self.conn is None:
+            self.conn = get_db_connection()
+            self.cur = self.conn.cursor(cursor_factory=cursor_factory)
+        return self.conn, self.cur
+
+    def read_db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор только для чтения: реплика, если она есть и не отстаёт, иначе основная БД'''
+        if self.read_conn is None and self.conn is None:
+            self.read_conn = get_read_connection(self.header('X-Read-After-LSN'))
+            if self.read_conn is not None:
+                self.read_cur = self.read_conn.cursor(cursor_factory=cursor_factory)
+        if self.read_conn is not None:
+            return self.read_conn, self.read_cur
+        return self.db(cursor_factory)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            release_db_connection(self.conn, self.cur)
+            self.conn = None
+        if self.read_conn is not None:
+            release_db_connection(self.read_conn, self.read_cur)
+            self.read_conn = None
+
+def route(method: str, entity: Optional[str] = None, when: Optional[Callable[[Request], bool]] = None) -> Callable:
+    '''Регистрация обработчика метода; entity и when сужают маршрут, маршрут без условий - запасной'''
+    def register(func: Callable) -> Callable:
+        ROUTES.setdefault(method, []).append((entity, when, func))
+        return func
+    return register
+
+def find_route(request: Request) -> Optional[Callable]:
+    fallback = None
+    for entity, when, func in ROUTES.get(request.method, ()):
+        if entity is None and when is None:
+            fallback = fallback or func
+        elif (entity is None or entity == request.entity) and (when is None or when(request)):
+            return func
+    return fallback
+
+def serve(event: Dict[str, Any], guard: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+    '''Общий цикл запроса: preflight, 405, проверка доступа, обработчик, 500 и возврат соединения в пул'''
+    request = Request(event)
+    if request.method == 'OPTIONS':
+        return options_response()
+    
+    func = find_route(request)
+    if func is None:
+        return error_response(405, 'Method not allowed')
+    if guard is not None and not guard(request.headers):
+        return error_response(401, 'Unauthorized')
+    
+    try:
+        result = func(request)
+        if DATABASE_READ_URLS and request.method != 'GET' and request.conn is not None and result['statusCode'] < 300:
+            result = read_after_write(request, result)
+        return encode_response(request, result)
+    except Exception as e:
+        return error_response(500, str(e))
+    finally:
+        request.close()
+
+class TtlLru:
+    '''Компактный LRU контейнера с временем жизни записей'''
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.items: 'collections.OrderedDict[str, Tuple[Any, float]]' = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        with self.lock:
+            self.items.pop(key, None)
+
+_login_cache = TtlLru(LOGIN_CACHE_SIZE)
+_login_failures = TtlLru(LOGIN_CACHE_SIZE)
+
+@instrument
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Аутентификация администратора
     Принимает: username и password в теле POST запроса
-    Возвращает: токен сессии при успешном входе
+    Возвращает: подписанный токен сессии (HMAC, AUTH_TOKEN_SECRET) со сроком AUTH_TOKEN_TTL_SECONDS
+    Пароли хранятся как PBKDF2-SHA256 (PASSWORD_HASH_ITERATIONS); старые записи перехешируются при входе.
+    Повторные неверные входы отклоняются из кэша контейнера, частые ошибки по логину с одного IP или по IP получают 429
     '''
-    method: str = event.get('httpMethod', 'GET')
+    return serve(event)
+
+@route('POST')
+def login(request: Request) -> Dict[str, Any]:
+    '''Проверка логина и пароля администратора'''
+    body_data = request.json()
+    username = body_data.get('username', '')
+    password = body_data.get('password', '')
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    if not username or not password:
+        return error_response(400, 'Username and password required')
+    if not AUTH_TOKEN_SECRETS:
+        return error_response(503, 'Authentication is not configured')
     
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+    # Лимит по логину считается вместе с IP: чужие ошибки с другого адреса не блокируют вход администратора.
+    # Без известного IP лимиты не применяются: общий ключ позволил бы одному клиенту заблокировать всех
+    ip = client_ip(request)
+    throttle_keys = [f'user:{ip}:{username.lower()}', 'ip:' + ip] if ip else []
+    retry_after = login_retry_after(throttle_keys)
+    if retry_after:
+        return throttled_response(retry_after)
     
-    try:
-        body_data = json.loads(event.get('body', '{}'))
-        username = body_data.get('username', '')
-        password = body_data.get('password', '')
-        
-        if not username or not password:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({'error': 'Username and password required'}),
-                'isBase64Encoded': False
-            }
-        
-        db_url = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
-        
-        cur.execute("SELECT id, username FROM t_p90313977_education_center_web.admins WHERE username = %s AND password_hash = %s", (username, password))
-        admin = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
-        if admin:
-            admin_id, admin_username = admin
-            token = f"admin_{admin_id}_{admin_username}"
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({
-                    'success': True,
-                    'token': token,
-                    'username': admin_username
-                }),
-                'isBase64Encoded': False
-            }
+    # Кэшируются только отказы, и ключ включает сохранённый хеш: смена пароля сразу сбрасывает прежние отказы,
+    # а успешный вход всегда сверяется с БД
+    _, cur = request.db()
+    row = find_admin(cur, username)
+    cache_key = login_cache_key(username, password, row[2] if row else '')
+    admin = None
+    if _login_cache.get(cache_key) is None:
+        admin = authenticate(request.conn, cur, row, password)
+        if admin is None:
+            _login_cache.set(cache_key, False, LOGIN_CACHE_TTL_SECONDS)
+    
+    if not admin:
+        record_login_failure(throttle_keys)
+        return error_response(401, 'Invalid credentials')
+    
+    if throttle_keys:
+        _login_failures.pop(throttle_keys[0])
+    admin_id, admin_username = admin
+    
+    return json_response(200, {
+        'success': True,
+        'token': sign_token(admin_id),
+        'username': admin_username,
+        'expires_in': AUTH_TOKEN_TTL_SECONDS
+    })
+
+def client_ip(request: Request) -> str:
+    identity = (request.event.get('requestContext') or {}).get('identity') or {}
+    forwarded = request.header('X-Forwarded-For')
+    return identity.get('sourceIp') or forwarded.split(',')[0].strip()
+
+def login_cache_key(username: str, password: str, stored_hash: str) -> str:
+    '''Ключ кэша отказов: пароль в памяти хранится только как HMAC со случайной солью контейнера'''
+    return hmac.new(_cache_key_salt, f'{username}\0{password}\0{stored_hash}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def login_retry_after(keys: List[str]) -> int:
+    '''Секунды до следующей попытки, если по логину с этого IP или по IP исчерпан лимит ошибок; 0 - можно пробовать'''
+    limits = (LOGIN_MAX_FAILURES_PER_USER, LOGIN_MAX_FAILURES_PER_IP)
+    for key, limit in zip(keys, limits):
+        state = _login_failures.get(key)
+        if state and state[0] >= limit:
+            return max(1, math.ceil(state[1] + LOGIN_FAILURE_WINDOW_SECONDS - time.monotonic()))
+    return 0
+
+def record_login_failure(keys: List[str]) -> None:
+    '''Счётчик ошибок в окне LOGIN_FAILURE_WINDOW_SECONDS от первой ошибки'''
+    now = time.monotonic()
+    for key in keys:
+        state = _login_failures.get(key)
+        if state is None:
+            _login_failures.set(key, (1, now), LOGIN_FAILURE_WINDOW_SECONDS)
         else:
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({'error': 'Invalid credentials'}),
-                'isBase64Encoded': False
-            }
+            _login_failures.set(key, (state[0] + 1, state[1]), state[1] + LOGIN_FAILURE_WINDOW_SECONDS - now)
+
+def throttled_response(retry_after: int) -> Dict[str, Any]:
+    return json_response(429, {'error': 'Too many login attempts, try again later'}, {
+        'Access-Control-Expose-Headers': 'Retry-After',
+        'Retry-After': str(retry_after)
+    })
+
+def hash_password(password: str, iterations: int = PASSWORD_HASH_ITERATIONS) -> str:
+    '''Хеш пароля в виде pbkdf2_sha256$итерации$соль$хеш'''
+    salt = base64.b64encode(os.urandom(16)).decode('ascii')
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+    return f"{PASSWORD_HASH_PREFIX}${iterations}${salt}${base64.b64encode(digest).decode('ascii')}"
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    '''Проверка пароля: (совпал, нужно перехешировать) - для записей без хеша и с другим числом итераций'''
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != PASSWORD_HASH_PREFIX:
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8')), True
+    _, iterations, salt, expected = parts
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), int(iterations))
+    matched = hmac.compare_digest(base64.b64encode(digest).decode('ascii'), expected)
+    return matched, int(iterations) != PASSWORD_HASH_ITERATIONS
+
+def find_admin(cur, username: str) -> Optional[Tuple[int, str, str]]:
+    '''Администратор по логину: (id, username, password_hash); None - такого нет'''
+    execute_prepared(cur, ('admins', 'login'), "SELECT id, username, password_hash FROM t_p90313977_education_center_web.admins WHERE username = %s", (username,))
+    return cur.fetchone()
+
+def authenticate(conn, cur, row: Optional[Tuple[int, str, str]], password: str) -> Optional[Tuple[int, str]]:
+    '''Проверка пароля найденного администратора с перехешированием устаревших паролей; None - неверные данные'''
+    if row is None:
+        # Та же стоимость проверки для несуществующего логина, чтобы его нельзя было отличить по времени
+        hash_password(password)
+        return None
     
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+    admin_id, admin_username, stored = row
+    matched, needs_rehash = verify_password(password, stored)
+    if not matched:
+        return None
+    if needs_rehash:
+        cur.execute("UPDATE t_p90313977_education_center_web.admins SET password_hash = %s WHERE id = %s", (hash_password(password), admin_id))
+        conn.commit()
+    return admin_id, admin_username
+
+def sign_token(admin_id: int) -> str:
+    '''Токен v1.<id>.<истекает>.<подпись>: admin-api проверяет его без обращения к БД'''
+    payload = f'v1.{admin_id}.{int(time.time()) + AUTH_TOKEN_TTL_SECONDS}'
+    signature = hmac.new(AUTH_TOKEN_SECRETS[0].encode('utf-8'), payload.encode('ascii'), hashlib.sha256).digest()
+    return payload + '.' + base64.urlsafe_b64encode(signature).decode('ascii').rstrip('=')
@@ -1,121 +1,1236 @@
+import base64
+import contextlib
+import datetime
+import functools
+import hashlib
+import importlib.util
 import json
+import operator
 import os
-import psycopg2
-from decimal import Decimal
-from typing import Dict, Any, List
+import random
+import re
+import sys
+import threading
+import time
+import types
+import weakref
+import zlib
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
 
-def get_db_connection():
-    '''Создание подключения к базе данных'''
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
-    conn.autocommit = False
-    return conn
+class LazyModule(types.ModuleType):
+    '''Заместитель модуля: настоящий импорт выполняется при первом обращении к атрибуту'''
+    def __getattr__(self, attr: str) -> Any:
+        # import_module берёт блокировку импорта модуля, и потоки, первыми обратившиеся к нему одновременно,
+        # ждут один импорт. LazyLoader до Python 3.12.3 отдавал второму потоку недозагруженный модуль
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
 
+def lazy_import(name: str):
+    '''Модуль, который импортируется при первом обращении к атрибуту; None, если пакет не установлен'''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+psycopg2 = lazy_import('psycopg2')
+orjson = lazy_import('orjson')
+brotli = lazy_import('brotli')
+
+FUNCTION_NAME = 'public-api'
+CORS_ALLOW_HEADERS = 'Content-Type, If-None-Match'
+SCHEMA = 't_p90313977_education_center_web'
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+DB_PREPARED_MAX = int(os.environ.get('DB_PREPARED_MAX', '64'))
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '1'))
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '0') == '1'
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()]
+DB_READ_SELECTION = os.environ.get('DB_READ_SELECTION', 'round_robin')
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', '10'))
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+DB_JSON_TYPECASTERS_ENABLED = os.environ.get('DB_JSON_TYPECASTERS', '1') == '1'
+SNAPSHOT_CACHE_ENABLED = os.environ.get('SNAPSHOT_CACHE_ENABLED', '1') == '1'
+SNAPSHOT_TTL_SECONDS = int(os.environ.get('SNAPSHOT_TTL_SECONDS', '3600'))
+CACHE_MAX_AGE = int(os.environ.get('PUBLIC_CACHE_MAX_AGE', '60'))
+CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('PUBLIC_CACHE_STALE_WHILE_REVALIDATE', '600'))
+SNAPSHOT_GZIP_LEVEL = 9
+SNAPSHOT_BROTLI_QUALITY = 11
+ENCODED_MEMO_MAX_ENTRIES = 32
+AVAILABILITY_DEFAULT_DAYS = 7
+AVAILABILITY_MAX_DAYS = 31
+AVAILABILITY_CACHE_CONTROL = 'no-cache'
+CALENDAR_MAX_DAYS = 366
+CALENDAR_CACHE_MONTHS = int(os.environ.get('CALENDAR_CACHE_MONTHS', '36'))
+RECURRENCE_WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+REVIEWS_FEED_DEFAULT_LIMIT = 20
+REVIEWS_FEED_MAX_LIMIT = 100
+CACHE_CONTROL = f'public, max-age={CACHE_MAX_AGE}, stale-while-revalidate={CACHE_STALE_WHILE_REVALIDATE}'
+
+_pool: Dict[str, List[Tuple[Any, float]]] = {}
+_pool_urls: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_pool_stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'prepares': 0, 'replica_reads': 0, 'primary_reads': 0}
+_replicas = {url: {'lag': 0.0, 'latency': None, 'healthy': True, 'checked_at': float('-inf')} for url in DATABASE_READ_URLS}
+_read_primary_until = 0.0
+_replica_turn = 0
+_prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_trace_local = threading.local()
+_cold_start = True
+_cursor_classes: Dict[str, type] = {}
+_snapshot_memo: Dict[str, Tuple[str, str, Dict[str, bytes]]] = {}
+_encoded_memo: Dict[Tuple[str, str], bytes] = {}
+_batch_queries: Dict[Tuple[str, ...], str] = {}
+_calendar_months: Dict[datetime.date, Tuple[int, List[Tuple[datetime.date, str]]]] = {}
+ROUTES: Dict[str, List[Tuple[Optional[str], Optional[Callable], Callable]]] = {}
+
+def _is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверка соединения из пула; долго простаивавшие проверяются запросом'''
+    if conn.closed:
+        return False
+    if time.monotonic() - released_at < DB_POOL_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        conn.close()
+        return False
+
+def get_db_connection(url: Optional[str] = None):
+    '''Получение подключения к базе данных из пула контейнера; url - реплика для чтения, по умолчанию основная БД'''
+    with trace_phase('connect'):
+        return _acquire_db_connection(url or os.environ.get('DATABASE_URL'))
+
+def _acquire_db_connection(url: str):
+    '''Соединение из пула адреса либо новое подключение, если свободных нет'''
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise RuntimeError('Database connection pool exhausted')
+    try:
+        while True:
+            with _pool_lock:
+                idle = _pool.get(url)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if _is_connection_alive(conn, released_at):
+                _pool_stats['hits'] += 1
+                return conn
+            _pool_stats['reconnects'] += 1
+        _pool_stats['misses'] += 1
+        conn = psycopg2.connect(url)
+        conn.autocommit = False
+        conn.cursor_factory = traced_cursor_class()
+        with _pool_lock:
+            _prepared[conn] = {}
+            _pool_urls[conn] = url
+        return conn
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_db_connection(conn, cur=None) -> None:
+    '''Возврат подключения в пул; сломанные соединения закрываются'''
+    try:
+        if cur is not None and not cur.closed:
+            cur.close()
+        if not conn.closed:
+            conn.rollback()
+            with _pool_lock:
+                idle = _pool.setdefault(_pool_urls.get(conn, ''), [])
+                if len(idle) < DB_POOL_MAX_SIZE:
+                    idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+    except psycopg2.Error:
+        conn.close()
+    finally:
+        _pool_slots.release()
+
+def get_read_connection(min_lsn: str = ''):
+    '''Соединение с репликой, отстающей не больше DB_REPLICA_MAX_LAG_SECONDS и догнавшей min_lsn; None - читать с основной БД'''
+    if not DATABASE_READ_URLS:
+        return None
+    if time.monotonic() < _read_primary_until:
+        _pool_stats['primary_reads'] += 1
+        return None
+    for url in replica_order():
+        try:
+            conn = get_db_connection(url)
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+            continue
+        try:
+            if replica_ready(conn, url, min_lsn):
+                # Проверка реплики не оставляет открытую транзакцию: первый запрос обработчика можно повторить
+                conn.rollback()
+                _pool_stats['replica_reads'] += 1
+                return conn
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+        release_db_connection(conn)
+    _pool_stats['primary_reads'] += 1
+    return None
+
+def replica_order() -> List[str]:
+    '''Реплики-кандидаты: исправные и те, кого пора перепроверить; по кругу или по задержке проверки'''
+    now = time.monotonic()
+    candidates = [url for url in DATABASE_READ_URLS
+                  if _replicas[url]['healthy'] or now - _replicas[url]['checked_at'] >= DB_REPLICA_CHECK_INTERVAL]
+    if len(candidates) < 2:
+        return candidates
+    if DB_READ_SELECTION == 'least_latency':
+        return sorted(candidates, key=lambda url: _replicas[url]['latency'])
+    global _replica_turn
+    with _pool_lock:
+        _replica_turn = turn = (_replica_turn + 1) % len(candidates)
+    return candidates[turn:] + candidates[:turn]
+
+def replica_ready(conn, url: str, min_lsn: str) -> bool:
+    '''Отставание реплики проверяется раз в DB_REPLICA_CHECK_INTERVAL; min_lsn (X-Read-After-LSN) - при каждом чтении'''
+    state = _replicas[url]
+    now = time.monotonic()
+    with conn.cursor() as cur:
+        if now - state['checked_at'] >= DB_REPLICA_CHECK_INTERVAL:
+            started = time.perf_counter()
+            # Без новых записей replay_timestamp стареет, поэтому реплика, проигравшая всё полученное, не отстаёт
+            cur.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+                """
+            )
+            lag = float(cur.fetchone()[0])
+            latency = time.perf_counter() - started
+            state.update(
+                lag=lag,
+                latency=latency if state['latency'] is None else state['latency'] * 0.7 + latency * 0.3,
+                healthy=lag <= DB_REPLICA_MAX_LAG_SECONDS,
+                checked_at=now
+            )
+        if not state['healthy']:
+            return False
+        if not min_lsn:
+            return True
+        try:
+            cur.execute('SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)', (min_lsn,))
+        except psycopg2.DataError:
+            conn.rollback()
+            return True
+        return cur.fetchone()[0]
+
+def read_after_write(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''После записи чтения контейнера идут в основную БД DB_READ_YOUR_WRITES_SECONDS, а клиент получает LSN записи для X-Read-After-LSN'''
+    global _read_primary_until
+    _read_primary_until = time.monotonic() + DB_READ_YOUR_WRITES_SECONDS
+    with request.conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cur.fetchone()[0]
+    headers = response['headers']
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, X-Read-After-LSN' if exposed else 'X-Read-After-LSN'
+    headers['X-Read-After-LSN'] = lsn
+    return response
+
+def _positional_sql(sql: str) -> str:
+    '''Плейсхолдеры %s в нумерованные $1..$n для PREPARE'''
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${number}{part}' for number, part in enumerate(parts[1:], 1))
+
+def execute_prepared(cur, key: Tuple, sql: str, params=()) -> None:
+    '''Выполнение через prepared statement соединения: PREPARE при первом обращении по ключу, дальше EXECUTE'''
+    statements = _prepared.get(cur.connection) if DB_PREPARED_STATEMENTS else None
+    if statements is None:
+        cur.execute(sql, params or None)
+        return
+    # Состояние до PREPARE: повтор безопасен, только если этот запрос открывает транзакцию
+    idle = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    name = statements.get(key)
+    if name is None:
+        if len(statements) >= DB_PREPARED_MAX:
+            cur.execute(sql, params or None)
+            return
+        name = f'stmt_{len(statements) + 1}'
+        cur.execute(f'PREPARE {name} AS {_positional_sql(sql)}')
+        statements[key] = name
+        _pool_stats['prepares'] += 1
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f'EXECUTE {name}')
+    except psycopg2.Error as error:
+        # 0A000 - план SELECT * устарел после ALTER TABLE; в начале транзакции запрос готовится заново,
+        # иначе соединение закрывается, чтобы в пул не вернулись устаревшие prepared statements
+        if error.pgcode != '0A000':
+            raise
+        if not idle:
+            _prepared.pop(cur.connection, None)
+            cur.connection.close()
+            raise
+        cur.connection.rollback()
+        cur.execute('DEALLOCATE ALL')
+        statements.clear()
+        execute_prepared(cur, key, sql, params)
+
+def get_pool_stats() -> Dict[str, Any]:
+    '''Счётчики попаданий и промахов пула соединений'''
+    with _pool_lock:
+        idle = sum(len(conns) for conns in _pool.values())
+    stats = dict(_pool_stats, idle=idle, max_size=DB_POOL_MAX_SIZE)
+    if _replicas:
+        stats['replica_lag'] = [round(state['lag'], 3) if state['healthy'] else None for state in _replicas.values()]
+    return stats
+
+class RequestTrace:
+    '''Замеры одного запроса: время по фазам, число SQL-операторов и строк'''
+    __slots__ = ('started', 'phases', 'queries', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries = 0
+        self.rows = 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+@contextlib.contextmanager
+def trace_phase(phase: str):
+    '''Учёт времени блока в фазе текущего запроса; без активного замера ничего не делает'''
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - started)
+
+def traced_cursor_class() -> type:
+    '''Класс курсора с замерами; создаётся при первом подключении, чтобы psycopg2 не импортировался на старте'''
+    cls = _cursor_classes.get('traced')
+    if cls is not None:
+        return cls
+    
+    class TracedCursor(psycopg2.extensions.cursor):
+        '''Курсор, учитывающий выполнение (sql) и разбор строк (fetch) в замерах запроса'''
+        def execute(self, query, vars=None):
+            trace = current_trace()
+            if trace is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                trace.queries += 1
+                trace.add('sql', time.perf_counter() - started)
+
+        def fetchone(self):
+            trace = current_trace()
+            if trace is None:
+                return super().fetchone()
+            started = time.perf_counter()
+            row = super().fetchone()
+            trace.add('fetch', time.perf_counter() - started)
+            if row is not None:
+                trace.rows += 1
+            return row
+
+        def fetchmany(self, size=None):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+
+        def fetchall(self):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchall()
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+    
+    _cursor_classes['traced'] = TracedCursor
+    return TracedCursor
+
+def add_server_timing(response: Dict[str, Any], trace: RequestTrace, total: float) -> None:
+    '''Заголовок Server-Timing с фазами запроса, доступный браузеру через CORS'''
+    metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in trace.phases.items()]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    headers = response.setdefault('headers', {})
+    headers['Server-Timing'] = ', '.join(metrics)
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+
+def instrument(handler: Callable) -> Callable:
+    '''Обёртка handler: одна строка JSON-лога на запрос (с выборкой по INSTRUMENTATION_SAMPLE_RATE)'''
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        if not cold_start and random.random() >= INSTRUMENTATION_SAMPLE_RATE:
+            return handler(event, context)
+        
+        trace = RequestTrace()
+        _trace_local.trace = trace
+        try:
+            response = handler(event, context)
+        finally:
+            _trace_local.trace = None
+        total = time.perf_counter() - trace.started
+        
+        body = response.get('body') or ''
+        status = response.get('statusCode', 200)
+        record = {
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'query': event.get('queryStringParameters') or {},
+            'status': status,
+            'cold_start': cold_start,
+            'duration_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()},
+            'sql_count': trace.queries,
+            'rows': trace.rows,
+            'response_bytes': len(body),
+            'pool': get_pool_stats()
+        }
+        if status >= 500:
+            record['error'] = body[:500]
+        print(json.dumps(record, ensure_ascii=False))
+        
+        if SERVER_TIMING_ENABLED:
+            add_server_timing(response, trace, total)
+        return response
+    return wrapper
+
+
+def dumps_json(data: Any) -> str:
+    '''Компактная сериализация ответа в UTF-8; при наличии orjson используется он'''
+    with trace_phase('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data).decode('utf-8')
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def response(status: int, body: str = '', headers: Optional[Dict[str, str]] = None, base64_encoded: bool = False) -> Dict[str, Any]:
+    '''Ответ шлюзу; заголовки дополняют или переопределяют JSON_HEADERS'''
+    return {
+        'statusCode': status,
+        'headers': dict(JSON_HEADERS, **headers) if headers else dict(JSON_HEADERS),
+        'body': body,
+        'isBase64Encoded': base64_encoded
+    }
+
+def json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return response(status, dumps_json(data), headers)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return json_response(status, {'error': message})
+
+def accepted_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    '''Лучшее из поддерживаемых сжатий по Accept-Encoding: br (если установлен brotli), затем gzip'''
+    accept = headers.get('Accept-Encoding', headers.get('accept-encoding', ''))
+    if not accept:
+        return None
+    weights = {}
+    for part in accept.lower().split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    
+    best, best_weight = None, 0.0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def compress_body(payload: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    '''Сжатие тела в gzip (через zlib, без импорта модуля gzip) или brotli'''
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY if level is None else level)
+    compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress(payload) + compressor.flush()
+
+def encoded_response(response: Dict[str, Any], payload: bytes, encoding: str) -> Dict[str, Any]:
+    '''Ответ со сжатым телом в base64; ETag получает суффикс кодировки, как у разных представлений'''
+    headers = response.setdefault('headers', {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    etag = headers.get('ETag')
+    if etag and etag.endswith('"'):
+        headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    response['body'] = base64.b64encode(payload).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_response(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Сжатие ответа по Accept-Encoding; короче COMPRESSION_MIN_BYTES, бинарные и уже сжатые не трогаются'''
+    body = response.get('body') or ''
+    headers = response.get('headers') or {}
+    if (not RESPONSE_COMPRESSION_ENABLED or response.get('isBase64Encoded') or 'Content-Encoding' in headers
+            or len(body) < COMPRESSION_MIN_BYTES):
+        return response
+    encoding = accepted_encoding(request.headers)
+    if encoding is None:
+        response.setdefault('headers', {})['Vary'] = 'Accept-Encoding'
+        return response
+    with trace_phase('compress'):
+        payload = compress_body(body.encode('utf-8'), encoding)
+    return encoded_response(response, payload, encoding)
+
+def options_response() -> Dict[str, Any]:
+    '''Ответ на CORS preflight; список методов берётся из зарегистрированных маршрутов'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': ', '.join(list(ROUTES) + ['OPTIONS']),
+            'Access-Control-Allow-Headers': CORS_ALLOW_HEADERS,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def normalize_phone(value: str) -> str:
+    '''Цифры телефона в том же виде, что и student_phone_digits (8XXXXXXXXXX и 9XXXXXXXXX -> 7XXXXXXXXXX)'''
+    digits = re.sub(r'\D', '', value)
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits
+
+class Request:
+    '''Запрос шлюза; соединение с БД берётся из пула только при первом обращении'''
+    __slots__ = ('event', 'method', 'query', 'headers', 'entity', 'conn', 'cur', 'read_conn', 'read_cur')
+
+    def __init__(self, event: Dict[str, Any]):
+        self.event = event
+        self.method = event.get('httpMethod', 'GET')
+        self.query = event.get('queryStringParameters') or {}
+        self.headers = event.get('headers') or {}
+        self.entity = self.query.get('entity', '')
+        self.conn = None
+        self.cur = None
+        self.read_conn = None
+        self.read_cur = None
+
+    def header(self, name: str) -> str:
+        return self.headers.get(name, self.headers.get(name.lower(), ''))
+
+    def json(self) -> Any:
+        return json.loads(self.event.get('body') or '{}')
+
+    def db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор запроса'''
+        if self.conn is None:
+            self.conn = get_db_connection()
+            self.cur = self.conn.cursor(cursor_factory=cursor_factory)
+        return self.conn, self.cur
+
+    def read_db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор только для чтения: реплика, если она есть и не отстаёт, иначе основная БД'''
+        if self.read_conn is None and self.conn is None:
+            self.read_conn = get_read_connection(self.header('X-Read-After-LSN'))
+            if self.read_conn is not None:
+                self.read_cur = self.read_conn.cursor(cursor_factory=cursor_factory)
+        if self.read_conn is not None:
+            return self.read_conn, self.read_cur
+        return self.db(cursor_factory)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            release_db_connection(self.conn, self.cur)
+            self.conn = None
+        if self.read_conn is not None:
+            release_db_connection(self.read_conn, self.read_cur)
+            self.read_conn = None
+
+def route(method: str, entity: Optional[str] = None, when: Optional[Callable[[Request], bool]] = None) -> Callable:
+    '''Регистрация обработчика метода; entity и when сужают маршрут, маршрут без условий - запасной'''
+    def register(func: Callable) -> Callable:
+        ROUTES.setdefault(method, []).append((entity, when, func))
+        return func
+    return register
+
+def find_route(request: Request) -> Optional[Callable]:
+    fallback = None
+    for entity, when, func in ROUTES.get(request.method, ()):
+        if entity is None and when is None:
+            fallback = fallback or func
+        elif (entity is None or entity == request.entity) and (when is None or when(request)):
+            return func
+    return fallback
+
+def serve(event: Dict[str, Any], guard: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+    '''Общий цикл запроса: preflight, 405, проверка доступа, обработчик, 500 и возврат соединения в пул'''
+    request = Request(event)
+    if request.method == 'OPTIONS':
+        return options_response()
+    
+    func = find_route(request)
+    if func is None:
+        return error_response(405, 'Method not allowed')
+    if guard is not None and not guard(request.headers):
+        return error_response(401, 'Unauthorized')
+    
+    try:
+        result = func(request)
+        if DATABASE_READ_URLS and request.method != 'GET' and request.conn is not None and result['statusCode'] < 300:
+            result = read_after_write(request, result)
+        return encode_response(request, result)
+    except Exception as e:
+        return error_response(500, str(e))
+    finally:
+        request.close()
+
+DATE_TYPE_OIDS = (1082, 1083, 1114, 1184, 1266)
+NUMERIC_TYPE_OID = 1700
+
+def _cast_text(value: Optional[str], cur) -> Optional[str]:
+    return value
+
+def _cast_timestamp(value: Optional[str], cur) -> Optional[str]:
+    return value.replace(' ', 'T', 1) if value is not None else None
+
+def _cast_timestamptz(value: Optional[str], cur) -> Optional[str]:
+    if value is None:
+        return None
+    value = value.replace(' ', 'T', 1)
+    if value[-3] in '+-':
+        value += ':00'
+    return value
+
+def _cast_numeric(value: Optional[str], cur) -> Optional[float]:
+    return float(value) if value is not None else None
+
+def json_ready_cursor_class() -> type:
+    '''Курсор, у которого даты и numeric сразу приходят в JSON-совместимом виде'''
+    cls = _cursor_classes.get('json_ready')
+    if cls is not None:
+        return cls
+    
+    typecasters = [
+        psycopg2.extensions.new_type((1082, 1083, 1266), 'JSON_DATE', _cast_text),
+        psycopg2.extensions.new_type((1114,), 'JSON_TIMESTAMP', _cast_timestamp),
+        psycopg2.extensions.new_type((1184,), 'JSON_TIMESTAMPTZ', _cast_timestamptz),
+        psycopg2.extensions.new_type((NUMERIC_TYPE_OID,), 'JSON_NUMERIC', _cast_numeric)
+    ]
+    
+    class JsonReadyCursor(traced_cursor_class()):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            for caster in typecasters:
+                psycopg2.extensions.register_type(caster, self)
+    
+    _cursor_classes['json_ready'] = JsonReadyCursor
+    return JsonReadyCursor
+
+def cursor_factory() -> Optional[type]:
+    '''Курсор для чтения сущностей: JSON-готовые типы, если они включены'''
+    return json_ready_cursor_class() if DB_JSON_TYPECASTERS_ENABLED else None
+
+_row_converters: Dict[Tuple, Callable[[tuple], Dict]] = {}
+
+def build_row_converter(description, json_ready: bool = False) -> Callable[[tuple], Dict]:
+    '''План преобразования строк в словари: конвертеры выбираются один раз по OID типов колонок'''
+    key = (json_ready,) + tuple((col[0], col[1]) for col in description)
+    convert = _row_converters.get(key)
+    if convert:
+        return convert
+    
+    columns = tuple(col[0] for col in description)
+    converters = []
+    if not json_ready:
+        for i, col in enumerate(description):
+            if col[1] in DATE_TYPE_OIDS:
+                converters.append((i, operator.methodcaller('isoformat')))
+            elif col[1] == NUMERIC_TYPE_OID:
+                converters.append((i, float))
+    
+    if not converters:
+        def convert(row: tuple) -> Dict:
+            return dict(zip(columns, row))
+    else:
+        def convert(row: tuple) -> Dict:
+            values = list(row)
+            for i, cast in converters:
+                if values[i] is not None:
+                    values[i] = cast(values[i])
+            return dict(zip(columns, values))
+    
+    _row_converters[key] = convert
+    return convert
+
+def fetch_dicts(cur) -> List[Dict]:
+    '''Чтение всех строк курсора в виде JSON-совместимых словарей'''
+    convert = build_row_converter(cur.description, isinstance(cur, json_ready_cursor_class()))
+    return [convert(row) for row in cur.fetchall()]
+
+
+class Entity:
+    '''Публичная сущность и заранее собранные SQL-запросы к ней'''
+    __slots__ = ('name', 'table', 'list_sql', 'json_sql', 'snapshot_sql')
+
+    def __init__(self, name: str, table: str, where: str = '', order_by: str = 'id'):
+        self.name = name
+        self.table = f'{SCHEMA}.{table}'
+        self.list_sql = f'SELECT * FROM {self.table} {where} ORDER BY {order_by}'
+        self.json_sql = f"SELECT COALESCE(json_agg(t ORDER BY t.{order_by}), '[]'::json) FROM {self.table} t {where}"
+        self.snapshot_sql = f"SELECT '[' || COALESCE(string_agg(row_to_json(t)::text, ',' ORDER BY t.{order_by}), '') || ']' FROM {self.table} t {where}"
+
+PUBLIC_ENTITIES = {entity.name: entity for entity in (
+    Entity('teachers', 'teachers', 'WHERE name IS NOT NULL'),
+    Entity('schedule', 'schedule'),
+    Entity('contacts', 'contacts'),
+    Entity('reviews', 'reviews', 'WHERE is_published')
+)}
+
+def parse_entity_list(query_params: Dict[str, Any]) -> Optional[List[str]]:
+    '''Разбор списка сущностей для пакетного запроса: entity=a,b или entities=*'''
+    raw = query_params.get('entities')
+    if raw is None:
+        raw = query_params.get('entity', '')
+        if ',' not in raw:
+            return None
+    if raw.strip() == '*':
+        return list(PUBLIC_ENTITIES)
+    entities = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name in entities:
+            continue
+        if name not in PUBLIC_ENTITIES:
+            raise ValueError(f'Unknown entity: {name}')
+        entities.append(name)
+    if not entities:
+        raise ValueError('No entities requested')
+    return entities
+
+def make_etag(entities: List[str], revisions: Dict[str, str]) -> str:
+    '''Сильный ETag по ревизиям снимков запрошенных сущностей'''
+    key = '|'.join(f'{entity}={revisions[entity]}' for entity in entities)
+    return '"' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:24] + '"'
+
+def etag_matches(headers: Dict[str, Any], etag: str) -> Optional[str]:
+    '''Проверка If-None-Match: совпавший ETag представления или None. Подходит несжатое представление
+    и сжатое в кодировке, которую выберет этот запрос (encoded_response), но не тег чужой кодировки'''
+    if_none_match = headers.get('If-None-Match', headers.get('if-none-match', ''))
+    if not if_none_match:
+        return None
+    tags = [etag]
+    encoding = accepted_encoding(headers) if RESPONSE_COMPRESSION_ENABLED else None
+    if encoding:
+        tags.append(f'{etag[:-1]}-{encoding}"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return etag
+        if candidate in tags:
+            return candidate
+    return None
+
+@instrument
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Публичный API для получения данных на главную страницу
     GET /public-api?entity=teachers - получить преподавателей
     GET /public-api?entity=schedule - получить расписание
     GET /public-api?entity=contacts - получить контакты
-    GET /public-api?entity=reviews - получить отзывы
+    GET /public-api?entity=reviews - получить опубликованные отзывы
+    GET /public-api?entity=reviews_feed&limit=&offset= - страница опубликованных отзывов со сводкой оценок
+    GET /public-api?entities=teachers,schedule - несколько сущностей одним запросом (* - все)
+    GET /public-api?entity=availability&date_from=&date_to=[&teacher_id=&subject=] - свободные места на занятиях по дням
+    GET /public-api?entity=calendar&from=&to= - события календаря за период с развёрнутыми повторениями
+    Accept-Encoding: br, gzip - сжатый ответ (base64, isBase64Encoded), для снимков сжатие берётся из кэша
+    Чтение идёт с реплик DATABASE_READ_URL, если они не отстают больше DB_REPLICA_MAX_LAG_SECONDS
     '''
-    method: str = event.get('httpMethod', 'GET')
-    query_params = event.get('queryStringParameters', {}) or {}
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    if method != 'GET':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+    return serve(event)
+
+@route('GET')
+def get_public_content(request: Request) -> Dict[str, Any]:
+    '''Одна или несколько публичных сущностей; при включённом кэше - из снимков с ETag по ревизиям'''
+    entity = request.entity
+    entities = parse_entity_list(request.query)
     
-    conn = None
-    cur = None
+    _, cur = request.read_db(cursor_factory())
     
-    try:
-        entity = query_params.get('entity', '')
+    if SNAPSHOT_CACHE_ENABLED:
+        names = entities or [entity]
+        revisions = get_snapshot_revisions(cur, names)
+        if len(revisions) == len(names):
+            etag = make_etag(names, revisions)
+            matched = etag_matches(request.headers, etag)
+            if matched:
+                return not_modified(matched)
         
-        conn = get_db_connection()
-        cur = conn.cursor()
+        snapshots = get_snapshots(request, cur, names, revisions)
+        etag = make_etag(names, {name: snapshots[name][0] for name in names})
         
-        result = get_entities(cur, entity)
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps(result),
-            'isBase64Encoded': False
-        }
+        # Сжатое тело берётся из снимка или из памяти без сборки и сжатия ответа заново
+        encoding = None
+        if RESPONSE_COMPRESSION_ENABLED and sum(len(snapshots[name][1]) for name in names) >= COMPRESSION_MIN_BYTES:
+            encoding = accepted_encoding(request.headers)
+        if encoding:
+            return encoded_response(content_response('', etag), get_encoded_body(etag, entity, entities, snapshots, encoding), encoding)
+        body = batch_body(entities, snapshots) if entities else snapshots[entity][1]
+    else:
+        # Без снимков ETag строится по версиям строк до чтения тел: 304 не выполняет выборку,
+        # а тело, прочитанное позже ревизий, не старше своего ETag
+        names = entities or [entity]
+        etag = make_etag(names, get_row_revisions(cur, names))
+        matched = etag_matches(request.headers, etag)
+        if matched:
+            return not_modified(matched)
+        if entities:
+            body = get_entities_batch(cur, entities)
+        else:
+            body = dumps_json(get_entities(cur, entity))
     
-    except Exception as e:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    return content_response(body, etag)
 
-def get_entities(cur, entity: str) -> List[Dict]:
-    '''Получение списка всех сущностей'''
-    table_map = {
-        'teachers': 'teachers',
-        'schedule': 'schedule',
-        'contacts': 'contacts',
-        'reviews': 'reviews'
+@route('GET', 'availability')
+def get_availability(request: Request) -> Dict[str, Any]:
+    '''Свободные места на занятиях расписания по дням периода; teacher_id и subject сужают выборку'''
+    try:
+        date_from, date_to = parse_availability_period(request.query)
+    except ValueError as e:
+        return error_response(400, str(e))
+    teacher_id = request.query.get('teacher_id') or None
+    # Только ASCII-цифры в пределах INTEGER, как schedule_id в submit-booking
+    if teacher_id is not None and not (teacher_id.isascii() and teacher_id.isdecimal() and int(teacher_id) <= 2147483647):
+        return error_response(400, 'Invalid teacher_id')
+    subject = request.query.get('subject') or None
+    
+    _, cur = request.read_db()
+    execute_prepared(
+        cur,
+        ('availability', 'open'),
+        f"""
+        SELECT '[' || COALESCE(string_agg(row_to_json(a)::text, ',' ORDER BY a.starts_at, a.schedule_id), '') || ']'
+        FROM (
+            SELECT s.id AS schedule_id, to_char(s.slot_start, 'HH24:MI') AS starts_at, to_char(s.slot_end, 'HH24:MI') AS ends_at,
+                   s.title AS subject, s.teacher_id, t.name AS teacher, s.capacity,
+                   ('{{' || string_agg('"' || d.day || '":' || (s.capacity - COALESCE(o.booked, 0)), ',' ORDER BY d.day) || '}}')::json AS available
+            FROM {SCHEMA}.schedule s
+            CROSS JOIN LATERAL (SELECT g::date AS day FROM generate_series(%s::date, %s::date, INTERVAL '1 day') g) d
+            LEFT JOIN {SCHEMA}.schedule_slots o ON o.slot_date = d.day AND o.schedule_id = s.id
+            LEFT JOIN {SCHEMA}.teachers t ON t.id = s.teacher_id
+            WHERE s.slot_start IS NOT NULL AND s.capacity > 0
+              AND (%s::int IS NULL OR s.teacher_id = %s::int) AND (%s::text IS NULL OR s.title = %s::text)
+              AND COALESCE(o.booked, 0) < s.capacity AND d.day + s.slot_start > LOCALTIMESTAMP
+            GROUP BY s.id, t.id
+        ) a
+        """,
+        (date_from, date_to, teacher_id, teacher_id, subject, subject)
+    )
+    body = f'{{"date_from":"{date_from.isoformat()}","date_to":"{date_to.isoformat()}","slots":{cur.fetchone()[0]}}}'
+    return response(200, body, {'Cache-Control': AVAILABILITY_CACHE_CONTROL})
+
+def parse_availability_period(query_params: Dict[str, Any]) -> Tuple[datetime.date, datetime.date]:
+    '''Период свободных мест: date_from и date_to включительно, по умолчанию AVAILABILITY_DEFAULT_DAYS дней с сегодняшнего'''
+    today = datetime.date.today()
+    try:
+        date_from = datetime.date.fromisoformat(query_params['date_from']) if query_params.get('date_from') else today
+        date_to = datetime.date.fromisoformat(query_params['date_to']) if query_params.get('date_to') else date_from + datetime.timedelta(days=AVAILABILITY_DEFAULT_DAYS - 1)
+    except ValueError:
+        raise ValueError('Invalid date')
+    date_from = max(date_from, today)
+    if date_from > date_to:
+        raise ValueError('date_from is after date_to')
+    if (date_to - date_from).days >= AVAILABILITY_MAX_DAYS:
+        raise ValueError(f'Period is longer than {AVAILABILITY_MAX_DAYS} days')
+    return date_from, date_to
+
+@route('GET', 'calendar')
+def get_calendar(request: Request) -> Dict[str, Any]:
+    '''События календаря за период from..to; повторения разворачиваются помесячно и кэшируются в контейнере'''
+    try:
+        date_from, date_to = parse_calendar_period(request.query)
+    except ValueError as e:
+        return error_response(400, str(e))
+    months = []
+    month = date_from.replace(day=1)
+    while month <= date_to:
+        months.append(month)
+        month = next_month(month)
+    
+    _, cur = request.read_db()
+    execute_prepared(
+        cur,
+        ('calendar', 'watermark'),
+        f"""
+        SELECT pg_snapshot_xmin(pg_current_snapshot())::text,
+               (SELECT change_xid::text FROM {SCHEMA}.row_versions WHERE entity = 'calendar' ORDER BY change_xid DESC LIMIT 1)
+        """
+    )
+    watermark, last_change = cur.fetchone()
+    watermark = int(watermark)
+    
+    # Месяц из памяти годится, если последнее изменение календаря было видно снимку, на котором он собран
+    loaded = {month: _calendar_months[month] for month in months
+              if month in _calendar_months and (last_change is None or int(last_change) < _calendar_months[month][0])}
+    stale = [month for month in months if month not in loaded]
+    if stale:
+        built = build_calendar_months(cur, stale, watermark)
+        if len(_calendar_months) + len(built) > CALENDAR_CACHE_MONTHS:
+            _calendar_months.clear()
+        _calendar_months.update(built)
+        loaded.update(built)
+    
+    events = [event for month in months for day, event in loaded[month][1] if date_from <= day <= date_to]
+    body = f'{{"from":"{date_from.isoformat()}","to":"{date_to.isoformat()}","events":[{",".join(events)}]}}'
+    etag = '"' + hashlib.sha1(body.encode('utf-8')).hexdigest()[:24] + '"'
+    matched = etag_matches(request.headers, etag)
+    if matched:
+        return not_modified(matched)
+    return content_response(body, etag)
+
+def parse_calendar_period(query_params: Dict[str, Any]) -> Tuple[datetime.date, datetime.date]:
+    '''Период календаря: from и to включительно, по умолчанию текущий месяц'''
+    try:
+        date_from = datetime.date.fromisoformat(query_params['from']) if query_params.get('from') else datetime.date.today().replace(day=1)
+        date_to = datetime.date.fromisoformat(query_params['to']) if query_params.get('to') else next_month(date_from.replace(day=1)) - datetime.timedelta(days=1)
+    except ValueError:
+        raise ValueError('Invalid date')
+    if date_from > date_to:
+        raise ValueError('from is after to')
+    if (date_to - date_from).days >= CALENDAR_MAX_DAYS:
+        raise ValueError(f'Period is longer than {CALENDAR_MAX_DAYS} days')
+    return date_from, date_to
+
+def next_month(month: datetime.date) -> datetime.date:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+def build_calendar_months(cur, months: List[datetime.date], watermark: int) -> Dict[datetime.date, Tuple[int, List[Tuple[datetime.date, str]]]]:
+    '''Сборка месяцев одним запросом: разовые события - диапазоном по date, повторяющиеся - только пересекающие период'''
+    window_start, window_end = months[0], next_month(months[-1]) - datetime.timedelta(days=1)
+    execute_prepared(
+        cur,
+        ('calendar', 'window'),
+        f"""
+        SELECT id, date, title, description, event_type, sort_order, recurrence_rule
+        FROM {SCHEMA}.calendar_events
+        WHERE date BETWEEN %s AND %s AND recurrence_rule IS NULL
+        UNION ALL
+        SELECT id, date, title, description, event_type, sort_order, recurrence_rule
+        FROM {SCHEMA}.calendar_events
+        WHERE recurrence_rule IS NOT NULL AND date <= %s AND (recurrence_end IS NULL OR recurrence_end >= %s)
+        """,
+        (window_start, window_end, window_end, window_start)
+    )
+    occurrences: Dict[datetime.date, List[Tuple[tuple, datetime.date, str]]] = {month: [] for month in months}
+    with trace_phase('expand'):
+        for event_id, start, title, description, event_type, sort_order, rule in cur.fetchall():
+            days = expand_occurrences(start, rule, window_start, window_end) if rule else (start,)
+            for day in days:
+                bucket = occurrences.get(day.replace(day=1))
+                if bucket is None:
+                    continue
+                event = dumps_json({
+                    'id': event_id, 'date': day.isoformat(), 'title': title, 'description': description,
+                    'event_type': event_type, 'sort_order': sort_order, 'recurrence_rule': rule
+                })
+                bucket.append(((day, sort_order or 0, event_id), day, event))
+    return {month: (watermark, [(day, event) for _, day, event in sorted(items, key=operator.itemgetter(0))])
+            for month, items in occurrences.items()}
+
+def parse_recurrence_rule(rule: str) -> Dict[str, Any]:
+    '''Разбор правила повторения (подмножество RRULE: FREQ, INTERVAL, COUNT, UNTIL, BYDAY)'''
+    parts = dict(part.split('=', 1) for part in rule.split(';'))
+    until = parts.get('UNTIL', '').replace('-', '')
+    return {
+        'freq': parts['FREQ'],
+        'interval': int(parts.get('INTERVAL', '1')),
+        'count': int(parts['COUNT']) if 'COUNT' in parts else None,
+        'until': datetime.date(int(until[:4]), int(until[4:6]), int(until[6:])) if until else None,
+        'byday': sorted(RECURRENCE_WEEKDAYS.index(day) for day in parts['BYDAY'].split(',')) if 'BYDAY' in parts else None
     }
+
+def expand_occurrences(start: datetime.date, rule: str, window_start: datetime.date, window_end: datetime.date) -> Iterator[datetime.date]:
+    '''Даты повторений события внутри окна: перебор начинается сразу с окна, номер вхождения для COUNT считается арифметически'''
+    parsed = parse_recurrence_rule(rule)
+    interval, count = parsed['interval'], parsed['count']
+    last = min(window_end, parsed['until']) if parsed['until'] else window_end
+    if parsed['freq'] == 'DAILY':
+        index = max(0, -(-(window_start - start).days // interval))
+        day = start + datetime.timedelta(days=index * interval)
+        while day <= last and (count is None or index < count):
+            yield day
+            index += 1
+            day += datetime.timedelta(days=interval)
+    elif parsed['freq'] == 'WEEKLY':
+        weekdays = parsed['byday'] or [start.weekday()]
+        first_week = [weekday for weekday in weekdays if weekday >= start.weekday()]
+        week_start = start - datetime.timedelta(days=start.weekday())
+        period = max(0, (window_start - week_start).days // (7 * interval))
+        index = len(first_week) + (period - 1) * len(weekdays) if period else 0
+        week_start += datetime.timedelta(weeks=period * interval)
+        while week_start <= last:
+            for weekday in first_week if period == 0 else weekdays:
+                day = week_start + datetime.timedelta(days=weekday)
+                if count is not None and index >= count or day > last:
+                    return
+                index += 1
+                if day >= window_start:
+                    yield day
+            period += 1
+            week_start += datetime.timedelta(weeks=interval)
+    else:
+        # Месяцы без нужного числа пропускаются и не входят в COUNT, поэтому с COUNT после 28-го перебор идёт с начала
+        months = (window_start.year - start.year) * 12 + window_start.month - start.month
+        period = 0 if count is not None and start.day > 28 else max(0, months // interval)
+        index = period
+        while True:
+            month_number = start.month - 1 + period * interval
+            month = datetime.date(start.year + month_number // 12, month_number % 12 + 1, 1)
+            if month > last or count is not None and index >= count:
+                return
+            if start.day <= calendar_month_days(month):
+                day = month.replace(day=start.day)
+                index += 1
+                if window_start <= day <= last:
+                    yield day
+            period += 1
+
+def calendar_month_days(month: datetime.date) -> int:
+    return (next_month(month) - month).days
+
+@route('GET', 'reviews_feed')
+def get_reviews_feed(request: Request) -> Dict[str, Any]:
+    '''Страница опубликованных отзывов по sort_order и дате со сводкой оценок из review_stats'''
+    try:
+        limit, offset = parse_feed_page(request.query)
+    except ValueError as e:
+        return error_response(400, str(e))
     
-    table = table_map.get(entity)
-    if not table:
+    _, cur = request.read_db()
+    execute_prepared(
+        cur,
+        ('reviews_feed', 'page'),
+        f"""
+        SELECT (
+            SELECT '[' || COALESCE(string_agg(row_to_json(r)::text, ',' ORDER BY r.sort_order, r.date DESC, r.id), '') || ']'
+            FROM (
+                SELECT id, author_name, author_photo, rating, review_text, date, sort_order
+                FROM {SCHEMA}.reviews
+                WHERE is_published
+                ORDER BY sort_order, date DESC, id
+                LIMIT %s OFFSET %s
+            ) r
+        ), (
+            SELECT json_build_object(
+                'count', published,
+                'average', round(rating_sum::numeric / NULLIF(rated, 0), 2),
+                'histogram', json_build_object('1', rating_1, '2', rating_2, '3', rating_3, '4', rating_4, '5', rating_5)
+            )::text
+            FROM {SCHEMA}.review_stats
+        )
+        """,
+        (limit, offset)
+    )
+    reviews, stats = cur.fetchone()
+    body = f'{{"reviews":{reviews},"stats":{stats or "null"},"limit":{limit},"offset":{offset}}}'
+    etag = '"' + hashlib.sha1(body.encode('utf-8')).hexdigest()[:24] + '"'
+    matched = etag_matches(request.headers, etag)
+    if matched:
+        return not_modified(matched)
+    return content_response(body, etag)
+
+def parse_feed_page(query_params: Dict[str, Any]) -> Tuple[int, int]:
+    '''Страница ленты: limit до REVIEWS_FEED_MAX_LIMIT и offset'''
+    limit = query_params.get('limit') or str(REVIEWS_FEED_DEFAULT_LIMIT)
+    offset = query_params.get('offset') or '0'
+    # Только ASCII-цифры в пределах INTEGER: isdigit() пропускает '²', а слишком большой OFFSET падает в SQL
+    if not all(value.isascii() and value.isdecimal() and int(value) <= 2147483647 for value in (limit, offset)) or int(limit) == 0:
+        raise ValueError('Invalid limit or offset')
+    return min(int(limit), REVIEWS_FEED_MAX_LIMIT), int(offset)
+
+def content_response(body: str, etag: str) -> Dict[str, Any]:
+    return response(200, body, {
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': CACHE_CONTROL,
+        'ETag': etag
+    })
+
+def batch_body(entities: List[str], snapshots: Dict[str, Tuple[str, str, Dict[str, bytes]]]) -> str:
+    return '{' + ','.join(f'"{name}":{snapshots[name][1]}' for name in entities) + '}'
+
+def get_encoded_body(etag: str, entity: str, entities: Optional[List[str]],
+                     snapshots: Dict[str, Tuple[str, str, Dict[str, bytes]]], encoding: str) -> bytes:
+    '''Сжатое тело ответа: одиночный снимок сжат при сборке, пакет сжимается один раз на ETag и кодировку'''
+    if not entities:
+        stored = snapshots[entity][2].get(encoding)
+        if stored is not None:
+            return stored
+    key = (etag, encoding)
+    payload = _encoded_memo.get(key)
+    if payload is None:
+        body = batch_body(entities, snapshots) if entities else snapshots[entity][1]
+        with trace_phase('compress'):
+            payload = compress_body(body.encode('utf-8'), encoding)
+        if len(_encoded_memo) >= ENCODED_MEMO_MAX_ENTRIES:
+            _encoded_memo.clear()
+        _encoded_memo[key] = payload
+    return payload
+
+def get_entities(cur, entity: str) -> List[Dict]:
+    '''Получение списка всех сущностей'''
+    if entity not in PUBLIC_ENTITIES:
         raise ValueError(f'Unknown entity: {entity}')
     
-    if entity == 'teachers':
-        query = f"SELECT * FROM t_p90313977_education_center_web.{table} WHERE name IS NOT NULL ORDER BY id"
-    else:
-        query = f"SELECT * FROM t_p90313977_education_center_web.{table} ORDER BY id"
-    cur.execute(query)
-    columns = [desc[0] for desc in cur.description]
-    rows = cur.fetchall()
-    
-    result = []
-    for row in rows:
-        row_dict = {}
-        for i, col in enumerate(columns):
-            val = row[i]
-            if hasattr(val, 'isoformat'):
-                val = val.isoformat()
-            elif isinstance(val, Decimal):
-                val = float(val)
-            row_dict[col] = val
-        result.append(row_dict)
-    
-    return result
\ No newline at end of file
+    execute_prepared(cur, (entity, 'list'), PUBLIC_ENTITIES[entity].list_sql)
+    return fetch_dicts(cur)
+
+def not_modified(etag: str) -> Dict[str, Any]:
+    '''Ответ 304 без тела для совпавшего ETag; совпадение зависит от Accept-Encoding'''
+    return response(304, '', {
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': CACHE_CONTROL,
+        'ETag': etag,
+        'Vary': 'Accept-Encoding'
+    })
+
+def get_entities_batch(cur, entities: List[str]) -> str:
+    '''Получение нескольких сущностей за один запрос к БД в виде готового JSON-объекта'''
+    key = tuple(entities)
+    query = _batch_queries.get(key)
+    if query is None:
+        parts = [f'%s, ({PUBLIC_ENTITIES[entity].json_sql})' for entity in entities]
+        query = _batch_queries[key] = f"SELECT json_build_object({', '.join(parts)})::text"
+    cur.execute(query, entities)
+    return cur.fetchone()[0]
+
+def compress_snapshot(body: str) -> Dict[str, bytes]:
+    '''Сжатые представления снимка: сжимаются один раз при сборке с максимальной степенью'''
+    payload = body.encode('utf-8')
+    encoded = {'gzip': compress_body(payload, 'gzip', SNAPSHOT_GZIP_LEVEL)}
+    if brotli is not None:
+        encoded['br'] = compress_body(payload, 'br', SNAPSHOT_BROTLI_QUALITY)
+    return encoded
+
+def build_snapshot(cur, entity: str) -> Tuple[str, str, Dict[str, bytes]]:
+    '''Пересборка снимка сущности: JSON собирается в БД, сжимается и сохраняется с новой версией'''
+    cur.execute(PUBLIC_ENTITIES[entity].snapshot_sql)
+    body = cur.fetchone()[0]
+    encoded = compress_snapshot(body)
+    cur.execute(
+        """
+        INSERT INTO t_p90313977_education_center_web.content_snapshots (entity, version, body_gzip, body_br, built_at)
+        VALUES (%s, 1, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (entity) DO UPDATE
+        SET version = content_snapshots.version + 1, body_gzip = EXCLUDED.body_gzip, body_br = EXCLUDED.body_br,
+            built_at = EXCLUDED.built_at
+        RETURNING version || '@' || built_at::text
+        """,
+        (entity, psycopg2.Binary(encoded['gzip']), psycopg2.Binary(encoded['br']) if 'br' in encoded else None)
+    )
+    return cur.fetchone()[0], body, encoded
+
+def get_snapshot_revisions(cur, entities: List[str]) -> Dict[str, str]:
+    '''Дешёвая проверка ревизий снимков без чтения тел; устаревшие по TTL не возвращаются'''
+    for entity in entities:
+        if entity not in PUBLIC_ENTITIES:
+            raise ValueError(f'Unknown entity: {entity}')
+    
+    execute_prepared(
+        cur,
+        ('snapshots', 'revisions'),
+        """
+        SELECT entity, version || '@' || built_at::text
+        FROM t_p90313977_education_center_web.content_snapshots
+        WHERE entity = ANY(%s) AND built_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+        """,
+        (entities, SNAPSHOT_TTL_SECONDS)
+    )
+    return dict(cur.fetchall())
+
+def get_row_revisions(cur, entities: List[str]) -> Dict[str, str]:
+    '''Ревизии сущностей по row_versions (V0013): число версий и сумма их xid растут при любой вставке, правке и удалении'''
+    for entity in entities:
+        if entity not in PUBLIC_ENTITIES:
+            raise ValueError(f'Unknown entity: {entity}')
+    
+    execute_prepared(
+        cur,
+        ('row_versions', 'revisions'),
+        f"""
+        SELECT entity, COUNT(*) || ':' || SUM(change_xid::text::numeric)
+        FROM {SCHEMA}.row_versions
+        WHERE entity = ANY(%s)
+        GROUP BY entity
+        """,
+        (entities,)
+    )
+    revisions = dict(cur.fetchall())
+    return {entity: revisions.get(entity, '0') for entity in entities}
+
+def get_snapshots(request: Request, cur, entities: List[str], revisions: Dict[str, str]) -> Dict[str, Tuple[str, str, Dict[str, bytes]]]:
+    '''Тела снимков (и их сжатые представления) из памяти контейнера или из таблицы снимков на реплике; отсутствующие и устаревшие пересобираются в основной БД'''
+    snapshots = {}
+    to_load = []
+    for entity in entities:
+        if entity not in revisions:
+            continue
+        cached = _snapshot_memo.get(entity)
+        if cached and cached[0] == revisions[entity]:
+            snapshots[entity] = cached
+        else:
+            to_load.append(entity)
+    
+    if to_load:
+        cur.execute(
+            """
+            SELECT entity, version || '@' || built_at::text, body_gzip, body_br
+            FROM t_p90313977_education_center_web.content_snapshots
+            WHERE entity = ANY(%s)
+            """,
+            (to_load,)
+        )
+        for entity, revision, body_gzip, body_br in cur.fetchall():
+            encoded = {'gzip': bytes(body_gzip)}
+            if body_br is not None:
+                encoded['br'] = bytes(body_br)
+            snapshots[entity] = (revision, zlib.decompress(encoded['gzip'], 31).decode('utf-8'), encoded)
+    
+    stale = [entity for entity in entities if entity not in snapshots]
+    if stale:
+        conn, primary_cur = request.db(cursor_factory())
+        for entity in stale:
+            snapshots[entity] = build_snapshot(primary_cur, entity)
+        conn.commit()
+    
+    _snapshot_memo.update(snapshots)
+    return snapshots
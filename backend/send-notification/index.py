@@ -1,15 +1,653 @@
+import base64
+import contextlib
+import functools
+import hmac
+import importlib.util
 import json
 import os
-import requests
-from typing import Dict, Any
+import random
+import re
+import sys
+import threading
+import time
+import types
+import weakref
+import zlib
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
-def send_telegram_notification(chat_id: str, message: str) -> bool:
-    '''Отправка уведомления в Telegram'''
+class LazyModule(types.ModuleType):
+    '''Заместитель модуля: настоящий импорт выполняется при первом обращении к атрибуту'''
+    def __getattr__(self, attr: str) -> Any:
+        # import_module берёт блокировку импорта модуля, и потоки, первыми обратившиеся к нему одновременно,
+        # ждут один импорт. LazyLoader до Python 3.12.3 отдавал второму потоку недозагруженный модуль
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name: str):
+    '''Модуль, который импортируется при первом обращении к атрибуту; None, если пакет не установлен'''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+psycopg2 = lazy_import('psycopg2')
+orjson = lazy_import('orjson')
+brotli = lazy_import('brotli')
+requests = lazy_import('requests')
+
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+SENDGRID_API_URL = os.environ.get('SENDGRID_API_URL', 'https://api.sendgrid.com')
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', '30'))
+OUTBOX_BACKOFF_MAX = float(os.environ.get('OUTBOX_BACKOFF_MAX', '3600'))
+OUTBOX_LEASE_SECONDS = int(os.environ.get('OUTBOX_LEASE_SECONDS', '120'))
+OUTBOX_TIME_BUDGET = float(os.environ.get('OUTBOX_TIME_BUDGET', '20'))
+OUTBOX_DISPATCH_SECRET = os.environ.get('OUTBOX_DISPATCH_SECRET', '')
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '10'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '8'))
+NOTIFY_MAX_WORKERS = int(os.environ.get('NOTIFY_MAX_WORKERS', '8'))
+
+FUNCTION_NAME = 'send-notification'
+CORS_ALLOW_HEADERS = 'Content-Type'
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+DB_PREPARED_MAX = int(os.environ.get('DB_PREPARED_MAX', '64'))
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '1'))
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '0') == '1'
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()]
+DB_READ_SELECTION = os.environ.get('DB_READ_SELECTION', 'round_robin')
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', '10'))
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+_pool: Dict[str, List[Tuple[Any, float]]] = {}
+_pool_urls: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_pool_stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'prepares': 0, 'replica_reads': 0, 'primary_reads': 0}
+_replicas = {url: {'lag': 0.0, 'latency': None, 'healthy': True, 'checked_at': float('-inf')} for url in DATABASE_READ_URLS}
+_read_primary_until = 0.0
+_replica_turn = 0
+_prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_trace_local = threading.local()
+_cold_start = True
+_cursor_classes: Dict[str, type] = {}
+_http_sessions: Dict[str, Any] = {}
+_http_lock = threading.Lock()
+_executor = None
+ROUTES: Dict[str, List[Tuple[Optional[str], Optional[Callable], Callable]]] = {}
+
+def _is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверка соединения из пула; долго простаивавшие проверяются запросом'''
+    if conn.closed:
+        return False
+    if time.monotonic() - released_at < DB_POOL_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        conn.close()
+        return False
+
+def get_db_connection(url: Optional[str] = None):
+    '''Получение подключения к базе данных из пула контейнера; url - реплика для чтения, по умолчанию основная БД'''
+    with trace_phase('connect'):
+        return _acquire_db_connection(url or os.environ.get('DATABASE_URL'))
+
+def _acquire_db_connection(url: str):
+    '''Соединение из пула адреса либо новое подключение, если свободных нет'''
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise RuntimeError('Database connection pool exhausted')
+    try:
+        while True:
+            with _pool_lock:
+                idle = _pool.get(url)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if _is_connection_alive(conn, released_at):
+                _pool_stats['hits'] += 1
+                return conn
+            _pool_stats['reconnects'] += 1
+        _pool_stats['misses'] += 1
+        conn = psycopg2.connect(url)
+        conn.autocommit = False
+        conn.cursor_factory = traced_cursor_class()
+        with _pool_lock:
+            _prepared[conn] = {}
+            _pool_urls[conn] = url
+        return conn
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_db_connection(conn, cur=None) -> None:
+    '''Возврат подключения в пул; сломанные соединения закрываются'''
+    try:
+        if cur is not None and not cur.closed:
+            cur.close()
+        if not conn.closed:
+            conn.rollback()
+            with _pool_lock:
+                idle = _pool.setdefault(_pool_urls.get(conn, ''), [])
+                if len(idle) < DB_POOL_MAX_SIZE:
+                    idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+    except psycopg2.Error:
+        conn.close()
+    finally:
+        _pool_slots.release()
+
+def get_read_connection(min_lsn: str = ''):
+    '''Соединение с репликой, отстающей не больше DB_REPLICA_MAX_LAG_SECONDS и догнавшей min_lsn; None - читать с основной БД'''
+    if not DATABASE_READ_URLS:
+        return None
+    if time.monotonic() < _read_primary_until:
+        _pool_stats['primary_reads'] += 1
+        return None
+    for url in replica_order():
+        try:
+            conn = get_db_connection(url)
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+            continue
+        try:
+            if replica_ready(conn, url, min_lsn):
+                # Проверка реплики не оставляет открытую транзакцию: первый запрос обработчика можно повторить
+                conn.rollback()
+                _pool_stats['replica_reads'] += 1
+                return conn
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+        release_db_connection(conn)
+    _pool_stats['primary_reads'] += 1
+    return None
+
+def replica_order() -> List[str]:
+    '''Реплики-кандидаты: исправные и те, кого пора перепроверить; по кругу или по задержке проверки'''
+    now = time.monotonic()
+    candidates = [url for url in DATABASE_READ_URLS
+                  if _replicas[url]['healthy'] or now - _replicas[url]['checked_at'] >= DB_REPLICA_CHECK_INTERVAL]
+    if len(candidates) < 2:
+        return candidates
+    if DB_READ_SELECTION == 'least_latency':
+        return sorted(candidates, key=lambda url: _replicas[url]['latency'])
+    global _replica_turn
+    with _pool_lock:
+        _replica_turn = turn = (_replica_turn + 1) % len(candidates)
+    return candidates[turn:] + candidates[:turn]
+
+def replica_ready(conn, url: str, min_lsn: str) -> bool:
+    '''Отставание реплики проверяется раз в DB_REPLICA_CHECK_INTERVAL; min_lsn (X-Read-After-LSN) - при каждом чтении'''
+    state = _replicas[url]
+    now = time.monotonic()
+    with conn.cursor() as cur:
+        if now - state['checked_at'] >= DB_REPLICA_CHECK_INTERVAL:
+            started = time.perf_counter()
+            # Без новых записей replay_timestamp стареет, поэтому реплика, проигравшая всё полученное, не отстаёт
+            cur.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+                """
+            )
+            lag = float(cur.fetchone()[0])
+            latency = time.perf_counter() - started
+            state.update(
+                lag=lag,
+                latency=latency if state['latency'] is None else state['latency'] * 0.7 + latency * 0.3,
+                healthy=lag <= DB_REPLICA_MAX_LAG_SECONDS,
+                checked_at=now
+            )
+        if not state['healthy']:
+            return False
+        if not min_lsn:
+            return True
+        try:
+            cur.execute('SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)', (min_lsn,))
+        except psycopg2.DataError:
+            conn.rollback()
+            return True
+        return cur.fetchone()[0]
+
+def read_after_write(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''После записи чтения контейнера идут в основную БД DB_READ_YOUR_WRITES_SECONDS, а клиент получает LSN записи для X-Read-After-LSN'''
+    global _read_primary_until
+    _read_primary_until = time.monotonic() + DB_READ_YOUR_WRITES_SECONDS
+    with request.conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cur.fetchone()[0]
+    headers = response['headers']
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, X-Read-After-LSN' if exposed else 'X-Read-After-LSN'
+    headers['X-Read-After-LSN'] = lsn
+    return response
+
+def _positional_sql(sql: str) -> str:
+    '''Плейсхолдеры %s в нумерованные $1..$n для PREPARE'''
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${number}{part}' for number, part in enumerate(parts[1:], 1))
+
+def execute_prepared(cur, key: Tuple, sql: str, params=()) -> None:
+    '''Выполнение через prepared statement соединения: PREPARE при первом обращении по ключу, дальше EXECUTE'''
+    statements = _prepared.get(cur.connection) if DB_PREPARED_STATEMENTS else None
+    if statements is None:
+        cur.execute(sql, params or None)
+        return
+    # Состояние до PREPARE: повтор безопасен, только если этот запрос открывает транзакцию
+    idle = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    name = statements.get(key)
+    if name is None:
+        if len(statements) >= DB_PREPARED_MAX:
+            cur.execute(sql, params or None)
+            return
+        name = f'stmt_{len(statements) + 1}'
+        cur.execute(f'PREPARE {name} AS {_positional_sql(sql)}')
+        statements[key] = name
+        _pool_stats['prepares'] += 1
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f'EXECUTE {name}')
+    except psycopg2.Error as error:
+        # 0A000 - план SELECT * устарел после ALTER TABLE; в начале транзакции запрос готовится заново,
+        # иначе соединение закрывается, чтобы в пул не вернулись устаревшие prepared statements
+        if error.pgcode != '0A000':
+            raise
+        if not idle:
+            _prepared.pop(cur.connection, None)
+            cur.connection.close()
+            raise
+        cur.connection.rollback()
+        cur.execute('DEALLOCATE ALL')
+        statements.clear()
+        execute_prepared(cur, key, sql, params)
+
+def get_pool_stats() -> Dict[str, Any]:
+    '''Счётчики попаданий и промахов пула соединений'''
+    with _pool_lock:
+        idle = sum(len(conns) for conns in _pool.values())
+    stats = dict(_pool_stats, idle=idle, max_size=DB_POOL_MAX_SIZE)
+    if _replicas:
+        stats['replica_lag'] = [round(state['lag'], 3) if state['healthy'] else None for state in _replicas.values()]
+    return stats
+
+class RequestTrace:
+    '''Замеры одного запроса: время по фазам, число SQL-операторов и строк'''
+    __slots__ = ('started', 'phases', 'queries', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries = 0
+        self.rows = 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+@contextlib.contextmanager
+def trace_phase(phase: str):
+    '''Учёт времени блока в фазе текущего запроса; без активного замера ничего не делает'''
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - started)
+
+def traced_cursor_class() -> type:
+    '''Класс курсора с замерами; создаётся при первом подключении, чтобы psycopg2 не импортировался на старте'''
+    cls = _cursor_classes.get('traced')
+    if cls is not None:
+        return cls
+    
+    class TracedCursor(psycopg2.extensions.cursor):
+        '''Курсор, учитывающий выполнение (sql) и разбор строк (fetch) в замерах запроса'''
+        def execute(self, query, vars=None):
+            trace = current_trace()
+            if trace is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                trace.queries += 1
+                trace.add('sql', time.perf_counter() - started)
+
+        def fetchone(self):
+            trace = current_trace()
+            if trace is None:
+                return super().fetchone()
+            started = time.perf_counter()
+            row = super().fetchone()
+            trace.add('fetch', time.perf_counter() - started)
+            if row is not None:
+                trace.rows += 1
+            return row
+
+        def fetchmany(self, size=None):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+
+        def fetchall(self):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchall()
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+    
+    _cursor_classes['traced'] = TracedCursor
+    return TracedCursor
+
+def add_server_timing(response: Dict[str, Any], trace: RequestTrace, total: float) -> None:
+    '''Заголовок Server-Timing с фазами запроса, доступный браузеру через CORS'''
+    metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in trace.phases.items()]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    headers = response.setdefault('headers', {})
+    headers['Server-Timing'] = ', '.join(metrics)
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+
+def instrument(handler: Callable) -> Callable:
+    '''Обёртка handler: одна строка JSON-лога на запрос (с выборкой по INSTRUMENTATION_SAMPLE_RATE)'''
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        if not cold_start and random.random() >= INSTRUMENTATION_SAMPLE_RATE:
+            return handler(event, context)
+        
+        trace = RequestTrace()
+        _trace_local.trace = trace
+        try:
+            response = handler(event, context)
+        finally:
+            _trace_local.trace = None
+        total = time.perf_counter() - trace.started
+        
+        body = response.get('body') or ''
+        status = response.get('statusCode', 200)
+        record = {
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'query': event.get('queryStringParameters') or {},
+            'status': status,
+            'cold_start': cold_start,
+            'duration_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()},
+            'sql_count': trace.queries,
+            'rows': trace.rows,
+            'response_bytes': len(body),
+            'pool': get_pool_stats()
+        }
+        if status >= 500:
+            record['error'] = body[:500]
+        print(json.dumps(record, ensure_ascii=False))
+        
+        if SERVER_TIMING_ENABLED:
+            add_server_timing(response, trace, total)
+        return response
+    return wrapper
+
+
+def dumps_json(data: Any) -> str:
+    '''Компактная сериализация ответа в UTF-8; при наличии orjson используется он'''
+    with trace_phase('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data).decode('utf-8')
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def response(status: int, body: str = '', headers: Optional[Dict[str, str]] = None, base64_encoded: bool = False) -> Dict[str, Any]:
+    '''Ответ шлюзу; заголовки дополняют или переопределяют JSON_HEADERS'''
+    return {
+        'statusCode': status,
+        'headers': dict(JSON_HEADERS, **headers) if headers else dict(JSON_HEADERS),
+        'body': body,
+        'isBase64Encoded': base64_encoded
+    }
+
+def json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return response(status, dumps_json(data), headers)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return json_response(status, {'error': message})
+
+def accepted_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    '''Лучшее из поддерживаемых сжатий по Accept-Encoding: br (если установлен brotli), затем gzip'''
+    accept = headers.get('Accept-Encoding', headers.get('accept-encoding', ''))
+    if not accept:
+        return None
+    weights = {}
+    for part in accept.lower().split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    
+    best, best_weight = None, 0.0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def compress_body(payload: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    '''Сжатие тела в gzip (через zlib, без импорта модуля gzip) или brotli'''
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY if level is None else level)
+    compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress(payload) + compressor.flush()
+
+def encoded_response(response: Dict[str, Any], payload: bytes, encoding: str) -> Dict[str, Any]:
+    '''Ответ со сжатым телом в base64; ETag получает суффикс кодировки, как у разных представлений'''
+    headers = response.setdefault('headers', {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    etag = headers.get('ETag')
+    if etag and etag.endswith('"'):
+        headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    response['body'] = base64.b64encode(payload).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_response(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Сжатие ответа по Accept-Encoding; короче COMPRESSION_MIN_BYTES, бинарные и уже сжатые не трогаются'''
+    body = response.get('body') or ''
+    headers = response.get('headers') or {}
+    if (not RESPONSE_COMPRESSION_ENABLED or response.get('isBase64Encoded') or 'Content-Encoding' in headers
+            or len(body) < COMPRESSION_MIN_BYTES):
+        return response
+    encoding = accepted_encoding(request.headers)
+    if encoding is None:
+        response.setdefault('headers', {})['Vary'] = 'Accept-Encoding'
+        return response
+    with trace_phase('compress'):
+        payload = compress_body(body.encode('utf-8'), encoding)
+    return encoded_response(response, payload, encoding)
+
+def options_response() -> Dict[str, Any]:
+    '''Ответ на CORS preflight; список методов берётся из зарегистрированных маршрутов'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': ', '.join(list(ROUTES) + ['OPTIONS']),
+            'Access-Control-Allow-Headers': CORS_ALLOW_HEADERS,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def normalize_phone(value: str) -> str:
+    '''Цифры телефона в том же виде, что и student_phone_digits (8XXXXXXXXXX и 9XXXXXXXXX -> 7XXXXXXXXXX)'''
+    digits = re.sub(r'\D', '', value)
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits
+
+class Request:
+    '''Запрос шлюза; соединение с БД берётся из пула только при первом обращении'''
+    __slots__ = ('event', 'method', 'query', 'headers', 'entity', 'conn', 'cur', 'read_conn', 'read_cur')
+
+    def __init__(self, event: Dict[str, Any]):
+        self.event = event
+        self.method = event.get('httpMethod', 'GET')
+        self.query = event.get('queryStringParameters') or {}
+        self.headers = event.get('headers') or {}
+        self.entity = self.query.get('entity', '')
+        self.conn = None
+        self.cur = None
+        self.read_conn = None
+        self.read_cur = None
+
+    def header(self, name: str) -> str:
+        return self.headers.get(name, self.headers.get(name.lower(), ''))
+
+    def json(self) -> Any:
+        return json.loads(self.event.get('body') or '{}')
+
+    def db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор запроса'''
+        if self.conn is None:
+            self.conn = get_db_connection()
+            self.cur = self.conn.cursor(cursor_factory=cursor_factory)
+        return self.conn, self.cur
+
+    def read_db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор только для чтения: реплика, если она есть и не отстаёт, иначе основная БД'''
+        if self.read_conn is None and self.conn is None:
+            self.read_conn = get_read_connection(self.header('X-Read-After-LSN'))
+            if self.read_conn is not None:
+                self.read_cur = self.read_conn.cursor(cursor_factory=cursor_factory)
+        if self.read_conn is not None:
+            return self.read_conn, self.read_cur
+        return self.db(cursor_factory)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            release_db_connection(self.conn, self.cur)
+            self.conn = None
+        if self.read_conn is not None:
+            release_db_connection(self.read_conn, self.read_cur)
+            self.read_conn = None
+
+def route(method: str, entity: Optional[str] = None, when: Optional[Callable[[Request], bool]] = None) -> Callable:
+    '''Регистрация обработчика метода; entity и when сужают маршрут, маршрут без условий - запасной'''
+    def register(func: Callable) -> Callable:
+        ROUTES.setdefault(method, []).append((entity, when, func))
+        return func
+    return register
+
+def find_route(request: Request) -> Optional[Callable]:
+    fallback = None
+    for entity, when, func in ROUTES.get(request.method, ()):
+        if entity is None and when is None:
+            fallback = fallback or func
+        elif (entity is None or entity == request.entity) and (when is None or when(request)):
+            return func
+    return fallback
+
+def serve(event: Dict[str, Any], guard: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+    '''Общий цикл запроса: preflight, 405, проверка доступа, обработчик, 500 и возврат соединения в пул'''
+    request = Request(event)
+    if request.method == 'OPTIONS':
+        return options_response()
+    
+    func = find_route(request)
+    if func is None:
+        return error_response(405, 'Method not allowed')
+    if guard is not None and not guard(request.headers):
+        return error_response(401, 'Unauthorized')
+    
+    try:
+        result = func(request)
+        if DATABASE_READ_URLS and request.method != 'GET' and request.conn is not None and result['statusCode'] < 300:
+            result = read_after_write(request, result)
+        return encode_response(request, result)
+    except Exception as e:
+        return error_response(500, str(e))
+    finally:
+        request.close()
+
+def make_http_session():
+    '''Keep-alive сессия провайдера с пулом соединений под параллельную отправку'''
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def http_session(provider: str):
+    '''Сессия провайдера создаётся при первой отправке, вместе с импортом requests'''
+    session = _http_sessions.get(provider)
+    if session is None:
+        with _http_lock:
+            session = _http_sessions.get(provider)
+            if session is None:
+                session = _http_sessions[provider] = make_http_session()
+    return session
+
+def get_executor():
+    '''Пул потоков для параллельной доставки; создаётся при первой многоканальной отправке'''
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        with _http_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=NOTIFY_MAX_WORKERS, thread_name_prefix='notify')
+    return _executor
+
+class DeliveryError(Exception):
+    '''Ошибка доставки уведомления провайдером'''
+
+def post_telegram_message(chat_id: str, message: str) -> None:
+    '''Отправка сообщения через Telegram Bot API; при неудаче бросает DeliveryError'''
     bot_token = os.environ.get('TELEGRAM_BOT_TOKEN')
     if not bot_token:
-        return False
+        raise DeliveryError('TELEGRAM_BOT_TOKEN is not configured')
     
-    url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
+    url = f'{TELEGRAM_API_URL}/bot{bot_token}/sendMessage'
     data = {
         'chat_id': chat_id,
         'text': message,
@@ -17,19 +655,19 @@ def send_telegram_notification(chat_id: str, message: str) -> bool:
     }
     
     try:
-        response = requests.post(url, json=data, timeout=10)
-        return response.status_code == 200
-    except Exception as e:
-        print(f'Telegram error: {e}')
-        return False
+        response = http_session('telegram').post(url, json=data, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    except requests.RequestException as e:
+        raise DeliveryError(f'Telegram request failed: {e}')
+    if response.status_code != 200:
+        raise DeliveryError(f'Telegram responded {response.status_code}: {response.text[:200]}')
 
-def send_email_notification(to_email: str, subject: str, message: str) -> bool:
-    '''Отправка уведомления на email через SendGrid API'''
+def post_email_message(to_email: str, subject: str, message: str) -> None:
+    '''Отправка письма через SendGrid API; при неудаче бросает DeliveryError'''
     sendgrid_api_key = os.environ.get('SENDGRID_API_KEY')
     if not sendgrid_api_key:
-        return False
+        raise DeliveryError('SENDGRID_API_KEY is not configured')
     
-    url = 'https://api.sendgrid.com/v3/mail/send'
+    url = f'{SENDGRID_API_URL}/v3/mail/send'
     headers = {
         'Authorization': f'Bearer {sendgrid_api_key}',
         'Content-Type': 'application/json'
@@ -48,104 +686,180 @@ def send_email_notification(to_email: str, subject: str, message: str) -> bool:
     }
     
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        return response.status_code == 202
+        response = http_session('sendgrid').post(url, headers=headers, json=data, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    except requests.RequestException as e:
+        raise DeliveryError(f'SendGrid request failed: {e}')
+    if response.status_code != 202:
+        raise DeliveryError(f'SendGrid responded {response.status_code}: {response.text[:200]}')
+
+def format_booking_message(booking: Dict[str, Any]) -> str:
+    '''Текст уведомления о новой заявке'''
+    return f'''
+<b>🔔 Новая заявка на занятие!</b>
+
+👤 <b>Ученик:</b> {booking.get('student_name', '')}
+📞 <b>Телефон:</b> {booking.get('student_phone', '')}
+📚 <b>Предмет:</b> {booking.get('selected_subject', '')}
+🕐 <b>Время:</b> {booking.get('selected_time', '')}
+'''
+
+def deliver(channel: str, recipient: str, booking: Dict[str, Any]) -> None:
+    '''Доставка уведомления о заявке в один канал'''
+    message = format_booking_message(booking)
+    if channel == 'telegram':
+        post_telegram_message(recipient, message)
+    elif channel == 'email':
+        email_message = message.replace('<b>', '<strong>').replace('</b>', '</strong>')
+        post_email_message(
+            recipient,
+            f"Новая заявка от {booking.get('student_name', '')}",
+            f'<html><body>{email_message}</body></html>'
+        )
+    else:
+        raise DeliveryError(f'Unknown channel: {channel}')
+
+def timed_deliver(channel: str, recipient: str, booking: Dict[str, Any]) -> Dict[str, Any]:
+    '''Доставка в канал с замером времени; ошибка возвращается в результате'''
+    started = time.perf_counter()
+    outcome = {'sent': True}
+    try:
+        deliver(channel, recipient, booking)
     except Exception as e:
-        print(f'Email error: {e}')
-        return False
+        outcome = {'sent': False, 'error': str(e)}
+    outcome['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return outcome
+
+def deliver_concurrently(jobs: List[Tuple[str, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    '''Параллельная доставка: общее время равно самому медленному каналу, а не сумме'''
+    with trace_phase('deliver'):
+        if len(jobs) <= 1:
+            return [timed_deliver(*job) for job in jobs]
+        return list(get_executor().map(lambda job: timed_deliver(*job), jobs))
+
+def backoff_delay(attempts: int) -> float:
+    '''Экспоненциальная задержка перед повтором с джиттером'''
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
 
+def claim_outbox_batch(cur, conn) -> List[Tuple]:
+    '''Захват пачки готовых к отправке уведомлений с арендой на время отправки'''
+    cur.execute(
+        """
+        UPDATE t_p90313977_education_center_web.notification_outbox
+        SET attempts = attempts + 1,
+            next_attempt_at = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        WHERE id IN (
+            SELECT id FROM t_p90313977_education_center_web.notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, channel, recipient, payload, attempts
+        """,
+        (OUTBOX_LEASE_SECONDS, OUTBOX_BATCH_SIZE)
+    )
+    batch = cur.fetchall()
+    conn.commit()
+    return batch
+
+def dispatch_outbox(cur, conn) -> Dict[str, int]:
+    '''Отправка накопленных уведомлений пачками с повторами и dead-letter'''
+    import psycopg2.extras
+    
+    stats = {'sent': 0, 'retried': 0, 'dead': 0}
+    deadline = time.monotonic() + OUTBOX_TIME_BUDGET
+    
+    while time.monotonic() < deadline:
+        batch = claim_outbox_batch(cur, conn)
+        if not batch:
+            break
+        
+        deliveries = deliver_concurrently([(channel, recipient, payload) for _, channel, recipient, payload, _ in batch])
+        outcomes = []
+        for (outbox_id, _, _, _, attempts), delivery in zip(batch, deliveries):
+            if delivery['sent']:
+                outcomes.append((outbox_id, 'sent', 0.0, None))
+                stats['sent'] += 1
+            elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                outcomes.append((outbox_id, 'dead', 0.0, delivery['error']))
+                stats['dead'] += 1
+            else:
+                outcomes.append((outbox_id, 'pending', backoff_delay(attempts), delivery['error']))
+                stats['retried'] += 1
+        
+        psycopg2.extras.execute_values(
+            cur,
+            """
+            UPDATE t_p90313977_education_center_web.notification_outbox AS o
+            SET status = v.status,
+                next_attempt_at = CURRENT_TIMESTAMP + v.delay * INTERVAL '1 second',
+                last_error = v.error,
+                sent_at = CASE WHEN v.status = 'sent' THEN CURRENT_TIMESTAMP END
+            FROM (VALUES %s) AS v(id, status, delay, error)
+            WHERE o.id = v.id
+            """,
+            outcomes,
+            template='(%s::bigint, %s::varchar, %s::float8, %s::text)'
+        )
+        conn.commit()
+        
+        if len(batch) < OUTBOX_BATCH_SIZE:
+            break
+    
+    return stats
+
+@instrument
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Отправка уведомлений о новой заявке
     Принимает: booking_data с информацией о заявке, notification_settings
     Возвращает: результат отправки уведомлений
+    POST ?action=dispatch - отправка очереди notification_outbox (вызывается по расписанию, X-Dispatch-Secret)
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    return serve(event)
+
+def check_dispatch_secret(headers: Dict[str, Any]) -> bool:
+    '''Общий секрет планировщика OUTBOX_DISPATCH_SECRET; без настроенного секрета диспетчер закрыт'''
+    secret = headers.get('X-Dispatch-Secret', headers.get('x-dispatch-secret', ''))
+    if not OUTBOX_DISPATCH_SECRET or not secret.isascii():
+        return False
+    return hmac.compare_digest(secret, OUTBOX_DISPATCH_SECRET)
+
+@route('POST', when=lambda request: request.query.get('action') == 'dispatch')
+def dispatch(request: Request) -> Dict[str, Any]:
+    '''Запуск диспетчера очереди уведомлений'''
+    if not check_dispatch_secret(request.headers):
+        return error_response(401, 'Unauthorized')
+    conn, cur = request.db()
+    stats = dispatch_outbox(cur, conn)
+    return json_response(200, {'success': True, 'dispatched': stats})
+
+@route('POST')
+def notify(request: Request) -> Dict[str, Any]:
+    '''Прямая отправка уведомления о заявке по включённым каналам'''
+    body_data = request.json()
     
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+    booking = body_data.get('booking', {})
+    settings = body_data.get('settings', {})
     
-    try:
-        body_data = json.loads(event.get('body', '{}'))
-        
-        booking = body_data.get('booking', {})
-        settings = body_data.get('settings', {})
-        
-        student_name = booking.get('student_name', '')
-        student_phone = booking.get('student_phone', '')
-        selected_subject = booking.get('selected_subject', '')
-        selected_time = booking.get('selected_time', '')
-        
-        message = f'''
-<b>🔔 Новая заявка на занятие!</b>
-
-👤 <b>Ученик:</b> {student_name}
-📞 <b>Телефон:</b> {student_phone}
-📚 <b>Предмет:</b> {selected_subject}
-🕐 <b>Время:</b> {selected_time}
-'''
-        
-        results = {
-            'telegram': False,
-            'email': False
-        }
-        
-        if settings.get('telegram', {}).get('enabled'):
-            telegram_id = settings.get('telegram', {}).get('value')
-            if telegram_id:
-                results['telegram'] = send_telegram_notification(telegram_id, message)
-        
-        if settings.get('email', {}).get('enabled'):
-            email = settings.get('email', {}).get('value')
-            if email:
-                email_message = message.replace('<b>', '<strong>').replace('</b>', '</strong>')
-                results['email'] = send_email_notification(
-                    email,
-                    f'Новая заявка от {student_name}',
-                    f'<html><body>{email_message}</body></html>'
-                )
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'success': True,
-                'results': results
-            }),
-            'isBase64Encoded': False
-        }
+    results = {
+        'telegram': {'sent': False, 'skipped': True},
+        'email': {'sent': False, 'skipped': True}
+    }
     
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    jobs = []
+    for channel in results:
+        channel_settings = settings.get(channel, {})
+        if channel_settings.get('enabled') and channel_settings.get('value'):
+            jobs.append((channel, channel_settings['value'], booking))
+    
+    for job, outcome in zip(jobs, deliver_concurrently(jobs)):
+        results[job[0]] = outcome
+        if not outcome['sent']:
+            print(f"{job[0]} error: {outcome['error']}")
+    
+    return json_response(200, {
+        'success': True,
+        'results': results
+    })
@@ -1,109 +1,935 @@
+import base64
+import collections
+import contextlib
+import datetime
+import functools
+import hashlib
+import importlib.util
 import json
+import math
 import os
-import psycopg2
-from typing import Dict, Any
+import random
+import re
+import sys
+import threading
+import time
+import types
+import weakref
+import zlib
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
+class LazyModule(types.ModuleType):
+    '''Заместитель модуля: настоящий импорт выполняется при первом обращении к атрибуту'''
+    def __getattr__(self, attr: str) -> Any:
+        # import_module берёт блокировку импорта модуля, и потоки, первыми обратившиеся к нему одновременно,
+        # ждут один импорт. LazyLoader до Python 3.12.3 отдавал второму потоку недозагруженный модуль
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name: str):
+    '''Модуль, который импортируется при первом обращении к атрибуту; None, если пакет не установлен'''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+psycopg2 = lazy_import('psycopg2')
+orjson = lazy_import('orjson')
+brotli = lazy_import('brotli')
+
+FUNCTION_NAME = 'submit-booking'
+CORS_ALLOW_HEADERS = 'Content-Type, Idempotency-Key'
+JSON_HEADERS = {'Access-Control-Allow-Origin': '*', 'Content-Type': 'application/json'}
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+DB_POOL_CHECK_INTERVAL = float(os.environ.get('DB_POOL_CHECK_INTERVAL', '30'))
+DB_PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', '1') == '1'
+DB_PREPARED_MAX = int(os.environ.get('DB_PREPARED_MAX', '64'))
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '1'))
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '0') == '1'
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()]
+DB_READ_SELECTION = os.environ.get('DB_READ_SELECTION', 'round_robin')
+DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', '5'))
+DB_REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', '5'))
+DB_READ_YOUR_WRITES_SECONDS = float(os.environ.get('DB_READ_YOUR_WRITES_SECONDS', '10'))
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+SCHEMA = 't_p90313977_education_center_web'
+DEDUP_WINDOW_SECONDS = int(os.environ.get('BOOKING_DEDUP_WINDOW_SECONDS', '600'))
+RATE_LIMIT_ENABLED = os.environ.get('BOOKING_RATE_LIMIT', '1') == '1'
+RATE_LIMIT_IP = (float(os.environ.get('RATE_LIMIT_IP_BURST', '20')), float(os.environ.get('RATE_LIMIT_IP_PER_MINUTE', '5')))
+RATE_LIMIT_PHONE = (float(os.environ.get('RATE_LIMIT_PHONE_BURST', '5')), float(os.environ.get('RATE_LIMIT_PHONE_PER_MINUTE', '1')))
+GUARD_CACHE_SIZE = int(os.environ.get('BOOKING_GUARD_CACHE_SIZE', '4096'))
+GUARD_CLEANUP_PROBABILITY = float(os.environ.get('BOOKING_GUARD_CLEANUP_PROBABILITY', '0.01'))
+BOOKING_HORIZON_DAYS = int(os.environ.get('BOOKING_HORIZON_DAYS', '60'))
+
+_pool: Dict[str, List[Tuple[Any, float]]] = {}
+_pool_urls: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+_pool_stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'prepares': 0, 'replica_reads': 0, 'primary_reads': 0}
+_replicas = {url: {'lag': 0.0, 'latency': None, 'healthy': True, 'checked_at': float('-inf')} for url in DATABASE_READ_URLS}
+_read_primary_until = 0.0
+_replica_turn = 0
+_prepared: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_trace_local = threading.local()
+_cold_start = True
+_cursor_classes: Dict[str, type] = {}
+ROUTES: Dict[str, List[Tuple[Optional[str], Optional[Callable], Callable]]] = {}
+
+def _is_connection_alive(conn, released_at: float) -> bool:
+    '''Проверка соединения из пула; долго простаивавшие проверяются запросом'''
+    if conn.closed:
+        return False
+    if time.monotonic() - released_at < DB_POOL_CHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        conn.close()
+        return False
+
+def get_db_connection(url: Optional[str] = None):
+    '''Получение подключения к базе данных из пула контейнера; url - реплика для чтения, по умолчанию основная БД'''
+    with trace_phase('connect'):
+        return _acquire_db_connection(url or os.environ.get('DATABASE_URL'))
+
+def _acquire_db_connection(url: str):
+    '''Соединение из пула адреса либо новое подключение, если свободных нет'''
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise RuntimeError('Database connection pool exhausted')
+    try:
+        while True:
+            with _pool_lock:
+                idle = _pool.get(url)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if _is_connection_alive(conn, released_at):
+                _pool_stats['hits'] += 1
+                return conn
+            _pool_stats['reconnects'] += 1
+        _pool_stats['misses'] += 1
+        conn = psycopg2.connect(url)
+        conn.autocommit = False
+        conn.cursor_factory = traced_cursor_class()
+        with _pool_lock:
+            _prepared[conn] = {}
+            _pool_urls[conn] = url
+        return conn
+    except Exception:
+        _pool_slots.release()
+        raise
+
+def release_db_connection(conn, cur=None) -> None:
+    '''Возврат подключения в пул; сломанные соединения закрываются'''
+    try:
+        if cur is not None and not cur.closed:
+            cur.close()
+        if not conn.closed:
+            conn.rollback()
+            with _pool_lock:
+                idle = _pool.setdefault(_pool_urls.get(conn, ''), [])
+                if len(idle) < DB_POOL_MAX_SIZE:
+                    idle.append((conn, time.monotonic()))
+                    return
+            conn.close()
+    except psycopg2.Error:
+        conn.close()
+    finally:
+        _pool_slots.release()
+
+def get_read_connection(min_lsn: str = ''):
+    '''Соединение с репликой, отстающей не больше DB_REPLICA_MAX_LAG_SECONDS и догнавшей min_lsn; None - читать с основной БД'''
+    if not DATABASE_READ_URLS:
+        return None
+    if time.monotonic() < _read_primary_until:
+        _pool_stats['primary_reads'] += 1
+        return None
+    for url in replica_order():
+        try:
+            conn = get_db_connection(url)
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+            continue
+        try:
+            if replica_ready(conn, url, min_lsn):
+                # Проверка реплики не оставляет открытую транзакцию: первый запрос обработчика можно повторить
+                conn.rollback()
+                _pool_stats['replica_reads'] += 1
+                return conn
+        except psycopg2.Error:
+            _replicas[url].update(healthy=False, checked_at=time.monotonic())
+        release_db_connection(conn)
+    _pool_stats['primary_reads'] += 1
+    return None
+
+def replica_order() -> List[str]:
+    '''Реплики-кандидаты: исправные и те, кого пора перепроверить; по кругу или по задержке проверки'''
+    now = time.monotonic()
+    candidates = [url for url in DATABASE_READ_URLS
+                  if _replicas[url]['healthy'] or now - _replicas[url]['checked_at'] >= DB_REPLICA_CHECK_INTERVAL]
+    if len(candidates) < 2:
+        return candidates
+    if DB_READ_SELECTION == 'least_latency':
+        return sorted(candidates, key=lambda url: _replicas[url]['latency'])
+    global _replica_turn
+    with _pool_lock:
+        _replica_turn = turn = (_replica_turn + 1) % len(candidates)
+    return candidates[turn:] + candidates[:turn]
+
+def replica_ready(conn, url: str, min_lsn: str) -> bool:
+    '''Отставание реплики проверяется раз в DB_REPLICA_CHECK_INTERVAL; min_lsn (X-Read-After-LSN) - при каждом чтении'''
+    state = _replicas[url]
+    now = time.monotonic()
+    with conn.cursor() as cur:
+        if now - state['checked_at'] >= DB_REPLICA_CHECK_INTERVAL:
+            started = time.perf_counter()
+            # Без новых записей replay_timestamp стареет, поэтому реплика, проигравшая всё полученное, не отстаёт
+            cur.execute(
+                """
+                SELECT CASE
+                    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                END
+                """
+            )
+            lag = float(cur.fetchone()[0])
+            latency = time.perf_counter() - started
+            state.update(
+                lag=lag,
+                latency=latency if state['latency'] is None else state['latency'] * 0.7 + latency * 0.3,
+                healthy=lag <= DB_REPLICA_MAX_LAG_SECONDS,
+                checked_at=now
+            )
+        if not state['healthy']:
+            return False
+        if not min_lsn:
+            return True
+        try:
+            cur.execute('SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, true)', (min_lsn,))
+        except psycopg2.DataError:
+            conn.rollback()
+            return True
+        return cur.fetchone()[0]
+
+def read_after_write(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''После записи чтения контейнера идут в основную БД DB_READ_YOUR_WRITES_SECONDS, а клиент получает LSN записи для X-Read-After-LSN'''
+    global _read_primary_until
+    _read_primary_until = time.monotonic() + DB_READ_YOUR_WRITES_SECONDS
+    with request.conn.cursor() as cur:
+        cur.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cur.fetchone()[0]
+    headers = response['headers']
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, X-Read-After-LSN' if exposed else 'X-Read-After-LSN'
+    headers['X-Read-After-LSN'] = lsn
+    return response
+
+def _positional_sql(sql: str) -> str:
+    '''Плейсхолдеры %s в нумерованные $1..$n для PREPARE'''
+    parts = sql.split('%s')
+    return parts[0] + ''.join(f'${number}{part}' for number, part in enumerate(parts[1:], 1))
+
+def execute_prepared(cur, key: Tuple, sql: str, params=()) -> None:
+    '''Выполнение через prepared statement соединения: PREPARE при первом обращении по ключу, дальше EXECUTE'''
+    statements = _prepared.get(cur.connection) if DB_PREPARED_STATEMENTS else None
+    if statements is None:
+        cur.execute(sql, params or None)
+        return
+    # Состояние до PREPARE: повтор безопасен, только если этот запрос открывает транзакцию
+    idle = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    name = statements.get(key)
+    if name is None:
+        if len(statements) >= DB_PREPARED_MAX:
+            cur.execute(sql, params or None)
+            return
+        name = f'stmt_{len(statements) + 1}'
+        cur.execute(f'PREPARE {name} AS {_positional_sql(sql)}')
+        statements[key] = name
+        _pool_stats['prepares'] += 1
+    try:
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f'EXECUTE {name}')
+    except psycopg2.Error as error:
+        # 0A000 - план SELECT * устарел после ALTER TABLE; в начале транзакции запрос готовится заново,
+        # иначе соединение закрывается, чтобы в пул не вернулись устаревшие prepared statements
+        if error.pgcode != '0A000':
+            raise
+        if not idle:
+            _prepared.pop(cur.connection, None)
+            cur.connection.close()
+            raise
+        cur.connection.rollback()
+        cur.execute('DEALLOCATE ALL')
+        statements.clear()
+        execute_prepared(cur, key, sql, params)
+
+def get_pool_stats() -> Dict[str, Any]:
+    '''Счётчики попаданий и промахов пула соединений'''
+    with _pool_lock:
+        idle = sum(len(conns) for conns in _pool.values())
+    stats = dict(_pool_stats, idle=idle, max_size=DB_POOL_MAX_SIZE)
+    if _replicas:
+        stats['replica_lag'] = [round(state['lag'], 3) if state['healthy'] else None for state in _replicas.values()]
+    return stats
+
+class RequestTrace:
+    '''Замеры одного запроса: время по фазам, число SQL-операторов и строк'''
+    __slots__ = ('started', 'phases', 'queries', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.queries = 0
+        self.rows = 0
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+@contextlib.contextmanager
+def trace_phase(phase: str):
+    '''Учёт времени блока в фазе текущего запроса; без активного замера ничего не делает'''
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - started)
+
+def traced_cursor_class() -> type:
+    '''Класс курсора с замерами; создаётся при первом подключении, чтобы psycopg2 не импортировался на старте'''
+    cls = _cursor_classes.get('traced')
+    if cls is not None:
+        return cls
+    
+    class TracedCursor(psycopg2.extensions.cursor):
+        '''Курсор, учитывающий выполнение (sql) и разбор строк (fetch) в замерах запроса'''
+        def execute(self, query, vars=None):
+            trace = current_trace()
+            if trace is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                trace.queries += 1
+                trace.add('sql', time.perf_counter() - started)
+
+        def fetchone(self):
+            trace = current_trace()
+            if trace is None:
+                return super().fetchone()
+            started = time.perf_counter()
+            row = super().fetchone()
+            trace.add('fetch', time.perf_counter() - started)
+            if row is not None:
+                trace.rows += 1
+            return row
+
+        def fetchmany(self, size=None):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchmany(self.arraysize if size is None else size)
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+
+        def fetchall(self):
+            trace = current_trace()
+            started = time.perf_counter()
+            rows = super().fetchall()
+            if trace is not None:
+                trace.add('fetch', time.perf_counter() - started)
+                trace.rows += len(rows)
+            return rows
+    
+    _cursor_classes['traced'] = TracedCursor
+    return TracedCursor
+
+def add_server_timing(response: Dict[str, Any], trace: RequestTrace, total: float) -> None:
+    '''Заголовок Server-Timing с фазами запроса, доступный браузеру через CORS'''
+    metrics = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in trace.phases.items()]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    headers = response.setdefault('headers', {})
+    headers['Server-Timing'] = ', '.join(metrics)
+    exposed = headers.get('Access-Control-Expose-Headers')
+    headers['Access-Control-Expose-Headers'] = f'{exposed}, Server-Timing' if exposed else 'Server-Timing'
+
+def instrument(handler: Callable) -> Callable:
+    '''Обёртка handler: одна строка JSON-лога на запрос (с выборкой по INSTRUMENTATION_SAMPLE_RATE)'''
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        global _cold_start
+        cold_start, _cold_start = _cold_start, False
+        if not cold_start and random.random() >= INSTRUMENTATION_SAMPLE_RATE:
+            return handler(event, context)
+        
+        trace = RequestTrace()
+        _trace_local.trace = trace
+        try:
+            response = handler(event, context)
+        finally:
+            _trace_local.trace = None
+        total = time.perf_counter() - trace.started
+        
+        body = response.get('body') or ''
+        status = response.get('statusCode', 200)
+        record = {
+            'function': FUNCTION_NAME,
+            'request_id': getattr(context, 'request_id', None),
+            'method': event.get('httpMethod'),
+            'query': event.get('queryStringParameters') or {},
+            'status': status,
+            'cold_start': cold_start,
+            'duration_ms': round(total * 1000, 3),
+            'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in trace.phases.items()},
+            'sql_count': trace.queries,
+            'rows': trace.rows,
+            'response_bytes': len(body),
+            'pool': get_pool_stats()
+        }
+        if status >= 500:
+            record['error'] = body[:500]
+        print(json.dumps(record, ensure_ascii=False))
+        
+        if SERVER_TIMING_ENABLED:
+            add_server_timing(response, trace, total)
+        return response
+    return wrapper
+
+
+def dumps_json(data: Any) -> str:
+    '''Компактная сериализация ответа в UTF-8; при наличии orjson используется он'''
+    with trace_phase('serialize'):
+        if orjson is not None:
+            return orjson.dumps(data).decode('utf-8')
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def response(status: int, body: str = '', headers: Optional[Dict[str, str]] = None, base64_encoded: bool = False) -> Dict[str, Any]:
+    '''Ответ шлюзу; заголовки дополняют или переопределяют JSON_HEADERS'''
+    return {
+        'statusCode': status,
+        'headers': dict(JSON_HEADERS, **headers) if headers else dict(JSON_HEADERS),
+        'body': body,
+        'isBase64Encoded': base64_encoded
+    }
+
+def json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return response(status, dumps_json(data), headers)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    return json_response(status, {'error': message})
+
+def accepted_encoding(headers: Dict[str, Any]) -> Optional[str]:
+    '''Лучшее из поддерживаемых сжатий по Accept-Encoding: br (если установлен brotli), затем gzip'''
+    accept = headers.get('Accept-Encoding', headers.get('accept-encoding', ''))
+    if not accept:
+        return None
+    weights = {}
+    for part in accept.lower().split(','):
+        name, _, params = part.partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+    
+    best, best_weight = None, 0.0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def compress_body(payload: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    '''Сжатие тела в gzip (через zlib, без импорта модуля gzip) или brotli'''
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY if level is None else level)
+    compressor = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)
+    return compressor.compress(payload) + compressor.flush()
+
+def encoded_response(response: Dict[str, Any], payload: bytes, encoding: str) -> Dict[str, Any]:
+    '''Ответ со сжатым телом в base64; ETag получает суффикс кодировки, как у разных представлений'''
+    headers = response.setdefault('headers', {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    etag = headers.get('ETag')
+    if etag and etag.endswith('"'):
+        headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    response['body'] = base64.b64encode(payload).decode('ascii')
+    response['isBase64Encoded'] = True
+    return response
+
+def encode_response(request: 'Request', response: Dict[str, Any]) -> Dict[str, Any]:
+    '''Сжатие ответа по Accept-Encoding; короче COMPRESSION_MIN_BYTES, бинарные и уже сжатые не трогаются'''
+    body = response.get('body') or ''
+    headers = response.get('headers') or {}
+    if (not RESPONSE_COMPRESSION_ENABLED or response.get('isBase64Encoded') or 'Content-Encoding' in headers
+            or len(body) < COMPRESSION_MIN_BYTES):
+        return response
+    encoding = accepted_encoding(request.headers)
+    if encoding is None:
+        response.setdefault('headers', {})['Vary'] = 'Accept-Encoding'
+        return response
+    with trace_phase('compress'):
+        payload = compress_body(body.encode('utf-8'), encoding)
+    return encoded_response(response, payload, encoding)
+
+def options_response() -> Dict[str, Any]:
+    '''Ответ на CORS preflight; список методов берётся из зарегистрированных маршрутов'''
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': ', '.join(list(ROUTES) + ['OPTIONS']),
+            'Access-Control-Allow-Headers': CORS_ALLOW_HEADERS,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def normalize_phone(value: str) -> str:
+    '''Цифры телефона в том же виде, что и student_phone_digits (8XXXXXXXXXX и 9XXXXXXXXX -> 7XXXXXXXXXX)'''
+    digits = re.sub(r'\D', '', value)
+    if len(digits) == 11 and digits[0] == '8':
+        return '7' + digits[1:]
+    if len(digits) == 10 and digits[0] == '9':
+        return '7' + digits
+    return digits
+
+class Request:
+    '''Запрос шлюза; соединение с БД берётся из пула только при первом обращении'''
+    __slots__ = ('event', 'method', 'query', 'headers', 'entity', 'conn', 'cur', 'read_conn', 'read_cur')
+
+    def __init__(self, event: Dict[str, Any]):
+        self.event = event
+        self.method = event.get('httpMethod', 'GET')
+        self.query = event.get('queryStringParameters') or {}
+        self.headers = event.get('headers') or {}
+        self.entity = self.query.get('entity', '')
+        self.conn = None
+        self.cur = None
+        self.read_conn = None
+        self.read_cur = None
+
+    def header(self, name: str) -> str:
+        return self.headers.get(name, self.headers.get(name.lower(), ''))
+
+    def json(self) -> Any:
+        return json.loads(self.event.get('body') or '{}')
+
+    def db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор запроса'''
+        if self.conn is None:
+            self.conn = get_db_connection()
+            self.cur = self.conn.cursor(cursor_factory=cursor_factory)
+        return self.conn, self.cur
+
+    def read_db(self, cursor_factory: Optional[type] = None) -> Tuple[Any, Any]:
+        '''Соединение и курсор только для чтения: реплика, если она есть и не отстаёт, иначе основная БД'''
+        if self.read_conn is None and self.conn is None:
+            self.read_conn = get_read_connection(self.header('X-Read-After-LSN'))
+            if self.read_conn is not None:
+                self.read_cur = self.read_conn.cursor(cursor_factory=cursor_factory)
+        if self.read_conn is not None:
+            return self.read_conn, self.read_cur
+        return self.db(cursor_factory)
+
+    def close(self) -> None:
+        if self.conn is not None:
+            release_db_connection(self.conn, self.cur)
+            self.conn = None
+        if self.read_conn is not None:
+            release_db_connection(self.read_conn, self.read_cur)
+            self.read_conn = None
+
+def route(method: str, entity: Optional[str] = None, when: Optional[Callable[[Request], bool]] = None) -> Callable:
+    '''Регистрация обработчика метода; entity и when сужают маршрут, маршрут без условий - запасной'''
+    def register(func: Callable) -> Callable:
+        ROUTES.setdefault(method, []).append((entity, when, func))
+        return func
+    return register
+
+def find_route(request: Request) -> Optional[Callable]:
+    fallback = None
+    for entity, when, func in ROUTES.get(request.method, ()):
+        if entity is None and when is None:
+            fallback = fallback or func
+        elif (entity is None or entity == request.entity) and (when is None or when(request)):
+            return func
+    return fallback
+
+def serve(event: Dict[str, Any], guard: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+    '''Общий цикл запроса: preflight, 405, проверка доступа, обработчик, 500 и возврат соединения в пул'''
+    request = Request(event)
+    if request.method == 'OPTIONS':
+        return options_response()
+    
+    func = find_route(request)
+    if func is None:
+        return error_response(405, 'Method not allowed')
+    if guard is not None and not guard(request.headers):
+        return error_response(401, 'Unauthorized')
+    
+    try:
+        result = func(request)
+        if DATABASE_READ_URLS and request.method != 'GET' and request.conn is not None and result['statusCode'] < 300:
+            result = read_after_write(request, result)
+        return encode_response(request, result)
+    except Exception as e:
+        return error_response(500, str(e))
+    finally:
+        request.close()
+
+class TtlLru:
+    '''Компактный LRU контейнера с временем жизни записей'''
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.items: 'collections.OrderedDict[str, Tuple[Any, float]]' = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            if item[1] <= time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+_recent_bookings = TtlLru(GUARD_CACHE_SIZE)
+_local_buckets = TtlLru(GUARD_CACHE_SIZE)
+
+@instrument
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Сохранение заявки на занятие от ученика
     Принимает: student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time
-    Возвращает: успешное сохранение или ошибку
+    либо schedule_id и slot_date (YYYY-MM-DD) - запись на занятие из расписания с учётом вместимости
+    Возвращает: успешное сохранение или ошибку; 409, если на занятие в этот день мест нет
+    Уведомления по включённым каналам ставятся в notification_outbox в той же транзакции
+    Повтор в пределах BOOKING_DEDUP_WINDOW_SECONDS (по заголовку Idempotency-Key либо телефону, предмету и времени)
+    возвращает исходный booking_id; частые отправки с одного IP или телефона получают 429
     '''
-    method: str = event.get('httpMethod', 'GET')
-    
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    return serve(event)
+
+@route('POST')
+def submit_booking(request: Request) -> Dict[str, Any]:
+    '''Сохранение заявки и постановка уведомлений в очередь'''
+    body_data = request.json()
     
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+    student_name = body_data.get('student_name', '')
+    student_phone = body_data.get('student_phone', '')
+    student_email = body_data.get('student_email', '')
+    selected_teacher = body_data.get('selected_teacher', '')
+    selected_subject = body_data.get('selected_subject', '')
+    selected_time = body_data.get('selected_time', '')
     
-    try:
-        body_data = json.loads(event.get('body', '{}'))
-        
-        student_name = body_data.get('student_name', '')
-        student_phone = body_data.get('student_phone', '')
-        student_email = body_data.get('student_email', '')
-        selected_teacher = body_data.get('selected_teacher', '')
-        selected_subject = body_data.get('selected_subject', '')
-        selected_time = body_data.get('selected_time', '')
-        
-        if not student_name or not student_phone:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Content-Type': 'application/json'
-                },
-                'body': json.dumps({'error': 'Student name and phone are required'}),
-                'isBase64Encoded': False
-            }
-        
-        db_url = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(db_url)
-        cur = conn.cursor()
-        
-        query = """
-            INSERT INTO t_p90313977_education_center_web.student_bookings 
-            (student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+    if not student_name or not student_phone:
+        return error_response(400, 'Student name and phone are required')
+    
+    slot = None
+    if 'schedule_id' in body_data or 'slot_date' in body_data:
+        slot = parse_slot(body_data.get('schedule_id'), body_data.get('slot_date'))
+        if slot is None:
+            return error_response(400, f'schedule_id and slot_date within {BOOKING_HORIZON_DAYS} days are required')
+    
+    phone_digits = normalize_phone(student_phone)
+    slot_key = f'{slot[0]}@{slot[1].isoformat()}' if slot else selected_time
+    key = idempotency_key(request.header('Idempotency-Key'), phone_digits, selected_subject, slot_key)
+    booking_id = _recent_bookings.get(key)
+    if booking_id is not None:
+        return duplicate_response(booking_id)
+    
+    buckets = rate_limit_buckets(client_ip(request), phone_digits)
+    retry_after = take_local_tokens(buckets)
+    if retry_after:
+        return rate_limited_response(retry_after)
+    
+    conn, cur = request.db()
+    
+    retry_after = take_db_tokens(cur, buckets)
+    if retry_after:
+        conn.rollback()
+        return rate_limited_response(retry_after)
+    
+    slot_id = None
+    if slot:
+        seat = claim_slot(cur, *slot)
+        if seat is None:
+            # Повтор заявки, занявшей последнее место, получает исходный booking_id, а не 409
+            booking_id = find_recent_booking(cur, key)
+            if booking_id is not None:
+                conn.rollback()
+                _recent_bookings.set(key, booking_id, DEDUP_WINDOW_SECONDS)
+                return duplicate_response(booking_id)
+            # Попытка записи на занятый слот тоже расходует токены корзин
+            rejected = slot_unavailable_response(cur, *slot)
+            conn.commit()
+            return rejected
+        slot_id, selected_subject, selected_teacher, selected_time = seat
+    
+    query = f"""
+        WITH claim AS (
+            INSERT INTO {SCHEMA}.booking_idempotency AS i (idempotency_key, booking_id, created_at)
+            VALUES (%s, nextval('{SCHEMA}.student_bookings_id_seq'), CURRENT_TIMESTAMP)
+            ON CONFLICT (idempotency_key) DO UPDATE
+            SET booking_id = EXCLUDED.booking_id, created_at = EXCLUDED.created_at
+            WHERE i.created_at <= CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+            RETURNING booking_id
+        ), booking AS (
+            INSERT INTO {SCHEMA}.student_bookings 
+            (id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status, slot_id)
+            SELECT claim.booking_id, %s, %s, %s, %s, %s, %s, %s, %s
+            FROM claim
             RETURNING id
-        """
-        
-        cur.execute(query, (
-            student_name,
-            student_phone,
-            student_email,
-            selected_teacher,
-            selected_subject,
-            selected_time,
-            'new'
-        ))
-        
-        booking_id = cur.fetchone()[0]
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 201,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({
-                'success': True,
-                'booking_id': booking_id,
-                'message': 'Заявка успешно отправлена'
-            }),
-            'isBase64Encoded': False
-        }
+        ), outbox AS (
+            INSERT INTO {SCHEMA}.notification_outbox (booking_id, channel, recipient, payload)
+            SELECT booking.id, s.notification_type, s.value, %s::jsonb || jsonb_build_object('booking_id', booking.id)
+            FROM booking, {SCHEMA}.notification_settings s
+            WHERE s.is_enabled AND COALESCE(s.value, '') <> ''
+        )
+        SELECT id, true FROM booking
+        UNION ALL
+        SELECT booking_id, false FROM {SCHEMA}.booking_idempotency
+        WHERE idempotency_key = %s AND NOT EXISTS (SELECT 1 FROM claim)
+    """
     
-    except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Content-Type': 'application/json'
-            },
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+    notification_payload = json.dumps({
+        'student_name': student_name,
+        'student_phone': student_phone,
+        'student_email': student_email,
+        'selected_teacher': selected_teacher,
+        'selected_subject': selected_subject,
+        'selected_time': selected_time
+    })
+    
+    execute_prepared(cur, ('bookings', 'insert'), query, (
+        key,
+        DEDUP_WINDOW_SECONDS,
+        student_name,
+        student_phone,
+        student_email,
+        selected_teacher,
+        selected_subject,
+        selected_time,
+        'new',
+        slot_id,
+        notification_payload,
+        key
+    ))
+    
+    row = cur.fetchone()
+    if row is None or not row[1]:
+        conn.rollback()
+        if row is None:
+            row = find_claimed_booking(cur, key)
+        _recent_bookings.set(key, row[0], DEDUP_WINDOW_SECONDS)
+        return duplicate_response(row[0])
+    
+    booking_id = row[0]
+    if random.random() < GUARD_CLEANUP_PROBABILITY:
+        cleanup_guards(cur)
+    conn.commit()
+    _recent_bookings.set(key, booking_id, DEDUP_WINDOW_SECONDS)
+    
+    return json_response(201, {
+        'success': True,
+        'booking_id': booking_id,
+        'message': 'Заявка успешно отправлена'
+    })
+
+def idempotency_key(header_key: str, phone_digits: str, subject: str, slot: str) -> str:
+    '''Ключ из заголовка клиента либо из телефона, предмета и времени заявки'''
+    if header_key:
+        source = 'header:' + header_key
+    else:
+        source = f'booking:{phone_digits}|{subject.strip().lower()}|{slot.strip()}'
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def parse_slot(schedule_id: Any, slot_date: Any) -> Optional[Tuple[int, datetime.date]]:
+    '''Занятие расписания и день записи; None - не заданы или день вне [сегодня, сегодня + BOOKING_HORIZON_DAYS]'''
+    # Только ASCII-цифры: isdigit() пропускает '²', на котором int() падает; id должен помещаться в integer
+    if isinstance(schedule_id, str) and schedule_id.isascii() and schedule_id.isdecimal():
+        schedule_id = int(schedule_id)
+    if not isinstance(schedule_id, int) or isinstance(schedule_id, bool) or not isinstance(slot_date, str):
+        return None
+    if not 0 < schedule_id <= 2147483647:
+        return None
+    try:
+        day = datetime.date.fromisoformat(slot_date)
+    except ValueError:
+        return None
+    today = datetime.date.today()
+    if not today <= day <= today + datetime.timedelta(days=BOOKING_HORIZON_DAYS):
+        return None
+    return schedule_id, day
+
+def claim_slot(cur, schedule_id: int, slot_date: datetime.date) -> Optional[Tuple[int, str, str, str]]:
+    '''Место на занятии условным UPSERT (booked растёт, только пока меньше вместимости); None - мест нет или занятие прошло'''
+    execute_prepared(
+        cur,
+        ('schedule_slots', 'claim'),
+        f"""
+        WITH seat AS (
+            INSERT INTO {SCHEMA}.schedule_slots AS o (schedule_id, slot_date, booked)
+            SELECT s.id, %s::date, 1
+            FROM {SCHEMA}.schedule s
+            WHERE s.id = %s AND s.capacity > 0 AND %s::date + s.slot_start > LOCALTIMESTAMP
+            ON CONFLICT (slot_date, schedule_id) DO UPDATE
+            SET booked = o.booked + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE o.booked < (SELECT capacity FROM {SCHEMA}.schedule WHERE id = o.schedule_id)
+            RETURNING o.id, o.schedule_id, o.slot_date
+        )
+        SELECT seat.id, s.title, COALESCE(t.name, ''), to_char(seat.slot_date + s.slot_start, 'YYYY-MM-DD HH24:MI')
+        FROM seat
+        JOIN {SCHEMA}.schedule s ON s.id = seat.schedule_id
+        LEFT JOIN {SCHEMA}.teachers t ON t.id = s.teacher_id
+        """,
+        (slot_date, schedule_id, slot_date)
+    )
+    return cur.fetchone()
+
+def slot_unavailable_response(cur, schedule_id: int, slot_date: datetime.date) -> Dict[str, Any]:
+    '''Отказ в записи: 409 для заполненного занятия, 400 для несуществующего или прошедшего'''
+    cur.execute(
+        f"SELECT 1 FROM {SCHEMA}.schedule WHERE id = %s AND capacity > 0 AND %s::date + slot_start > LOCALTIMESTAMP",
+        (schedule_id, slot_date)
+    )
+    if cur.fetchone() is None:
+        return error_response(400, 'Unknown or past schedule slot')
+    return error_response(409, 'No seats left for this slot')
+
+def client_ip(request: Request) -> str:
+    identity = (request.event.get('requestContext') or {}).get('identity') or {}
+    forwarded = request.header('X-Forwarded-For')
+    return identity.get('sourceIp') or forwarded.split(',')[0].strip()
+
+def rate_limit_buckets(ip: str, phone_digits: str) -> List[Tuple[str, float, float]]:
+    '''Корзины (ключ, ёмкость, пополнение в секунду), которые списываются этой заявкой'''
+    if not RATE_LIMIT_ENABLED:
+        return []
+    buckets = []
+    if ip:
+        buckets.append(('ip:' + ip, RATE_LIMIT_IP[0], RATE_LIMIT_IP[1] / 60))
+    if phone_digits:
+        buckets.append(('phone:' + phone_digits, RATE_LIMIT_PHONE[0], RATE_LIMIT_PHONE[1] / 60))
+    return buckets
+
+def take_local_tokens(buckets: List[Tuple[str, float, float]]) -> int:
+    '''Быстрый отказ по последнему известному состоянию корзин без обращения к БД; 0 - можно идти в БД'''
+    now = time.monotonic()
+    for bucket_key, capacity, rate in buckets:
+        state = _local_buckets.get(bucket_key)
+        if state is None:
+            continue
+        tokens = min(capacity, state[0] + (now - state[1]) * rate)
+        if tokens < 1:
+            return math.ceil((1 - tokens) / rate)
+    return 0
+
+def take_db_tokens(cur, buckets: List[Tuple[str, float, float]]) -> int:
+    '''Списание токена из общих корзин в БД; возвращает Retry-After в секундах, если хотя бы одна пуста'''
+    if not buckets:
+        return 0
+    values = ', '.join(['(%s, %s::float8, %s::float8)'] * len(buckets))
+    execute_prepared(
+        cur,
+        ('rate_limit_buckets', 'take', len(buckets)),
+        f"""
+        INSERT INTO {SCHEMA}.rate_limit_buckets AS b (bucket_key, tokens, refill_per_second, updated_at)
+        SELECT v.bucket_key, v.capacity - 1, v.rate, CURRENT_TIMESTAMP
+        FROM (VALUES {values}) AS v(bucket_key, capacity, rate)
+        ON CONFLICT (bucket_key) DO UPDATE
+        SET tokens = LEAST(
+                EXCLUDED.tokens + 1,
+                b.tokens + EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - b.updated_at) * EXCLUDED.refill_per_second
+            ) - 1,
+            refill_per_second = EXCLUDED.refill_per_second,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING bucket_key, tokens
+        """,
+        [value for bucket in buckets for value in bucket]
+    )
+    tokens = dict(cur.fetchall())
+    now = time.monotonic()
+    retry_after = 0
+    for bucket_key, capacity, rate in buckets:
+        remaining = tokens[bucket_key]
+        if remaining < 0:
+            retry_after = max(retry_after, math.ceil(-remaining / rate))
+            remaining += 1
+        _local_buckets.set(bucket_key, (remaining, now), capacity / rate)
+    return retry_after
+
+def find_claimed_booking(cur, key: str) -> Tuple[int, bool]:
+    '''Заявка по ключу, занятому параллельной транзакцией, которую не видел снимок основного запроса'''
+    cur.execute(
+        f"SELECT booking_id, false FROM {SCHEMA}.booking_idempotency WHERE idempotency_key = %s",
+        (key,)
+    )
+    return cur.fetchone()
+
+def find_recent_booking(cur, key: str) -> Optional[int]:
+    '''Заявка по ключу идемпотентности, если он ещё в окне BOOKING_DEDUP_WINDOW_SECONDS'''
+    cur.execute(
+        f"SELECT booking_id FROM {SCHEMA}.booking_idempotency "
+        f"WHERE idempotency_key = %s AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second'",
+        (key, DEDUP_WINDOW_SECONDS)
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def cleanup_guards(cur) -> None:
+    '''Удаление истёкших ключей и давно полных корзин'''
+    cur.execute(
+        f"DELETE FROM {SCHEMA}.booking_idempotency WHERE created_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'",
+        (DEDUP_WINDOW_SECONDS,)
+    )
+    cur.execute(f"DELETE FROM {SCHEMA}.rate_limit_buckets WHERE updated_at < CURRENT_TIMESTAMP - INTERVAL '1 day'")
+
+def duplicate_response(booking_id: int) -> Dict[str, Any]:
+    '''Повтор получает тот же ответ, что и исходная отправка, с пометкой duplicate'''
+    return json_response(201, {
+        'success': True,
+        'booking_id': booking_id,
+        'duplicate': True,
+        'message': 'Заявка уже отправлена'
+    })
+
+def rate_limited_response(retry_after: int) -> Dict[str, Any]:
+    return json_response(429, {'error': 'Too many booking requests, try again later'}, {
+        'Access-Control-Expose-Headers': 'Retry-After',
+        'Retry-After': str(retry_after)
+    })
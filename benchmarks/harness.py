@@ -0,0 +1,125 @@
+'''
+Общие помощники бенчмарков: загрузка функций, подсчёт обращений к БД, перцентили
+Зависимости: pip install -r benchmarks/requirements.txt
+'''
+import contextlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import psycopg2
+import psycopg2.extensions
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+BACKEND_DIR = os.path.join(REPO_DIR, 'backend')
+MIGRATIONS_DIR = os.path.join(REPO_DIR, 'db_migrations')
+SCHEMA = 't_p90313977_education_center_web'
+FUNCTIONS = ('public-api', 'admin-api', 'auth', 'submit-booking', 'send-notification')
+
+class QueryCounter:
+    '''Счётчик выполненных SQL-операторов (обращений к БД) для всех функций в процессе'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def hit(self) -> None:
+        with self.lock:
+            self.count += 1
+
+    def reset(self) -> int:
+        with self.lock:
+            count, self.count = self.count, 0
+            return count
+
+QUERY_COUNTER = QueryCounter()
+
+class CountingCursorMixin:
+    def execute(self, query, vars=None):
+        QUERY_COUNTER.hit()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        QUERY_COUNTER.hit()
+        return super().executemany(query, vars_list)
+
+_counting_factories: Dict[type, type] = {}
+
+def counting_factory(factory: Optional[type]) -> type:
+    '''Подкласс фабрики курсоров, считающий execute; isinstance с исходным классом сохраняется'''
+    factory = factory or psycopg2.extensions.cursor
+    if issubclass(factory, CountingCursorMixin):
+        return factory
+    if factory not in _counting_factories:
+        _counting_factories[factory] = type('Counting' + factory.__name__, (CountingCursorMixin, factory), {})
+    return _counting_factories[factory]
+
+class CountingConnection(psycopg2.extensions.connection):
+    '''Соединение, у которого любые курсоры считают обращения к БД'''
+    def cursor(self, *args, **kwargs):
+        kwargs['cursor_factory'] = counting_factory(kwargs.get('cursor_factory') or self.cursor_factory)
+        return super().cursor(*args, **kwargs)
+
+_original_connect = psycopg2.connect
+
+def install_query_counter() -> None:
+    '''Подмена psycopg2.connect: все новые соединения функций считают обращения к БД'''
+    def connect(*args, **kwargs):
+        kwargs.setdefault('connection_factory', CountingConnection)
+        return _original_connect(*args, **kwargs)
+    psycopg2.connect = connect
+
+def load_function(name: str, backend_dir: str = BACKEND_DIR):
+    '''Загрузка index.py облачной функции как отдельного модуля'''
+    path = os.path.join(backend_dir, name, 'index.py')
+    module_name = 'bench_' + name.replace('-', '_')
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+@contextlib.contextmanager
+def checkout(rev: str, workdir: str) -> Iterator[str]:
+    '''Временный git worktree ревизии внутри workdir; удаляется при выходе'''
+    tree = os.path.join(workdir, rev.replace('/', '_').replace('~', '_').replace('^', '_'))
+    subprocess.run(['git', '-C', REPO_DIR, 'worktree', 'add', '--detach', tree, rev], check=True, capture_output=True)
+    try:
+        yield tree
+    finally:
+        subprocess.run(['git', '-C', REPO_DIR, 'worktree', 'remove', '--force', tree], check=False, capture_output=True)
+
+def make_event(method: str = 'GET', query: Optional[Dict[str, str]] = None, body: Any = None,
+               headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''Событие в формате, который облачная функция получает от шлюза'''
+    event = {
+        'httpMethod': method,
+        'queryStringParameters': query or {},
+        'headers': headers or {},
+        'isBase64Encoded': False
+    }
+    if body is not None:
+        event['body'] = body if isinstance(body, str) else json.dumps(body)
+    return event
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    '''Перцентиль по ближайшему рангу для отсортированного списка'''
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    '''Сводка по задержкам в миллисекундах и пропускной способности'''
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round((ordered[-1] if ordered else 0) * 1000, 3),
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0
+    }
@@ -0,0 +1,205 @@
+'''
+HTTP-обёртка облачных функций и конкурентный драйвер нагрузки
+serve     - поднимает ThreadingHTTPServer, который переводит запросы в события шлюза
+            (строка готовности с портом печатается в stderr, stdout занят логами функции)
+load      - бьёт по адресу из N потоков с keep-alive и печатает перцентили
+coldstart - многократно запускает serve в новом процессе и сравнивает первый
+            (холодный: запуск интерпретатора, импорт, первое соединение с БД)
+            и последующие (тёплые) ответы
+
+Запуск:
+    python benchmarks/http_driver.py serve public-api --port 8101
+    python benchmarks/http_driver.py load 'http://127.0.0.1:8101/?entity=teachers' --requests 2000 --concurrency 16
+    python benchmarks/http_driver.py coldstart public-api '/?entities=teachers,schedule,contacts,reviews' --runs 5
+'''
+import argparse
+import base64
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from harness import BACKEND_DIR, load_function, summarize
+
+def make_handler(module):
+    '''Класс обработчика HTTP, вызывающий handler функции'''
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def invoke(self) -> None:
+            url = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            event = {
+                'httpMethod': self.command,
+                'queryStringParameters': dict(parse_qsl(url.query)),
+                'headers': dict(self.headers.items()),
+                'body': self.rfile.read(length).decode('utf-8') if length else '',
+                'isBase64Encoded': False
+            }
+            response = module.handler(event, None)
+            body = response.get('body') or ''
+            if response.get('isBase64Encoded'):
+                payload = base64.b64decode(body)
+            else:
+                payload = body.encode('utf-8')
+
+            self.send_response(response.get('statusCode', 200))
+            for name, value in (response.get('headers') or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_OPTIONS = invoke
+
+    return Handler
+
+def serve(args) -> None:
+    started = time.perf_counter()
+    module = load_function(args.function, args.backend_dir)
+    import_ms = (time.perf_counter() - started) * 1000
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(module))
+    server.daemon_threads = True
+    print(json.dumps({'port': server.server_address[1], 'import_ms': round(import_ms, 1)}), file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def request(conn: http.client.HTTPConnection, method: str, path: str, body: Optional[str],
+            headers: Dict[str, str]) -> Tuple[int, int]:
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    payload = response.read()
+    return response.status, len(payload)
+
+def load(args) -> Dict[str, Any]:
+    '''Конкурентная нагрузка: каждый поток держит своё keep-alive соединение'''
+    url = urlsplit(args.url)
+    path = url.path or '/'
+    if url.query:
+        path += '?' + url.query
+    headers = dict(h.split(':', 1) for h in args.header)
+    headers = {k.strip(): v.strip() for k, v in headers.items()}
+    if args.body:
+        headers.setdefault('Content-Type', 'application/json')
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def worker() -> None:
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        local_latencies = []
+        local_statuses: Dict[int, int] = {}
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                status, _ = request(conn, args.method, path, args.body, headers)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                status = 0
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - started)
+    result['statuses'] = statuses
+    print(json.dumps(result))
+    return result
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def coldstart(args) -> None:
+    '''Холодный старт в отдельном процессе против тёплых запросов того же процесса'''
+    cold, warm, imports = [], [], []
+    for run in range(args.runs):
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'serve', args.function, '--port', str(port),
+             '--backend-dir', args.backend_dir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        try:
+            ready = json.loads(process.stderr.readline())
+            imports.append(ready['import_ms'] / 1000)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            status, _ = request(conn, args.method, args.path, args.body, {})
+            cold.append(time.perf_counter() - started)
+            for _ in range(args.warm):
+                request_started = time.perf_counter()
+                request(conn, args.method, args.path, args.body, {})
+                warm.append(time.perf_counter() - request_started)
+            conn.close()
+            print(f'run {run + 1}: status={status} cold={cold[-1] * 1000:.1f} ms import={ready["import_ms"]} ms', file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(json.dumps({
+        'cold_start': summarize(cold, sum(cold)),
+        'import': summarize(imports, sum(imports)),
+        'warm': summarize(warm, sum(warm))
+    }, indent=2))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve')
+    serve_parser.add_argument('function')
+    serve_parser.add_argument('--port', type=int, default=8101)
+    serve_parser.add_argument('--backend-dir', default=BACKEND_DIR)
+
+    load_parser = commands.add_parser('load')
+    load_parser.add_argument('url')
+    load_parser.add_argument('--requests', type=int, default=1000)
+    load_parser.add_argument('--concurrency', type=int, default=8)
+    load_parser.add_argument('--method', default='GET')
+    load_parser.add_argument('--body')
+    load_parser.add_argument('--header', action='append', default=[], help='Имя: значение')
+
+    cold_parser = commands.add_parser('coldstart')
+    cold_parser.add_argument('function')
+    cold_parser.add_argument('path')
+    cold_parser.add_argument('--runs', type=int, default=5)
+    cold_parser.add_argument('--warm', type=int, default=50)
+    cold_parser.add_argument('--method', default='GET')
+    cold_parser.add_argument('--body')
+    cold_parser.add_argument('--backend-dir', default=BACKEND_DIR)
+
+    args = parser.parse_args()
+    {'serve': serve, 'load': load, 'coldstart': coldstart}[args.command](args)
+
+if __name__ == '__main__':
+    main()
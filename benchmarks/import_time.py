@@ -0,0 +1,78 @@
+'''
+Время импорта облачных функций в чистом интерпретаторе
+Каждый замер - новый процесс: импорт index.py (то, что платится при холодном
+старте до первого запроса) и список тяжёлых зависимостей, реально загруженных
+к концу импорта. Ленивые модули, к которым ещё не обращались, не считаются.
+
+Запуск:
+    python benchmarks/import_time.py [--runs 7] [--only public-api]
+    python benchmarks/import_time.py --rev HEAD~1    # сравнение с ревизией через git worktree
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+from harness import BACKEND_DIR, FUNCTIONS, checkout
+
+HEAVY_MODULES = ('psycopg2', 'psycopg2.extras', 'requests', 'orjson', 'concurrent.futures', 'gzip', 'csv')
+
+PROBE = '''
+import json, os, sys, time, types, importlib.util
+path, heavy = sys.argv[1], sys.argv[2].split(',')
+sys.path.insert(0, os.path.dirname(path))
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('probe_index', path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - started
+loaded = [name for name in heavy if type(sys.modules.get(name)) is types.ModuleType]
+print(json.dumps({'import_ms': elapsed * 1000, 'loaded': loaded}))
+'''
+
+def measure(function: str, backend_dir: str, runs: int) -> Dict:
+    '''Медиана времени импорта функции по runs свежим процессам'''
+    path = os.path.join(backend_dir, function, 'index.py')
+    samples: List[float] = []
+    loaded: List[str] = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE, path, ','.join(HEAVY_MODULES)],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result['import_ms'])
+        loaded = result['loaded']
+    return {'function': function, 'import_ms': round(statistics.median(samples), 1), 'loaded': loaded}
+
+def measure_all(backend_dir: str, runs: int, only: Optional[str]) -> Dict[str, Dict]:
+    return {name: measure(name, backend_dir, runs) for name in FUNCTIONS if not only or name == only}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--only', choices=FUNCTIONS)
+    parser.add_argument('--rev', help='ревизия для сравнения с рабочим деревом')
+    parser.add_argument('--backend-dir', default=BACKEND_DIR)
+    args = parser.parse_args()
+
+    head = measure_all(args.backend_dir, args.runs, args.only)
+    base = None
+    if args.rev:
+        with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+            with checkout(args.rev, workdir) as tree:
+                base = measure_all(os.path.join(tree, 'backend'), args.runs, args.only)
+
+    header = f"{'function':<18} {'import ms':>18}  loaded"
+    print(header)
+    print('-' * 70)
+    for name, result in head.items():
+        timing = f"{result['import_ms']:.1f}"
+        if base and name in base:
+            timing = f"{base[name]['import_ms']:.1f} > {timing}"
+        print(f"{name:<18} {timing:>18}  {', '.join(result['loaded']) or '-'}")
+
+if __name__ == '__main__':
+    main()
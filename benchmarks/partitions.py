@@ -0,0 +1,104 @@
+'''
+Сравнение заявок в одной таблице и в месячных секциях (V0017) на одних и тех же данных
+Заполняет базу миграциями до V0016 (student_bookings одной таблицей), прогоняет сценарии
+admin-api из run_handlers.py, применяет V0017 с замером переноса заявок, прогоняет те же
+сценарии ещё раз и печатает разницу, размеры таблиц и число секций, которые читает каждый запрос.
+
+Запуск:
+    DATABASE_URL=postgresql://... python benchmarks/partitions.py [--bookings 1000000] [--iterations 100]
+    DATABASE_URL=postgresql://... python benchmarks/partitions.py --skip-seed   # база уже заполнена до V0016
+'''
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict
+
+import psycopg2
+
+from harness import MIGRATIONS_DIR, SCHEMA
+from run_handlers import print_comparison
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PARTITIONS_MIGRATION = 'V0017'
+SCENARIOS = ('bookings-page', 'bookings-filtered', 'bookings-deep-page', 'bookings-month', 'bookings-export-month',
+             'booking-by-id', 'bookings-delta', 'search-name', 'search-phone-tail')
+PLANS = {
+    'first page': f'SELECT id FROM {SCHEMA}.student_bookings ORDER BY created_at DESC, id DESC LIMIT 51',
+    'month filter': f"SELECT COUNT(*) FROM {SCHEMA}.student_bookings "
+                    f"WHERE created_at >= date_trunc('month', now()) - INTERVAL '1 month' AND created_at < date_trunc('month', now())",
+    'by id': f'SELECT * FROM {SCHEMA}.student_bookings WHERE id = 1'
+}
+
+def run_scenarios(args, report: str) -> Dict[tuple, Dict[str, Any]]:
+    subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'run_handlers.py'), 'run', '--only', 'admin-api',
+                    '--scenario', args.scenario, '--iterations', str(args.iterations), '--json', report], check=True)
+    with open(report, encoding='utf-8') as f:
+        return {(r['function'], r['scenario']): r for r in json.load(f)}
+
+def table_size(cur) -> str:
+    '''Размер заявок вместе с индексами (по всем секциям)'''
+    cur.execute(f'''
+        SELECT pg_size_pretty(SUM(pg_total_relation_size(c.oid)))
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'r' AND c.relname LIKE 'student_bookings%%' AND c.relname <> 'student_bookings_archive'
+    ''', (SCHEMA,))
+    return cur.fetchone()[0]
+
+def scanned_partitions(cur) -> Dict[str, int]:
+    '''Сколько таблиц читает план каждого запроса из PLANS'''
+    counts = {}
+    for name, sql in PLANS.items():
+        cur.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cur.fetchone()[0]
+        counts[name] = json.dumps(plan).count('"Relation Name"')
+    return counts
+
+def apply_partitioning(cur) -> float:
+    path, = glob.glob(os.path.join(MIGRATIONS_DIR, f'{PARTITIONS_MIGRATION}__*.sql'))
+    cur.execute(f'SET search_path TO {SCHEMA}, public')
+    started = time.perf_counter()
+    with open(path, encoding='utf-8') as f:
+        cur.execute(f.read())
+    return time.perf_counter() - started
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--scenario', default=','.join(SCENARIOS))
+    parser.add_argument('--skip-seed', action='store_true')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is not set')
+    if not args.skip_seed:
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, 'seed.py'), '--reset', '--until', 'V0016',
+                        '--bookings', str(args.bookings)], check=True)
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    cur = conn.cursor()
+    sizes, plans = {}, {}
+    with tempfile.TemporaryDirectory(prefix='partitions-') as workdir:
+        sizes['heap'], plans['heap'] = table_size(cur), scanned_partitions(cur)
+        heap = run_scenarios(args, os.path.join(workdir, 'heap.json'))
+
+        migration = apply_partitioning(cur)
+        cur.execute(f'VACUUM ANALYZE {SCHEMA}.student_bookings')
+        sizes['partitioned'], plans['partitioned'] = table_size(cur), scanned_partitions(cur)
+        partitioned = run_scenarios(args, os.path.join(workdir, 'partitioned.json'))
+    cur.close()
+    conn.close()
+
+    print_comparison(heap, partitioned, 'heap', 'partitioned')
+    print(f'\n{PARTITIONS_MIGRATION} migration: {migration:.1f}s, size {sizes["heap"]} -> {sizes["partitioned"]}')
+    for name in PLANS:
+        print(f'{name:<14} tables scanned: {plans["heap"][name]} -> {plans["partitioned"][name]}')
+
+if __name__ == '__main__':
+    main()
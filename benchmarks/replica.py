@@ -0,0 +1,162 @@
+'''
+Локальная реплика PostgreSQL для проверки чтения с реплик (DATABASE_READ_URL)
+start - pg_basebackup основной БД из DATABASE_URL с настройкой потоковой репликации (-R)
+        и запуск реплики на своём порту; печатает строку DATABASE_READ_URL
+stop  - остановка реплики
+check - сценарии маршрутизации на двух экземплярах: чтение с реплики, read-your-writes
+        по X-Read-After-LSN из другого контейнера, откат в основную БД при отставании
+        (воспроизводится паузой воспроизведения WAL на реплике)
+
+Основная БД должна разрешать replication-подключения (wal_level=replica, pg_hba).
+
+Запуск:
+    DATABASE_URL=postgresql://... python benchmarks/replica.py start --data-dir /tmp/pgreplica --port 5433
+    DATABASE_URL=postgresql://... DATABASE_READ_URL=postgresql://...:5433/... python benchmarks/replica.py check
+    python benchmarks/replica.py stop --data-dir /tmp/pgreplica
+'''
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Any, Dict
+
+import psycopg2
+
+from harness import SCHEMA, load_function, make_event
+
+def pg_tool(args, name: str) -> str:
+    return os.path.join(args.bin_dir, name) if args.bin_dir else name
+
+def start(args) -> None:
+    primary = os.environ.get('DATABASE_URL')
+    if not primary:
+        sys.exit('DATABASE_URL is not set')
+    if os.path.exists(args.data_dir):
+        shutil.rmtree(args.data_dir)
+    subprocess.run([pg_tool(args, 'pg_basebackup'), '-d', primary, '-D', args.data_dir, '-R', '-X', 'stream', '-c', 'fast'],
+                   check=True)
+    os.chmod(args.data_dir, 0o700)
+    with open(os.path.join(args.data_dir, 'postgresql.auto.conf'), 'a', encoding='utf-8') as f:
+        f.write(f"port = {args.port}\nunix_socket_directories = '{args.data_dir}'\nhot_standby = on\n")
+    subprocess.run([pg_tool(args, 'pg_ctl'), '-D', args.data_dir, '-l', os.path.join(args.data_dir, 'replica.log'), '-w', 'start'],
+                   check=True)
+    dbname = psycopg2.extensions.parse_dsn(primary).get('dbname', 'postgres')
+    print(f'DATABASE_READ_URL=postgresql://postgres@/{dbname}?host={args.data_dir}&port={args.port}')
+
+def stop(args) -> None:
+    subprocess.run([pg_tool(args, 'pg_ctl'), '-D', args.data_dir, '-m', 'fast', 'stop'], check=True)
+
+def call(module, method: str, query: Dict[str, str], body: Any = None, headers: Dict[str, str] = None) -> Dict[str, Any]:
+    response = module.handler(make_event(method, query, body, headers), None)
+    if response['statusCode'] >= 300:
+        raise RuntimeError(f"{method} {query}: {response['statusCode']} {response['body']}")
+    return response
+
+def container(name: str):
+    '''Новый экземпляр функции - как отдельный контейнер со своим пулом и окном read-your-writes'''
+    return load_function(name)
+
+def reads(module) -> Dict[str, int]:
+    stats = module.get_pool_stats()
+    return {'replica': stats['replica_reads'], 'primary': stats['primary_reads']}
+
+def report(name: str, ok: bool, detail: str) -> bool:
+    print(f"{'OK  ' if ok else 'FAIL'} {name}: {detail}")
+    return ok
+
+def check(args) -> None:
+    '''Маршрутизация чтений на паре основная БД + реплика'''
+    if not os.environ.get('DATABASE_URL') or not os.environ.get('DATABASE_READ_URL'):
+        sys.exit('DATABASE_URL and DATABASE_READ_URL must be set')
+    os.environ['DB_REPLICA_CHECK_INTERVAL'] = '0'
+    os.environ['DB_REPLICA_MAX_LAG_SECONDS'] = str(args.max_lag)
+    os.environ.setdefault('AUTH_TOKEN_SECRET', 'replica-check-secret')
+    replica = psycopg2.connect(os.environ['DATABASE_READ_URL'])
+    replica.autocommit = True
+    with replica.cursor() as cur:
+        cur.execute('SELECT pg_is_in_recovery()')
+        if not cur.fetchone()[0]:
+            sys.exit('DATABASE_READ_URL is not a standby')
+
+    auth = container('auth')
+    token = json.loads(call(auth, 'POST', {}, {'username': args.username, 'password': args.password})['body'])['token']
+    headers = {'X-Auth-Token': token}
+    results = []
+
+    public = container('public-api')
+    call(public, 'GET', {'entity': 'teachers'})
+    results.append(report('public read', reads(public)['replica'] == 1, f'{reads(public)}'))
+
+    writer = container('admin-api')
+    teacher = json.loads(call(writer, 'GET', {'entity': 'teachers', 'fields': 'id,description'}, headers=headers)['body'])[0]
+    marker = f'replica-check {time.time():.6f}'
+    written = call(writer, 'PUT', {'entity': 'teachers', 'id': str(teacher['id'])}, {'description': marker}, headers)
+    lsn = written['headers'].get('X-Read-After-LSN')
+    results.append(report('write returns LSN', bool(lsn), f'X-Read-After-LSN={lsn}'))
+
+    before = reads(writer)
+    call(writer, 'GET', {'entity': 'teachers', 'id': str(teacher['id'])}, headers=headers)
+    results.append(report('same container reads primary after write', reads(writer)['primary'] == before['primary'] + 1,
+                          f'{before} -> {reads(writer)}'))
+
+    with replica.cursor() as cur:
+        cur.execute('SELECT pg_wal_replay_pause()')
+    try:
+        marker = f'replica-check {time.time():.6f}'
+        written = call(writer, 'PUT', {'entity': 'teachers', 'id': str(teacher['id'])}, {'description': marker}, headers)
+        reader = container('admin-api')
+        row = json.loads(call(reader, 'GET', {'entity': 'teachers', 'id': str(teacher['id'])},
+                              headers=dict(headers, **{'X-Read-After-LSN': written['headers']['X-Read-After-LSN']}))['body'])
+        results.append(report('other container with LSN sees the write', row['description'] == marker,
+                               f"{reads(reader)} description={row['description']!r}"))
+
+        time.sleep(args.max_lag + 1)
+        call(writer, 'PUT', {'entity': 'teachers', 'id': str(teacher['id'])}, {'description': teacher['description']}, headers)
+        lagging = container('public-api')
+        call(lagging, 'GET', {'entity': 'teachers'})
+        results.append(report('lagging replica falls back to primary', reads(lagging) == {'replica': 0, 'primary': 1},
+                              f"{reads(lagging)} lag={lagging.get_pool_stats().get('replica_lag')}"))
+    finally:
+        with replica.cursor() as cur:
+            cur.execute('SELECT pg_wal_replay_resume()')
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        with replica.cursor() as cur:
+            cur.execute(f'SELECT description FROM {SCHEMA}.teachers WHERE id = %s', (teacher['id'],))
+            if cur.fetchone()[0] == teacher['description']:
+                break
+        time.sleep(0.1)
+    recovered = container('public-api')
+    call(recovered, 'GET', {'entity': 'teachers'})
+    results.append(report('caught-up replica serves reads again', reads(recovered)['replica'] == 1, f'{reads(recovered)}'))
+    replica.close()
+    if not all(results):
+        sys.exit(1)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    start_parser = commands.add_parser('start')
+    start_parser.add_argument('--data-dir', default='/tmp/pgreplica')
+    start_parser.add_argument('--port', type=int, default=5433)
+    start_parser.add_argument('--bin-dir', help='каталог pg_basebackup и pg_ctl, если их нет в PATH')
+
+    stop_parser = commands.add_parser('stop')
+    stop_parser.add_argument('--data-dir', default='/tmp/pgreplica')
+    stop_parser.add_argument('--bin-dir')
+
+    check_parser = commands.add_parser('check')
+    check_parser.add_argument('--max-lag', type=float, default=1.0)
+    check_parser.add_argument('--username', default='shafi')
+    check_parser.add_argument('--password', default='12344321')
+
+    args = parser.parse_args()
+    {'start': start, 'stop': stop, 'check': check}[args.command](args)
+
+if __name__ == '__main__':
+    main()
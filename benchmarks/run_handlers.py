@@ -0,0 +1,340 @@
+'''
+Нагрузочный прогон всех пяти облачных функций внутри процесса
+Вызывает handler с синтетическими событиями шлюза против локальной базы
+(см. benchmarks/seed.py) и печатает p50/p95/p99, пропускную способность,
+пиковые аллокации (tracemalloc) и число обращений к БД на вызов.
+send-notification ходит в локальные заглушки из stub_providers.py.
+
+Запуск:
+    DATABASE_URL=postgresql://... python benchmarks/run_handlers.py run [--iterations 200] [--only admin-api]
+    DATABASE_URL=postgresql://... python benchmarks/run_handlers.py compare HEAD~3 HEAD [--iterations 200]
+
+compare поднимает git worktree для каждой ревизии, прогоняет её backend теми же
+сценариями и печатает разницу; схема базы должна подходить обеим ревизиям.
+'''
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable, Dict, List
+
+from harness import BACKEND_DIR, FUNCTIONS, QUERY_COUNTER, checkout, install_query_counter, load_function, make_event, summarize
+from stub_providers import start_stub_server
+
+ADMIN_USERNAME = os.environ.get('BENCH_ADMIN_USERNAME', 'shafi')
+ADMIN_PASSWORD = os.environ.get('BENCH_ADMIN_PASSWORD', '12344321')
+
+class Scenario:
+    '''Один сценарий: функция, фабрика событий и ожидаемые коды ответа'''
+    def __init__(self, function: str, name: str, make: Callable[[], Dict[str, Any]],
+                 expect: tuple = (200,), heavy: bool = False):
+        self.function = function
+        self.name = name
+        self.make = make
+        self.expect = expect
+        self.heavy = heavy
+
+def call(module, event: Dict[str, Any]) -> Dict[str, Any]:
+    return module.handler(event, None)
+
+def admin_token(modules: Dict[str, Any]) -> str:
+    '''Токен администратора через настоящий вход в auth'''
+    response = call(modules['auth'], make_event('POST', body={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD}))
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"admin login failed: {response['statusCode']} {response['body']}")
+    return json.loads(response['body'])['token']
+
+def build_scenarios(modules: Dict[str, Any]) -> List[Scenario]:
+    '''Сценарии с данными, подготовленными заранее (токен, курсор, ETag)'''
+    scenarios = []
+    landing = {'entities': 'teachers,schedule,contacts,reviews'}
+
+    if 'public-api' in modules:
+        first = call(modules['public-api'], make_event('GET', landing))
+        etag = (first.get('headers') or {}).get('ETag', '')
+        scenarios += [
+            Scenario('public-api', 'teachers', lambda: make_event('GET', {'entity': 'teachers'})),
+            Scenario('public-api', 'landing-batch', lambda: make_event('GET', landing)),
+            Scenario('public-api', 'landing-batch-gzip', lambda: make_event('GET', landing, headers={'Accept-Encoding': 'gzip'})),
+            Scenario('public-api', 'landing-batch-br', lambda: make_event('GET', landing, headers={'Accept-Encoding': 'gzip, deflate, br'})),
+            Scenario('public-api', 'landing-not-modified', lambda: make_event('GET', landing, headers={'If-None-Match': etag}),
+                     expect=(304,)),
+            Scenario('public-api', 'availability-week', lambda: make_event('GET', {'entity': 'availability'})),
+            Scenario('public-api', 'availability-month', lambda: make_event('GET', {
+                'entity': 'availability', 'date_to': (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+            })),
+            Scenario('public-api', 'availability-teacher', lambda: make_event('GET', {'entity': 'availability', 'teacher_id': '7'})),
+            Scenario('public-api', 'calendar-month', lambda: make_event('GET', {'entity': 'calendar'})),
+            Scenario('public-api', 'reviews-feed', lambda: make_event('GET', {'entity': 'reviews_feed'})),
+            Scenario('public-api', 'reviews-feed-deep', lambda: make_event('GET', {'entity': 'reviews_feed', 'offset': '300'})),
+            Scenario('public-api', 'calendar-year', lambda: make_event('GET', {
+                'entity': 'calendar', 'from': datetime.date.today().replace(month=1, day=1).isoformat(),
+                'to': datetime.date.today().replace(month=12, day=31).isoformat()
+            }))
+        ]
+
+    if 'admin-api' in modules:
+        headers = {'X-Auth-Token': admin_token(modules)}
+        cursor = None
+        for _ in range(20):
+            page = call(modules['admin-api'], make_event('GET', dict({'entity': 'bookings', 'limit': '50'}, **({'cursor': cursor} if cursor else {})), headers=headers))
+            if page['statusCode'] != 200:
+                break
+            cursor = json.loads(page['body']).get('next_cursor')
+            if not cursor:
+                break
+        deep_query = {'entity': 'bookings', 'limit': '50', 'cursor': cursor or ''}
+        month_end = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        month = {'date_from': month_end.replace(day=1).isoformat(), 'date_to': month_end.isoformat()}
+        watermark = json.loads(call(modules['admin-api'], make_event('GET', {'entity': 'contacts', 'since': '0'}, headers=headers))['body'])['since']
+        counter = {'n': 0}
+
+        def update_contact() -> Dict[str, Any]:
+            counter['n'] += 1
+            return make_event('PUT', {'entity': 'contacts', 'id': '1'}, {'label': f'Телефон {counter["n"]}'}, headers)
+
+        scenarios += [
+            Scenario('admin-api', 'bookings-page', lambda: make_event('GET', {'entity': 'bookings', 'limit': '50'}, headers=headers)),
+            Scenario('admin-api', 'bookings-page-gzip', lambda: make_event('GET', {'entity': 'bookings', 'limit': '50'}, headers=dict(headers, **{'Accept-Encoding': 'gzip'}))),
+            Scenario('admin-api', 'bookings-filtered', lambda: make_event('GET', {'entity': 'bookings', 'limit': '50', 'status': 'confirmed', 'subject': 'Физика'}, headers=headers)),
+            Scenario('admin-api', 'bookings-deep-page', lambda: make_event('GET', deep_query, headers=headers)),
+            Scenario('admin-api', 'bookings-month', lambda: make_event('GET', dict(month, entity='bookings', limit='50', total='exact'), headers=headers)),
+            Scenario('admin-api', 'bookings-export-month', lambda: make_event('GET', dict(month, entity='bookings', format='ndjson'), headers=headers)),
+            Scenario('admin-api', 'booking-by-id', lambda: make_event('GET', {'entity': 'bookings', 'id': '1'}, headers=headers)),
+            Scenario('admin-api', 'teachers', lambda: make_event('GET', {'entity': 'teachers'}, headers=headers)),
+            Scenario('admin-api', 'contact-update', update_contact),
+            Scenario('admin-api', 'bookings-delta', lambda: make_event('GET', {'entity': 'bookings', 'since': watermark}, headers=headers)),
+            Scenario('admin-api', 'search-name', lambda: make_event('GET', {'entity': 'bookings', 'search': 'Ученик 12345', 'limit': '50'}, headers=headers)),
+            Scenario('admin-api', 'search-email', lambda: make_event('GET', {'entity': 'bookings', 'search': 'student4242@example.com'}, headers=headers)),
+            Scenario('admin-api', 'search-phone-tail', lambda: make_event('GET', {'entity': 'bookings', 'search': '4567', 'limit': '50'}, headers=headers)),
+            Scenario('admin-api', 'stats-30d', lambda: make_event('GET', {'entity': 'stats'}, headers=headers)),
+            Scenario('admin-api', 'stats-year-by-teacher', lambda: make_event('GET', {'entity': 'stats', 'bucket': 'month', 'group': 'teacher',
+                                                                                     'date_from': (datetime.date.today() - datetime.timedelta(days=364)).isoformat()}, headers=headers)),
+            Scenario('admin-api', 'search-reviews', lambda: make_event('GET', {'entity': 'reviews', 'search': 'экзамен', 'limit': '50'}, headers=headers)),
+            Scenario('admin-api', 'bookings-full-list', lambda: make_event('GET', {'entity': 'bookings'}, headers=headers), heavy=True),
+            Scenario('admin-api', 'bookings-export-csv', lambda: make_event('GET', {'entity': 'bookings', 'format': 'csv'}, headers=headers), heavy=True)
+        ]
+
+    if 'auth' in modules:
+        scenarios += [
+            Scenario('auth', 'login', lambda: make_event('POST', body={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})),
+            # Отдельный логин: после LOGIN_MAX_FAILURES_PER_USER ошибок он получает 429, а вход администратора не блокируется
+            Scenario('auth', 'login-invalid', lambda: make_event('POST', body={'username': 'bench-intruder', 'password': 'wrong'}), expect=(401, 429))
+        ]
+
+    if 'submit-booking' in modules:
+        def booking(**slot: Any) -> Dict[str, Any]:
+            suffix = uuid.uuid4().int % 10 ** 9
+            return make_event('POST', body={
+                'student_name': f'Бенчмарк {suffix}',
+                'student_phone': f'+7 9{suffix:09d}',
+                'student_email': f'bench{suffix}@example.com',
+                'selected_teacher': 'Преподаватель 1',
+                'selected_subject': 'Математика',
+                'selected_time': '10:00',
+                **slot
+            })
+
+        module = modules['submit-booking']
+        conn = module.get_db_connection()
+        cur = conn.cursor()
+        cur.execute(f'SELECT id FROM {module.SCHEMA}.schedule WHERE slot_start IS NOT NULL AND capacity > 0')
+        schedule_ids = [row[0] for row in cur.fetchall()]
+        module.release_db_connection(conn, cur)
+
+        def slot_booking() -> Dict[str, Any]:
+            slot_date = datetime.date.today() + datetime.timedelta(days=random.randint(1, 30))
+            return booking(schedule_id=random.choice(schedule_ids), slot_date=slot_date.isoformat())
+        scenarios.append(Scenario('submit-booking', 'submit', booking, expect=(201,)))
+        if schedule_ids:
+            scenarios.append(Scenario('submit-booking', 'submit-slot', slot_booking, expect=(201, 409)))
+
+    if 'send-notification' in modules:
+        notify_body = {
+            'booking': {'student_name': 'Бенчмарк', 'student_phone': '+7 900 000-00-00', 'selected_subject': 'Математика', 'selected_time': '10:00'},
+            'settings': {'telegram': {'enabled': True, 'value': '123456'}, 'email': {'enabled': True, 'value': 'admin@example.com'}}
+        }
+        scenarios += [
+            Scenario('send-notification', 'direct-both-channels', lambda: make_event('POST', body=notify_body)),
+            Scenario('send-notification', 'dispatch-outbox',
+                     lambda: make_event('POST', {'action': 'dispatch'}, headers={'X-Dispatch-Secret': os.environ['OUTBOX_DISPATCH_SECRET']}))
+        ]
+
+    return scenarios
+
+def wire_bytes(response: Dict[str, Any]) -> int:
+    '''Размер тела на проводе: base64-тело шлюз декодирует перед отправкой'''
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        return len(body) * 3 // 4 - body[-2:].count('=')
+    return len(body.encode('utf-8'))
+
+def run_scenario(module, scenario: Scenario, iterations: int, warmup: int, alloc_samples: int) -> Dict[str, Any]:
+    '''Прогрев, замер задержек и обращений к БД, затем отдельный проход с tracemalloc'''
+    QUERY_COUNTER.reset()
+    started = time.perf_counter()
+    call(module, scenario.make())
+    first_ms = (time.perf_counter() - started) * 1000
+    for _ in range(warmup):
+        call(module, scenario.make())
+
+    latencies = []
+    errors = 0
+    response_bytes = 0
+    QUERY_COUNTER.reset()
+    run_started = time.perf_counter()
+    for _ in range(iterations):
+        event = scenario.make()
+        started = time.perf_counter()
+        response = call(module, event)
+        latencies.append(time.perf_counter() - started)
+        if response['statusCode'] not in scenario.expect:
+            errors += 1
+        response_bytes += wire_bytes(response)
+    elapsed = time.perf_counter() - run_started
+    queries = QUERY_COUNTER.reset()
+
+    peaks = []
+    tracemalloc.start()
+    for _ in range(alloc_samples):
+        event = scenario.make()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        call(module, event)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    result = summarize(latencies, elapsed)
+    result.update({
+        'function': scenario.function,
+        'scenario': scenario.name,
+        'first_ms': round(first_ms, 3),
+        'queries_per_call': round(queries / iterations, 2) if iterations else 0,
+        'peak_alloc_kb': round(max(peaks) / 1024, 1) if peaks else 0,
+        'response_bytes': response_bytes // iterations if iterations else 0,
+        'errors': errors
+    })
+    return result
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    header = f"{'function':<18} {'scenario':<22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>8} {'queries':>8} {'peak KB':>9} {'body KB':>9} {'errors':>6}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['function']:<18} {r['scenario']:<22} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+              f"{r['throughput_rps']:>8.1f} {r['queries_per_call']:>8.2f} {r['peak_alloc_kb']:>9.1f} {r['response_bytes'] / 1024:>9.1f} {r['errors']:>6}")
+
+def run(args) -> List[Dict[str, Any]]:
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is not set')
+
+    server, _, stub_url = start_stub_server(latency=args.stub_latency)
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench-token')
+    os.environ.setdefault('SENDGRID_API_KEY', 'bench-key')
+    os.environ.setdefault('AUTH_TOKEN_SECRET', 'bench-secret')
+    os.environ.setdefault('OUTBOX_DISPATCH_SECRET', 'bench-dispatch-secret')
+    os.environ['TELEGRAM_API_URL'] = stub_url
+    os.environ['SENDGRID_API_URL'] = stub_url
+    install_query_counter()
+
+    only = set(args.only.split(',')) if args.only else set(FUNCTIONS)
+    modules = {}
+    for name in FUNCTIONS:
+        if name in only or name == 'auth':
+            started = time.perf_counter()
+            modules[name] = load_function(name, args.backend_dir)
+            print(f'import {name}: {(time.perf_counter() - started) * 1000:.1f} ms', file=sys.stderr)
+
+    # строки JSON-лога функций пишутся в stdout; при замерах они уходят в /dev/null
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    results = []
+    for scenario in build_scenarios(modules):
+        if scenario.function not in only or (scenario.heavy and not args.heavy):
+            continue
+        if args.scenario and scenario.name not in args.scenario.split(','):
+            continue
+        if scenario.heavy:
+            results.append(run_scenario(modules[scenario.function], scenario, max(1, args.iterations // 20), 1, 1))
+        else:
+            results.append(run_scenario(modules[scenario.function], scenario, args.iterations, args.warmup, args.alloc_samples))
+
+    sys.stdout.close()
+    sys.stdout = stdout
+    server.shutdown()
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+def compare(args) -> None:
+    '''Прогон одних и тех же сценариев против backend двух ревизий через git worktree'''
+    passthrough = ['--iterations', str(args.iterations), '--warmup', str(args.warmup),
+                   '--alloc-samples', str(args.alloc_samples), '--stub-latency', str(args.stub_latency)]
+    if args.only:
+        passthrough += ['--only', args.only]
+    if args.scenario:
+        passthrough += ['--scenario', args.scenario]
+    if args.heavy:
+        passthrough.append('--heavy')
+
+    reports = {}
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        for rev in (args.base, args.head):
+            with checkout(rev, workdir) as tree:
+                report = os.path.join(workdir, os.path.basename(tree) + '.json')
+                print(f'== {rev}')
+                subprocess.run([sys.executable, os.path.abspath(__file__), 'run', '--backend-dir', os.path.join(tree, 'backend'),
+                                '--json', report] + passthrough, check=True)
+                with open(report, encoding='utf-8') as f:
+                    reports[rev] = {(r['function'], r['scenario']): r for r in json.load(f)}
+
+    print_comparison(reports[args.base], reports[args.head], args.base, args.head)
+
+def print_comparison(base: Dict[tuple, Dict[str, Any]], head: Dict[tuple, Dict[str, Any]], base_label: str, head_label: str) -> None:
+    '''Разница двух прогонов по сценариям: p50, p95, запросы к БД и пиковые аллокации'''
+    print(f'\n{base_label} -> {head_label}')
+    header = f"{'function':<18} {'scenario':<22} {'p50 ms':>19} {'p95 ms':>19} {'queries':>13} {'peak KB':>17}"
+    print(header)
+    print('-' * len(header))
+    for key in base:
+        if key not in head:
+            continue
+        a, b = base[key], head[key]
+        speedup = a['p50_ms'] / b['p50_ms'] if b['p50_ms'] else 0
+        print(f"{key[0]:<18} {key[1]:<22} {a['p50_ms']:>8.2f} > {b['p50_ms']:<8.2f} {a['p95_ms']:>8.2f} > {b['p95_ms']:<8.2f} "
+              f"{a['queries_per_call']:>5.1f} > {b['queries_per_call']:<5.1f} {a['peak_alloc_kb']:>7.1f} > {b['peak_alloc_kb']:<7.1f} x{speedup:.2f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    for sub in (run_parser, compare_parser):
+        sub.add_argument('--iterations', type=int, default=200)
+        sub.add_argument('--warmup', type=int, default=5)
+        sub.add_argument('--alloc-samples', type=int, default=5)
+        sub.add_argument('--only', help='функции через запятую')
+        sub.add_argument('--scenario', help='сценарии через запятую')
+        sub.add_argument('--heavy', action='store_true', help='полный список и выгрузка заявок')
+        sub.add_argument('--stub-latency', type=float, default=0.0)
+    run_parser.add_argument('--backend-dir', default=BACKEND_DIR)
+    run_parser.add_argument('--json', help='сохранить результаты в файл')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+if __name__ == '__main__':
+    main()
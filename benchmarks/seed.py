@@ -0,0 +1,151 @@
+'''
+Подготовка локальной базы для бенчмарков
+Применяет db_migrations к схеме t_p90313977_education_center_web и заполняет
+её синтетическими данными: сотни преподавателей и отзывов, от 10 тыс. до 1 млн заявок.
+Данные генерируются на стороне PostgreSQL через generate_series, поэтому
+миллион заявок вставляется за десятки секунд.
+
+Запуск: DATABASE_URL=postgresql://... python benchmarks/seed.py --reset [--bookings 100000] [--until V0016]
+'''
+import argparse
+import glob
+import os
+import sys
+import time
+from typing import Optional
+
+import psycopg2
+
+from harness import MIGRATIONS_DIR, SCHEMA
+
+SUBJECTS = ['Математика', 'Физика', 'Химия', 'Биология', 'Русский язык', 'Информатика', 'Обществознание', 'История']
+STATUSES = ['new', 'new', 'confirmed', 'confirmed', 'completed', 'completed', 'completed', 'cancelled']
+BOOKINGS_CHUNK = 100000
+
+def apply_migrations(cur, until: Optional[str] = None) -> None:
+    '''Пересоздание схемы и применение миграций по порядку (до версии until включительно)'''
+    cur.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    cur.execute(f'CREATE SCHEMA {SCHEMA}')
+    cur.execute(f'SET search_path TO {SCHEMA}, public')
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*.sql'))):
+        if until and os.path.basename(path).split('__')[0] > until:
+            break
+        with open(path, encoding='utf-8') as f:
+            cur.execute(f.read())
+        print(f'applied {os.path.basename(path)}')
+
+def seed_content(cur, teachers: int, reviews: int) -> None:
+    '''Преподаватели, расписание, контакты, отзывы и события календаря'''
+    cur.execute('''
+        INSERT INTO teachers (full_name, subject, experience_years, name, description, specialization, experience, sort_order)
+        SELECT 'Преподаватель ' || g, (%(subjects)s::text[])[1 + g %% array_length(%(subjects)s::text[], 1)], 1 + g %% 30,
+               'Преподаватель ' || g, repeat('Готовит к ОГЭ и ЕГЭ. ', 1 + g %% 5),
+               (%(subjects)s::text[])[1 + g %% array_length(%(subjects)s::text[], 1)], (1 + g %% 30) || ' лет', g
+        FROM generate_series(1, %(teachers)s) g
+    ''', {'subjects': SUBJECTS, 'teachers': teachers})
+    cur.execute('''
+        INSERT INTO schedule (time, title, description, teacher_id, sort_order)
+        SELECT lpad((9 + g %% 10)::text, 2, '0') || ':00', (%(subjects)s::text[])[1 + g %% array_length(%(subjects)s::text[], 1)],
+               'Группа ' || g, t.id, g
+        FROM generate_series(1, %(teachers)s) g
+        JOIN teachers t ON t.sort_order = g
+    ''', {'subjects': SUBJECTS, 'teachers': teachers})
+    cur.execute('''
+        INSERT INTO contacts (type, value, icon, label, sort_order) VALUES
+        ('phone', '+7 (999) 123-45-67', 'Phone', 'Телефон', 1),
+        ('email', 'info@example.com', 'Mail', 'Почта', 2),
+        ('address', 'ул. Ленина, 1', 'MapPin', 'Адрес', 3),
+        ('telegram', '@edu_center', 'Send', 'Telegram', 4)
+    ''')
+    cur.execute('''
+        INSERT INTO reviews (author_name, rating, review_text, date, is_published, sort_order)
+        SELECT 'Ученик ' || g, 1 + g %% 5, repeat('Отличные занятия, сдал экзамен на высокий балл. ', 1 + g %% 4),
+               DATE '2024-01-01' + g %% 600, g %% 4 <> 0, g
+        FROM generate_series(1, %(reviews)s) g
+    ''', {'reviews': reviews})
+    cur.execute('''
+        INSERT INTO calendar_events (date, title, description, event_type, sort_order)
+        SELECT DATE '2024-09-01' + g * 3, 'Событие ' || g, 'Пробный экзамен', 'exam', g
+        FROM generate_series(1, 120) g
+    ''')
+
+def seed_recurring_events(cur) -> None:
+    '''Повторяющиеся занятия календаря (V0018): еженедельные группы, ежедневные интенсивы и ежемесячные пробники'''
+    cur.execute('''
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = 'calendar_events' AND column_name = 'recurrence_rule'
+    ''', (SCHEMA,))
+    if cur.fetchone() is None:
+        return
+    cur.execute('''
+        INSERT INTO calendar_events (date, title, description, event_type, sort_order, recurrence_rule)
+        SELECT DATE '2024-09-02' + g % 7, 'Группа ' || g, 'Занятие группы', 'lesson', 1000 + g,
+               CASE g % 4 WHEN 0 THEN 'FREQ=WEEKLY;BYDAY=MO,WE,FR'
+                           WHEN 1 THEN 'FREQ=WEEKLY;INTERVAL=2;UNTIL=2026-05-31'
+                           WHEN 2 THEN 'FREQ=DAILY;COUNT=10'
+                           ELSE 'FREQ=MONTHLY' END
+        FROM generate_series(1, 40) g
+    ''')
+
+def seed_bookings(cur, conn, total: int) -> None:
+    '''Заявки, равномерно распределённые по последнему году, порциями по BOOKINGS_CHUNK'''
+    inserted = 0
+    while inserted < total:
+        chunk = min(BOOKINGS_CHUNK, total - inserted)
+        cur.execute('''
+            INSERT INTO student_bookings (student_name, student_phone, student_email, selected_teacher,
+                                          selected_subject, selected_time, status, created_at, updated_at)
+            SELECT 'Ученик ' || g, '+7 9' || lpad((g %% 1000000000)::text, 9, '0'), 'student' || g || '@example.com',
+                   'Преподаватель ' || (1 + g %% 200), (%(subjects)s::text[])[1 + g %% array_length(%(subjects)s::text[], 1)],
+                   lpad((9 + g %% 10)::text, 2, '0') || ':00', (%(statuses)s::text[])[1 + g %% array_length(%(statuses)s::text[], 1)],
+                   ts, ts
+            FROM generate_series(%(start)s, %(stop)s) g,
+                 LATERAL (SELECT now()::timestamp - interval '365 days' * (1 - g::float8 / %(total)s) AS ts) t
+        ''', {'subjects': SUBJECTS, 'statuses': STATUSES, 'start': inserted + 1,
+              'stop': inserted + chunk, 'total': total})
+        conn.commit()
+        inserted += chunk
+        print(f'bookings {inserted}/{total}')
+
+def enable_notifications(cur) -> None:
+    '''Включение каналов уведомлений, чтобы submit-booking наполнял outbox'''
+    cur.execute('''
+        UPDATE notification_settings
+        SET is_enabled = true,
+            value = CASE notification_type WHEN 'email' THEN 'admin@example.com' ELSE '123456' END
+    ''')
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reset', action='store_true', help='пересоздать схему и применить миграции')
+    parser.add_argument('--until', help='последняя применяемая миграция, например V0016')
+    parser.add_argument('--bookings', type=int, default=10000)
+    parser.add_argument('--teachers', type=int, default=200)
+    parser.add_argument('--reviews', type=int, default=500)
+    parser.add_argument('--no-notifications', action='store_true')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is not set')
+
+    started = time.perf_counter()
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    if args.reset:
+        apply_migrations(cur, args.until)
+    cur.execute(f'SET search_path TO {SCHEMA}, public')
+    seed_content(cur, args.teachers, args.reviews)
+    seed_recurring_events(cur)
+    if not args.no_notifications:
+        enable_notifications(cur)
+    conn.commit()
+    seed_bookings(cur, conn, args.bookings)
+
+    conn.autocommit = True
+    cur.execute('VACUUM ANALYZE')
+    cur.close()
+    conn.close()
+    print(f'seeded in {time.perf_counter() - started:.1f}s')
+
+if __name__ == '__main__':
+    main()
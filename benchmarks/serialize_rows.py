@@ -0,0 +1,117 @@
+'''
+Микробенчмарк сериализации строк student_bookings
+Сравнивает исходный цикл hasattr/isinstance по каждой ячейке с планом
+конвертеров по OID колонок и с JSON-готовыми значениями из типкастеров.
+
+Запуск: python benchmarks/serialize_rows.py [--rows 100000] [--repeat 5]
+'''
+import argparse
+import datetime
+import json
+import sys
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from harness import load_function
+
+BOOKING_DESCRIPTION = [
+    ('id', 23),
+    ('student_name', 1043),
+    ('student_phone', 1043),
+    ('student_email', 1043),
+    ('selected_teacher', 1043),
+    ('selected_subject', 1043),
+    ('selected_time', 1043),
+    ('status', 1043),
+    ('created_at', 1114),
+    ('updated_at', 1114),
+    ('price', 1700)
+]
+
+def make_rows(count: int) -> List[tuple]:
+    '''Синтетические строки в том виде, в каком их отдаёт psycopg2'''
+    start = datetime.datetime(2024, 9, 1, 9, 0, 0, 123456)
+    rows = []
+    for i in range(count):
+        created = start + datetime.timedelta(minutes=i)
+        rows.append((
+            i + 1,
+            f'Ученик {i}',
+            f'+7 900 {i:07d}',
+            f'student{i}@example.com',
+            'Анна Петровна Смирнова',
+            'Математика',
+            '10:00',
+            'new',
+            created,
+            created,
+            Decimal('1500.00')
+        ))
+    return rows
+
+def make_json_ready_rows(rows: List[tuple]) -> List[tuple]:
+    '''Те же строки после JSON-типкастеров: даты строками, numeric как float'''
+    return [
+        row[:8] + (row[8].isoformat(), row[9].isoformat(), float(row[10]))
+        for row in rows
+    ]
+
+def legacy_serialize(description, rows: List[tuple]) -> List[Dict]:
+    '''Исходный цикл из get_entities'''
+    columns = [desc[0] for desc in description]
+    result = []
+    for row in rows:
+        row_dict = {}
+        for i, col in enumerate(columns):
+            val = row[i]
+            if hasattr(val, 'isoformat'):
+                val = val.isoformat()
+            elif isinstance(val, Decimal):
+                val = float(val)
+            row_dict[col] = val
+        result.append(row_dict)
+    return result
+
+def measure(fn: Callable[[], Any], repeat: int) -> float:
+    '''Лучшее время из нескольких прогонов, в секундах'''
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    module = load_function('admin-api')
+    rows = make_rows(args.rows)
+    ready_rows = make_json_ready_rows(rows)
+
+    plan = module.build_row_converter(BOOKING_DESCRIPTION)
+    ready_plan = module.build_row_converter(BOOKING_DESCRIPTION, json_ready=True)
+    assert legacy_serialize(BOOKING_DESCRIPTION, rows) == [plan(row) for row in rows]
+
+    legacy_result = legacy_serialize(BOOKING_DESCRIPTION, rows)
+    cases = [
+        ('legacy hasattr/isinstance loop', lambda: legacy_serialize(BOOKING_DESCRIPTION, rows)),
+        ('converter plan by type OID', lambda: [plan(row) for row in rows]),
+        ('JSON-ready typecasters', lambda: [ready_plan(row) for row in ready_rows]),
+        ('json.dumps', lambda: json.dumps(legacy_result)),
+        ('dumps_json (orjson=%s)' % ('yes' if module.orjson else 'no'), lambda: module.dumps_json(legacy_result))
+    ]
+
+    baseline = None
+    print(f'rows={args.rows} repeat={args.repeat}')
+    for name, fn in cases:
+        elapsed = measure(fn, args.repeat)
+        if baseline is None or name == 'json.dumps':
+            baseline = elapsed
+        print(f'{name:<36} {elapsed * 1000:9.1f} ms  x{baseline / elapsed:5.2f}')
+
+if __name__ == '__main__':
+    sys.exit(main())
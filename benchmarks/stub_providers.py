@@ -0,0 +1,105 @@
+'''
+Локальные заглушки Telegram Bot API и SendGrid для проверки send-notification
+Отвечают как настоящие провайдеры (200 и 202), умеют задержку и случайные ошибки.
+
+Запуск: python benchmarks/stub_providers.py [--port 8025] [--latency 0.2] [--fail-rate 0.3]
+Затем функции указывают адрес заглушки:
+    TELEGRAM_API_URL=http://127.0.0.1:8025 SENDGRID_API_URL=http://127.0.0.1:8025
+'''
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+class StubProviders:
+    '''Состояние заглушек: настройки и принятые запросы'''
+    def __init__(self, latency: float = 0.0, fail_rate: float = 0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.requests: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+
+    def record(self, provider: str, path: str, body: Any) -> None:
+        with self.lock:
+            self.requests.append({'provider': provider, 'path': path, 'body': body, 'at': time.time()})
+
+    def count(self, provider: str) -> int:
+        with self.lock:
+            return sum(1 for item in self.requests if item['provider'] == provider)
+
+def make_handler(state: StubProviders):
+    '''Класс обработчика HTTP, привязанный к состоянию заглушек'''
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+        def reply(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            try:
+                body = json.loads(raw or b'{}')
+            except ValueError:
+                body = raw.decode('utf-8', 'replace')
+
+            if state.latency:
+                time.sleep(state.latency)
+            failing = random.random() < state.fail_rate
+
+            if self.path.startswith('/bot') and self.path.endswith('/sendMessage'):
+                state.record('telegram', self.path, body)
+                if failing:
+                    self.reply(502, {'ok': False, 'description': 'Bad Gateway'})
+                else:
+                    self.reply(200, {'ok': True, 'result': {'message_id': len(state.requests)}})
+            elif self.path == '/v3/mail/send':
+                state.record('sendgrid', self.path, body)
+                if failing:
+                    self.reply(503, {'errors': [{'message': 'Service Unavailable'}]})
+                else:
+                    self.send_response(202)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+            else:
+                self.reply(404, {'error': 'Not found'})
+
+    return Handler
+
+def start_stub_server(port: int = 0, latency: float = 0.0, fail_rate: float = 0.0):
+    '''Запуск заглушек в фоновом потоке; возвращает (server, state, base_url)'''
+    state = StubProviders(latency, fail_rate)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f'http://127.0.0.1:{server.server_address[1]}'
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(args.port, args.latency, args.fail_rate)
+    print(f'Stub providers listening on {base_url}')
+    try:
+        while True:
+            time.sleep(5)
+            print(f'telegram={state.count("telegram")} sendgrid={state.count("sendgrid")}')
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+'''
+Общие фикстуры проверок обработчиков: функции загружаются через harness.load_function и вызываются событиями make_event
+Запуск: DATABASE_URL=postgresql://... python -m pytest benchmarks/tests -q
+Проверки без БД работают всегда, остальные пропускаются, если DATABASE_URL не задан (схема - seed.py)
+'''
+import os
+import sys
+from typing import Any, Dict, Iterator
+
+import pytest
+
+BENCHMARKS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from harness import load_function, make_event  # noqa: E402
+from stub_providers import start_stub_server  # noqa: E402
+
+# Настройки читаются при импорте функций, поэтому задаются до первой загрузки
+os.environ.setdefault('AUTH_TOKEN_SECRET', 'test-secret,test-secret-previous')
+os.environ.setdefault('OUTBOX_DISPATCH_SECRET', 'test-dispatch-secret')
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'test-token')
+os.environ.setdefault('SENDGRID_API_KEY', 'test-key')
+os.environ['BOOKING_RATE_LIMIT'] = '0'
+
+_server, STUB, _stub_url = start_stub_server()
+os.environ['TELEGRAM_API_URL'] = _stub_url
+os.environ['SENDGRID_API_URL'] = _stub_url
+
+_modules: Dict[str, Any] = {}
+
+def function(name: str):
+    '''Модуль облачной функции, один на сессию проверок, как тёплый контейнер'''
+    if name not in _modules:
+        _modules[name] = load_function(name)
+    return _modules[name]
+
+def call(name: str, method: str = 'GET', query: Dict[str, str] = None, body: Any = None,
+         headers: Dict[str, str] = None) -> Dict[str, Any]:
+    return function(name).handler(make_event(method, query, body, headers), None)
+
+@pytest.fixture
+def stub():
+    '''Заглушки Telegram и SendGrid; доля ошибок сбрасывается после проверки'''
+    yield STUB
+    STUB.fail_rate = 0.0
+
+@pytest.fixture
+def db() -> Iterator[Any]:
+    '''Отдельное соединение проверки с БД; без DATABASE_URL проверка пропускается'''
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        pytest.skip('DATABASE_URL is not set')
+    import psycopg2
+    conn = psycopg2.connect(url)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+@pytest.fixture
+def admin_headers() -> Dict[str, str]:
+    '''Заголовок подписанного токена администратора, как после входа через auth'''
+    return {'X-Auth-Token': function('auth').sign_token(1)}
@@ -0,0 +1,73 @@
+'''Keyset-страницы заявок admin-api: курсор проходит по (created_at, id) без пропусков и повторов, ошибки клиента - 400'''
+import base64
+import datetime
+import json
+
+import pytest
+
+from conftest import call
+
+SUBJECT = 'test-cursor-subject'
+
+@pytest.fixture
+def bookings(db):
+    '''Заявки проверки: пять с одинаковым created_at (ключ страниц решает id) и две старше; удаляются после проверки'''
+    now = datetime.datetime.now().replace(microsecond=0)
+    created = [now] * 5 + [now - datetime.timedelta(minutes=1)] * 2
+    cur = db.cursor()
+    ids = []
+    for index, created_at in enumerate(created):
+        cur.execute(
+            """
+            INSERT INTO t_p90313977_education_center_web.student_bookings (student_name, student_phone, selected_subject, created_at)
+            VALUES (%s, '+7 900 000-00-00', %s, %s)
+            RETURNING id
+            """,
+            (f'Курсор {index}', SUBJECT, created_at)
+        )
+        ids.append((created_at, cur.fetchone()[0]))
+    db.commit()
+    yield ids
+
+    cur.execute(
+        'DELETE FROM t_p90313977_education_center_web.student_bookings WHERE selected_subject = %s',
+        (SUBJECT,)
+    )
+    db.commit()
+
+def get_page(headers, **query):
+    response = call('admin-api', 'GET', {'entity': 'bookings', 'subject': SUBJECT, **query}, headers=headers)
+    return response['statusCode'], json.loads(response['body'])
+
+def test_cursor_round_trip_visits_every_row_once(bookings, admin_headers):
+    status, page = get_page(admin_headers, limit='2')
+    assert status == 200
+    assert page['since']
+    seen = [item['id'] for item in page['items']]
+    pages = 1
+    while page['next_cursor']:
+        status, page = get_page(admin_headers, limit='2', cursor=page['next_cursor'])
+        assert status == 200
+        assert 'since' not in page
+        seen.extend(item['id'] for item in page['items'])
+        pages += 1
+
+    expected = [row_id for _, row_id in sorted(bookings, key=lambda row: (row[0], row[1]), reverse=True)]
+    assert seen == expected
+    assert pages == 4
+
+@pytest.mark.parametrize('query', [
+    {'limit': '0'},
+    {'limit': '501'},
+    {'limit': '２'},
+    {'limit': 'ten'},
+    {'cursor': 'not-a-cursor'},
+    {'cursor': base64.urlsafe_b64encode(b'["2026-01-01T00:00:00", "1"]').decode('ascii')},
+    {'cursor': base64.urlsafe_b64encode(b'["yesterday", 1]').decode('ascii')},
+    {'date_from': '2026-02-30'},
+    {'date_to': 'today'}
+])
+def test_invalid_page_parameters_are_client_errors(bookings, admin_headers, query):
+    status, body = get_page(admin_headers, **query)
+    assert status == 400
+    assert body['error']
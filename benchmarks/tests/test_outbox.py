@@ -0,0 +1,104 @@
+'''Очередь notification_outbox send-notification: экспоненциальные повторы, dead-letter и секрет диспетчера'''
+import json
+
+import pytest
+
+from conftest import call, function
+
+RECIPIENT = 'outbox-test'
+DISPATCH_HEADERS = {'X-Dispatch-Secret': 'test-dispatch-secret'}
+
+def test_backoff_delay_grows_exponentially_within_jitter():
+    module = function('send-notification')
+    for attempts in range(1, 12):
+        base = min(module.OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), module.OUTBOX_BACKOFF_MAX)
+        for _ in range(50):
+            assert base * 0.8 <= module.backoff_delay(attempts) <= base * 1.2
+    assert module.backoff_delay(30) <= module.OUTBOX_BACKOFF_MAX * 1.2
+
+@pytest.mark.parametrize('headers', [{}, {'X-Dispatch-Secret': 'wrong'}, {'X-Dispatch-Secret': 'test-dispatch-sécret'}])
+def test_dispatch_requires_secret(headers):
+    response = call('send-notification', 'POST', {'action': 'dispatch'}, body={}, headers=headers)
+    assert response['statusCode'] == 401
+
+@pytest.fixture
+def outbox(db):
+    '''Два уведомления в Telegram: последняя попытка и первая; удаляются после проверки'''
+    module = function('send-notification')
+    cur = db.cursor()
+    ids = []
+    for attempts in (module.OUTBOX_MAX_ATTEMPTS - 1, 0):
+        cur.execute(
+            """
+            INSERT INTO t_p90313977_education_center_web.notification_outbox (channel, recipient, payload, attempts)
+            VALUES ('telegram', %s, %s, %s)
+            RETURNING id
+            """,
+            (RECIPIENT, json.dumps({'student_name': 'Очередь', 'student_phone': '+7 900 000-00-00'}), attempts)
+        )
+        ids.append(cur.fetchone()[0])
+    db.commit()
+    yield ids
+
+    cur.execute('DELETE FROM t_p90313977_education_center_web.notification_outbox WHERE recipient = %s', (RECIPIENT,))
+    db.commit()
+
+def outbox_rows(db, ids):
+    cur = db.cursor()
+    cur.execute(
+        """
+        SELECT status, attempts, last_error,
+               EXTRACT(EPOCH FROM next_attempt_at - CURRENT_TIMESTAMP)::float8, sent_at IS NOT NULL
+        FROM t_p90313977_education_center_web.notification_outbox
+        WHERE id = ANY(%s)
+        ORDER BY array_position(%s, id)
+        """,
+        (ids, ids)
+    )
+    rows = cur.fetchall()
+    db.commit()
+    return rows
+
+def recipient_requests(stub):
+    '''Запросы заглушки Telegram к получателю проверки: фоновые уведомления других проверок сюда не попадают'''
+    with stub.lock:
+        return [item for item in stub.requests if item['provider'] == 'telegram' and item['body'].get('chat_id') == RECIPIENT]
+
+def dispatch():
+    response = call('send-notification', 'POST', {'action': 'dispatch'}, body={}, headers=DISPATCH_HEADERS)
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['dispatched']
+
+def test_failed_delivery_retries_with_backoff_then_dead_letters(db, stub, outbox):
+    module = function('send-notification')
+    first_try = outbox[1]
+    stub.fail_rate = 1.0
+    stats = dispatch()
+    assert stats['dead'] >= 1 and stats['retried'] >= 1
+
+    (dead_status, dead_attempts, dead_error, _, dead_sent), (status, attempts, error, delay, sent) = outbox_rows(db, outbox)
+    assert (dead_status, dead_attempts, dead_sent) == ('dead', module.OUTBOX_MAX_ATTEMPTS, False)
+    assert dead_error
+    assert (status, attempts, sent) == ('pending', 1, False)
+    assert error
+    # Первый повтор - через OUTBOX_BACKOFF_BASE секунд с джиттером ±20%
+    assert module.OUTBOX_BACKOFF_BASE * 0.8 - 2 <= delay <= module.OUTBOX_BACKOFF_BASE * 1.2
+
+    # До срока повтора строка не захватывается
+    dispatch()
+    assert outbox_rows(db, [first_try])[0][:2] == ('pending', 1)
+
+    # Провайдер снова отвечает: повтор после срока отправляется, dead-letter больше не трогается
+    stub.fail_rate = 0.0
+    delivered = len(recipient_requests(stub))
+    cur = db.cursor()
+    cur.execute(
+        'UPDATE t_p90313977_education_center_web.notification_outbox SET next_attempt_at = CURRENT_TIMESTAMP WHERE id = %s',
+        (first_try,)
+    )
+    db.commit()
+    assert dispatch()['sent'] >= 1
+    rows = outbox_rows(db, outbox)
+    assert rows[0][:2] == ('dead', module.OUTBOX_MAX_ATTEMPTS)
+    assert (rows[1][0], rows[1][1], rows[1][2], rows[1][4]) == ('sent', 2, None, True)
+    assert len(recipient_requests(stub)) == delivered + 1
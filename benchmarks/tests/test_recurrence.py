@@ -0,0 +1,129 @@
+'''Разворачивание правил повторения календаря public-api (V0018, V0020): COUNT, UNTIL, BYDAY и пропуск коротких месяцев'''
+import datetime
+import json
+import random
+
+import pytest
+
+from conftest import call, function
+
+D = datetime.date
+
+def expand(start: datetime.date, rule: str, window_start: datetime.date, window_end: datetime.date):
+    return list(function('public-api').expand_occurrences(start, rule, window_start, window_end))
+
+def week_start(day: datetime.date) -> datetime.date:
+    return day - datetime.timedelta(days=day.weekday())
+
+def naive_occurrences(start: datetime.date, rule: str, window_end: datetime.date):
+    '''Эталон: перебор всех дней от начала с подсчётом COUNT по порядку'''
+    parsed = function('public-api').parse_recurrence_rule(rule)
+    last = min(window_end, parsed['until']) if parsed['until'] else window_end
+    found = []
+    day = start
+    while day <= last and (parsed['count'] is None or len(found) < parsed['count']):
+        if parsed['freq'] == 'DAILY':
+            match = (day - start).days % parsed['interval'] == 0
+        elif parsed['freq'] == 'WEEKLY':
+            weeks = (week_start(day) - week_start(start)).days // 7
+            match = weeks % parsed['interval'] == 0 and day.weekday() in (parsed['byday'] or [start.weekday()])
+        else:
+            months = (day.year - start.year) * 12 + day.month - start.month
+            match = day.day == start.day and months % parsed['interval'] == 0
+        if match:
+            found.append(day)
+        day += datetime.timedelta(days=1)
+    return found
+
+def test_daily_count_with_window_inside_series():
+    rule = 'FREQ=DAILY;INTERVAL=2;COUNT=5'
+    assert expand(D(2026, 1, 1), rule, D(2026, 1, 1), D(2026, 12, 31)) == [
+        D(2026, 1, 1), D(2026, 1, 3), D(2026, 1, 5), D(2026, 1, 7), D(2026, 1, 9)]
+    # Номер вхождения для COUNT считается и для пропущенных до окна повторений
+    assert expand(D(2026, 1, 1), rule, D(2026, 1, 4), D(2026, 12, 31)) == [D(2026, 1, 5), D(2026, 1, 7), D(2026, 1, 9)]
+
+@pytest.mark.parametrize('until', ['2026-01-29', '20260129'])
+def test_weekly_until_is_inclusive_in_both_formats(until):
+    assert expand(D(2026, 1, 1), f'FREQ=WEEKLY;UNTIL={until}', D(2025, 12, 1), D(2026, 3, 1)) == [
+        D(2026, 1, 1), D(2026, 1, 8), D(2026, 1, 15), D(2026, 1, 22), D(2026, 1, 29)]
+
+def test_weekly_byday_counts_from_first_occurrence():
+    # Первое занятие в среду: понедельник первой недели раньше начала и в COUNT не входит
+    assert expand(D(2026, 1, 7), 'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=4', D(2026, 1, 1), D(2026, 2, 28)) == [
+        D(2026, 1, 7), D(2026, 1, 12), D(2026, 1, 14), D(2026, 1, 19)]
+    assert expand(D(2026, 1, 7), 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=4', D(2026, 1, 15), D(2026, 2, 28)) == [
+        D(2026, 1, 19), D(2026, 1, 21), D(2026, 2, 2)]
+
+def test_monthly_skips_months_without_the_day():
+    rule = 'FREQ=MONTHLY;COUNT=4'
+    assert expand(D(2026, 1, 31), rule, D(2026, 1, 1), D(2026, 12, 31)) == [
+        D(2026, 1, 31), D(2026, 3, 31), D(2026, 5, 31), D(2026, 7, 31)]
+    # Пропущенные февраль, апрель и июнь не расходуют COUNT и при окне с середины серии
+    assert expand(D(2026, 1, 31), rule, D(2026, 4, 1), D(2026, 12, 31)) == [D(2026, 5, 31), D(2026, 7, 31)]
+    assert expand(D(2024, 1, 29), 'FREQ=MONTHLY;INTERVAL=12', D(2024, 1, 1), D(2033, 1, 1)) == [
+        D(2024, 1, 29), D(2025, 1, 29), D(2026, 1, 29), D(2027, 1, 29), D(2028, 1, 29),
+        D(2029, 1, 29), D(2030, 1, 29), D(2031, 1, 29), D(2032, 1, 29)]
+    assert expand(D(2024, 2, 29), 'FREQ=MONTHLY;INTERVAL=12;COUNT=2', D(2024, 1, 1), D(2033, 1, 1)) == [
+        D(2024, 2, 29), D(2028, 2, 29)]
+
+def test_random_windows_match_naive_expansion():
+    rng = random.Random(24)
+    rules = ['FREQ=DAILY', 'FREQ=WEEKLY', 'FREQ=MONTHLY']
+    for _ in range(300):
+        parts = [rng.choice(rules)]
+        if rng.random() < 0.5:
+            parts.append(f'INTERVAL={rng.randint(1, 4)}')
+        if parts[0] == 'FREQ=WEEKLY' and rng.random() < 0.6:
+            parts.append('BYDAY=' + ','.join(rng.sample(['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU'], rng.randint(1, 3))))
+        start = D(2026, 1, 1) + datetime.timedelta(days=rng.randint(0, 120))
+        if rng.random() < 0.5:
+            parts.append(f'COUNT={rng.randint(1, 30)}')
+        else:
+            parts.append('UNTIL=' + (start + datetime.timedelta(days=rng.randint(0, 400))).strftime('%Y%m%d'))
+        rule = ';'.join(parts)
+        window_start = start + datetime.timedelta(days=rng.randint(-30, 300))
+        window_end = window_start + datetime.timedelta(days=rng.randint(0, 120))
+        expected = [day for day in naive_occurrences(start, rule, window_end) if day >= window_start]
+        assert expand(start, rule, window_start, window_end) == expected, (start, rule, window_start, window_end)
+
+def test_calendar_endpoint_expands_only_requested_period(db):
+    cur = db.cursor()
+    cur.execute(
+        """
+        INSERT INTO t_p90313977_education_center_web.calendar_events (date, title, event_type, recurrence_rule)
+        VALUES ('2031-01-31', 'test-recurrence-monthly', 'test', 'FREQ=MONTHLY;COUNT=4')
+        RETURNING id
+        """
+    )
+    event_id = cur.fetchone()[0]
+    db.commit()
+    try:
+        response = call('public-api', 'GET', {'entity': 'calendar', 'from': '2031-02-01', 'to': '2031-06-30'})
+        assert response['statusCode'] == 200
+        days = [event['date'] for event in json.loads(response['body'])['events'] if event['id'] == event_id]
+        assert days == ['2031-03-31', '2031-05-31']
+    finally:
+        cur.execute('DELETE FROM t_p90313977_education_center_web.calendar_events WHERE id = %s', (event_id,))
+        db.commit()
+
+def test_impossible_until_is_a_constraint_violation(db):
+    import psycopg2
+    cur = db.cursor()
+    with pytest.raises(psycopg2.errors.CheckViolation):
+        cur.execute(
+            """
+            INSERT INTO t_p90313977_education_center_web.calendar_events (date, title, recurrence_rule)
+            VALUES ('2026-01-05', 'test-recurrence-until', 'FREQ=WEEKLY;UNTIL=20260230')
+            """
+        )
+
+@pytest.mark.parametrize('query', [
+    {'from': '2026-02-30'},
+    {'from': '2026-03-01', 'to': 'march'},
+    {'from': '2026-03-10', 'to': '2026-03-01'},
+    {'from': '2026-01-01', 'to': '2027-01-02'}
+])
+def test_invalid_calendar_period_is_a_client_error(query):
+    response = call('public-api', 'GET', {'entity': 'calendar', **query})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error']
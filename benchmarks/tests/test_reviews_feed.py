@@ -0,0 +1,79 @@
+'''Лента отзывов public-api (V0019): страницы опубликованных отзывов и сводка review_stats, которую ведут триггеры'''
+import json
+
+import pytest
+
+from conftest import call
+
+@pytest.mark.parametrize('query', [
+    {'limit': '0'},
+    {'limit': 'ten'},
+    {'limit': '²'},
+    {'offset': '-1'},
+    {'offset': '99999999999999999999'}
+])
+def test_invalid_feed_page_is_a_client_error(query):
+    response = call('public-api', 'GET', {'entity': 'reviews_feed', **query})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error']
+
+STATS_COLUMNS = 'published, rated, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5'
+
+def stats_and_recount(cur):
+    cur.execute(f'SELECT {STATS_COLUMNS} FROM t_p90313977_education_center_web.review_stats')
+    stats = cur.fetchone()
+    cur.execute(
+        """
+        SELECT COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0),
+               COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+               COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5)
+        FROM t_p90313977_education_center_web.reviews
+        WHERE is_published
+        """
+    )
+    return stats, cur.fetchone()
+
+def test_review_stats_follow_every_kind_of_write(db):
+    '''Вставка, смена оценки, снятие и возврат публикации, правка текста и удаление - сводка равна пересчёту; всё откатывается'''
+    cur = db.cursor()
+    stats, recount = stats_and_recount(cur)
+    assert stats == recount
+
+    cur.execute(
+        """
+        INSERT INTO t_p90313977_education_center_web.reviews (author_name, review_text, rating, is_published)
+        VALUES ('test-stats', 'a', 5, true), ('test-stats', 'b', 4, true), ('test-stats', 'c', NULL, true),
+               ('test-stats', 'd', 1, false), ('test-stats', 'e', 3, NULL)
+        RETURNING id
+        """
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    steps = [
+        ('UPDATE t_p90313977_education_center_web.reviews SET rating = 2 WHERE id = %s', (ids[1],)),
+        ('UPDATE t_p90313977_education_center_web.reviews SET rating = 4 WHERE id = %s', (ids[2],)),
+        ('UPDATE t_p90313977_education_center_web.reviews SET is_published = false WHERE id = %s', (ids[0],)),
+        ('UPDATE t_p90313977_education_center_web.reviews SET is_published = true WHERE id = ANY(%s)', ([ids[3], ids[4]],)),
+        ('UPDATE t_p90313977_education_center_web.reviews SET review_text = review_text || %s WHERE id = ANY(%s)', ('!', ids)),
+        ('UPDATE t_p90313977_education_center_web.reviews SET rating = NULL, is_published = true WHERE id = %s', (ids[0],)),
+        ('DELETE FROM t_p90313977_education_center_web.reviews WHERE id = ANY(%s)', (ids[:3],)),
+        ('DELETE FROM t_p90313977_education_center_web.reviews WHERE id = ANY(%s)', (ids,))
+    ]
+    assert stats_and_recount(cur)[0] != stats
+    for sql, params in [(None, None)] + steps:
+        if sql:
+            cur.execute(sql, params)
+        current, recount = stats_and_recount(cur)
+        assert current == recount, sql
+    assert current == stats
+
+def test_feed_summary_matches_published_reviews(db):
+    cur = db.cursor()
+    _, (published, rated, rating_sum, *histogram) = stats_and_recount(cur)
+    response = call('public-api', 'GET', {'entity': 'reviews_feed', 'limit': '5'})
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert body['stats']['count'] == published
+    assert body['stats']['histogram'] == {str(rating): count for rating, count in enumerate(histogram, 1)}
+    if rated:
+        assert body['stats']['average'] == pytest.approx(rating_sum / rated, abs=0.005)
+    assert len(body['reviews']) == min(5, published)
@@ -0,0 +1,120 @@
+'''Запись на занятие submit-booking при гонке за последние места: мест выдаётся ровно capacity'''
+import datetime
+import json
+import threading
+
+import pytest
+
+from conftest import call, function
+
+CAPACITY = 3
+CLIENTS = 10
+
+@pytest.fixture
+def slot(db):
+    '''Занятие с маленькой вместимостью; заявки, места и уведомления проверки удаляются после неё'''
+    cur = db.cursor()
+    cur.execute(
+        """
+        INSERT INTO t_p90313977_education_center_web.schedule (time, title, description, capacity)
+        VALUES ('18:00 - 19:00', 'test-slot-race', '', %s)
+        RETURNING id
+        """,
+        (CAPACITY,)
+    )
+    schedule_id = cur.fetchone()[0]
+    db.commit()
+    yield schedule_id, datetime.date.today() + datetime.timedelta(days=3)
+
+    cur.execute(
+        """
+        WITH slots AS (
+            SELECT id FROM t_p90313977_education_center_web.schedule_slots WHERE schedule_id = %(id)s
+        ), bookings AS (
+            DELETE FROM t_p90313977_education_center_web.student_bookings WHERE slot_id IN (SELECT id FROM slots)
+            RETURNING id
+        ), idempotency AS (
+            DELETE FROM t_p90313977_education_center_web.booking_idempotency WHERE booking_id IN (SELECT id FROM bookings)
+        )
+        DELETE FROM t_p90313977_education_center_web.notification_outbox WHERE booking_id IN (SELECT id FROM bookings)
+        """,
+        {'id': schedule_id}
+    )
+    cur.execute('DELETE FROM t_p90313977_education_center_web.schedule_slots WHERE schedule_id = %s', (schedule_id,))
+    cur.execute('DELETE FROM t_p90313977_education_center_web.schedule WHERE id = %s', (schedule_id,))
+    db.commit()
+
+def test_concurrent_claims_never_exceed_capacity(db, slot):
+    schedule_id, slot_date = slot
+    barrier = threading.Barrier(CLIENTS)
+    statuses = [None] * CLIENTS
+
+    def submit(index: int) -> None:
+        body = {
+            'student_name': f'Гонка {index}',
+            'student_phone': f'+7 900 555-{index:02d}-00',
+            'schedule_id': schedule_id,
+            'slot_date': slot_date.isoformat()
+        }
+        barrier.wait()
+        statuses[index] = call('submit-booking', 'POST', body=body, headers={'X-Forwarded-For': f'10.21.0.{index}'})['statusCode']
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(CLIENTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] * CAPACITY + [409] * (CLIENTS - CAPACITY)
+    cur = db.cursor()
+    cur.execute(
+        """
+        SELECT o.booked, (SELECT COUNT(*) FROM t_p90313977_education_center_web.student_bookings b WHERE b.slot_id = o.id)
+        FROM t_p90313977_education_center_web.schedule_slots o
+        WHERE o.schedule_id = %s AND o.slot_date = %s
+        """,
+        (schedule_id, slot_date)
+    )
+    assert cur.fetchone() == (CAPACITY, CAPACITY)
+
+    # Полное занятие отвечает 409 и дальше, а public-api больше не показывает его свободным
+    response = call('submit-booking', 'POST', body={
+        'student_name': 'Опоздавший', 'student_phone': '+7 900 555-99-00',
+        'schedule_id': schedule_id, 'slot_date': slot_date.isoformat()
+    }, headers={'X-Forwarded-For': '10.21.1.1'})
+    assert response['statusCode'] == 409
+    availability = json.loads(call('public-api', 'GET', {
+        'entity': 'availability', 'date_from': slot_date.isoformat(), 'date_to': slot_date.isoformat()
+    })['body'])
+    assert schedule_id not in [item['schedule_id'] for item in availability['slots']]
+
+def test_retry_of_last_seat_returns_original_booking(db, slot, monkeypatch):
+    schedule_id, slot_date = slot
+    cur = db.cursor()
+    cur.execute('UPDATE t_p90313977_education_center_web.schedule SET capacity = 1 WHERE id = %s', (schedule_id,))
+    db.commit()
+    body = {'student_name': 'Повтор', 'student_phone': '+7 900 555-77-00', 'schedule_id': schedule_id, 'slot_date': slot_date.isoformat()}
+    headers = {'X-Forwarded-For': '10.21.2.1', 'Idempotency-Key': f'slot-race-{schedule_id}'}
+
+    first = call('submit-booking', 'POST', body=body, headers=headers)
+    assert first['statusCode'] == 201
+    # Повтор из другого контейнера (без кэша в памяти): место занято этой же заявкой, поэтому не 409
+    module = function('submit-booking')
+    monkeypatch.setattr(module, '_recent_bookings', module.TtlLru(module.GUARD_CACHE_SIZE))
+    retry = call('submit-booking', 'POST', body=body, headers=headers)
+    assert retry['statusCode'] == 201
+    assert json.loads(retry['body'])['duplicate'] is True
+    assert json.loads(retry['body'])['booking_id'] == json.loads(first['body'])['booking_id']
+
+@pytest.mark.parametrize('query', [
+    {'date_from': '2026-02-30'},
+    {'date_from': '2031-01-10', 'date_to': '2031-01-01'},
+    {'date_from': '2031-01-01', 'date_to': '2033-01-01'},
+    {'teacher_id': '²'},
+    {'teacher_id': '2147483648'},
+    {'teacher_id': '-1'}
+])
+def test_invalid_availability_query_is_a_client_error(query):
+    response = call('public-api', 'GET', {'entity': 'availability', **query})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error']
@@ -0,0 +1,59 @@
+'''Токены сессии auth и их проверка в admin-api: подпись, срок действия и ротация AUTH_TOKEN_SECRET'''
+import pytest
+
+from conftest import call, function
+
+def auth_headers(token: str):
+    return {'X-Auth-Token': token}
+
+def test_signed_token_is_accepted():
+    token = function('auth').sign_token(7)
+    assert token.startswith('v1.7.')
+    assert function('admin-api').check_auth(auth_headers(token))
+    assert function('admin-api').check_auth({'x-auth-token': token})
+
+@pytest.mark.parametrize('ttl', [0, -1, -3600])
+def test_expired_token_is_rejected(monkeypatch, ttl):
+    monkeypatch.setattr(function('auth'), 'AUTH_TOKEN_TTL_SECONDS', ttl)
+    token = function('auth').sign_token(1)
+    assert not function('admin-api').check_auth(auth_headers(token))
+    # Guard срабатывает до обработчика, поэтому 401 приходит и без БД
+    assert call('admin-api', 'GET', {'entity': 'teachers'}, headers=auth_headers(token))['statusCode'] == 401
+
+def test_previous_key_is_accepted_until_removed(monkeypatch):
+    auth = function('auth')
+    admin_api = function('admin-api')
+    monkeypatch.setattr(auth, 'AUTH_TOKEN_SECRETS', ['test-secret-previous'])
+    token = auth.sign_token(1)
+    assert admin_api.check_auth(auth_headers(token))
+
+    # Старый ключ убран из AUTH_TOKEN_SECRET: выданные им токены больше не проходят, новые - проходят
+    monkeypatch.setattr(admin_api, 'AUTH_TOKEN_KEYS', [b'test-secret'])
+    assert not admin_api.check_auth(auth_headers(token))
+    monkeypatch.setattr(auth, 'AUTH_TOKEN_SECRETS', ['test-secret'])
+    assert admin_api.check_auth(auth_headers(auth.sign_token(1)))
+
+def test_token_signed_with_unknown_key_is_rejected(monkeypatch):
+    monkeypatch.setattr(function('auth'), 'AUTH_TOKEN_SECRETS', ['someone-else'])
+    assert not function('admin-api').check_auth(auth_headers(function('auth').sign_token(1)))
+
+def tampered_tokens():
+    version, admin_id, expires, signature = function('auth').sign_token(1).split('.')
+    return [
+        '',
+        'admin_token_123',
+        f'{version}.2.{expires}.{signature}',
+        f'{version}.{admin_id}.{int(expires) + 3600}.{signature}',
+        f'v2.{admin_id}.{expires}.{signature}',
+        f'{version}.{admin_id}.{expires}.{signature[:-1]}',
+        f'{version}.{admin_id}.{expires}',
+        f'{version}.{admin_id}.{expires}.{signature}.extra',
+        f'{version}.{admin_id}.{expires}.{signature[:-1]}é',
+        f'{version}.{admin_id}.{expires[:-1]}².{signature}',
+        f'{version}.١.{expires}.{signature}'
+    ]
+
+def test_tampered_and_non_ascii_tokens_are_rejected():
+    for token in tampered_tokens():
+        assert not function('admin-api').check_auth(auth_headers(token)), token
+        assert call('admin-api', 'GET', {'entity': 'teachers'}, headers=auth_headers(token))['statusCode'] == 401, token
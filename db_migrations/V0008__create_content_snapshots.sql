@@ -0,0 +1,11 @@
+-- Снимки публичного контента: готовый JSON каждой сущности в сжатом виде
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.content_snapshots (
+    entity VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    body_gzip BYTEA NOT NULL,
+    built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Тело уже сжато gzip, повторное сжатие TOAST не нужно
+ALTER TABLE t_p90313977_education_center_web.content_snapshots
+ALTER COLUMN body_gzip SET STORAGE EXTERNAL;
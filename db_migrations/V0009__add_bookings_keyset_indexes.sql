@@ -0,0 +1,13 @@
+-- Индексы для keyset-пагинации заявок по (created_at, id) с фильтрами.
+-- idx_bookings_status из V0005 не был создан: это имя уже занято индексом таблицы bookings из V0001.
+CREATE INDEX IF NOT EXISTS idx_student_bookings_created_id
+ON t_p90313977_education_center_web.student_bookings (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_status_created_id
+ON t_p90313977_education_center_web.student_bookings (status, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_subject_created_id
+ON t_p90313977_education_center_web.student_bookings (selected_subject, created_at DESC, id DESC);
+
+-- Покрывается префиксом idx_student_bookings_created_id
+DROP INDEX IF EXISTS t_p90313977_education_center_web.idx_bookings_created;
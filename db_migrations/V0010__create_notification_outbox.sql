@@ -0,0 +1,19 @@
+-- Очередь уведомлений: заявка и уведомления пишутся в одной транзакции,
+-- отправкой занимается диспетчер send-notification
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    booking_id INTEGER,
+    channel VARCHAR(50) NOT NULL,
+    recipient TEXT NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sent', 'dead')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+ON t_p90313977_education_center_web.notification_outbox (next_attempt_at)
+WHERE status = 'pending';
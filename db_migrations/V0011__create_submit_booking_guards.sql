@@ -0,0 +1,22 @@
+-- Защита submit-booking от повторных отправок и флуда.
+-- Ключи идемпотентности: повтор в пределах окна возвращает исходную заявку.
+-- booking_id выдаётся из последовательности student_bookings до вставки самой заявки.
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.booking_idempotency (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    booking_id INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_booking_idempotency_created
+ON t_p90313977_education_center_web.booking_idempotency (created_at);
+
+-- Token bucket на IP и на телефон, общий для всех контейнеров функции
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.rate_limit_buckets (
+    bucket_key VARCHAR(128) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    refill_per_second DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated
+ON t_p90313977_education_center_web.rate_limit_buckets (updated_at);
@@ -0,0 +1,45 @@
+-- Поиск в админке по заявкам (имя, телефон, email) и отзывам (автор, текст).
+-- Телефон хранится ещё и в нормализованном виде: только цифры, 8XXXXXXXXXX и 9XXXXXXXXX приводятся к 7XXXXXXXXXX.
+ALTER TABLE t_p90313977_education_center_web.student_bookings
+ADD COLUMN IF NOT EXISTS student_phone_digits TEXT GENERATED ALWAYS AS (
+    CASE
+        WHEN regexp_replace(student_phone, '\D', '', 'g') ~ '^8\d{10}$'
+            THEN '7' || substr(regexp_replace(student_phone, '\D', '', 'g'), 2)
+        WHEN regexp_replace(student_phone, '\D', '', 'g') ~ '^9\d{9}$'
+            THEN '7' || regexp_replace(student_phone, '\D', '', 'g')
+        ELSE regexp_replace(student_phone, '\D', '', 'g')
+    END
+) STORED;
+
+-- Поиск по началу номера и по последним цифрам
+CREATE INDEX IF NOT EXISTS idx_student_bookings_phone_digits
+ON t_p90313977_education_center_web.student_bookings (student_phone_digits text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_phone_digits_reverse
+ON t_p90313977_education_center_web.student_bookings (reverse(student_phone_digits) text_pattern_ops);
+
+-- Поиск по email целиком или по его началу
+CREATE INDEX IF NOT EXISTS idx_student_bookings_email_lower
+ON t_p90313977_education_center_web.student_bookings (lower(student_email) text_pattern_ops);
+
+-- Полнотекстовый поиск по префиксам слов; выражения должны совпадать с SEARCH_VECTORS['bookings'] и SEARCH_VECTORS['reviews'] в admin-api
+CREATE INDEX IF NOT EXISTS idx_student_bookings_search
+ON t_p90313977_education_center_web.student_bookings
+USING gin (to_tsvector('simple', coalesce(student_name, '') || ' ' || coalesce(student_email, '') || ' ' || translate(coalesce(student_email, ''), '@.', '  ')));
+
+CREATE INDEX IF NOT EXISTS idx_reviews_search
+ON t_p90313977_education_center_web.reviews
+USING gin (to_tsvector('russian', coalesce(author_name, '') || ' ' || coalesce(review_text, '')));
+
+-- Нечёткий поиск по имени и подстроке email, если в базе доступно расширение pg_trgm;
+-- без него admin-api ищет только по словам и цифрам телефона
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+    CREATE INDEX IF NOT EXISTS idx_student_bookings_name_trgm
+    ON t_p90313977_education_center_web.student_bookings USING gin (student_name public.gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_student_bookings_email_trgm
+    ON t_p90313977_education_center_web.student_bookings USING gin (student_email public.gin_trgm_ops);
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm is not available, trigram indexes are skipped: %', SQLERRM;
+END $$;
@@ -0,0 +1,82 @@
+-- Отслеживание изменений для дельта-синхронизации админки (admin-api since=).
+-- updated_at поддерживается триггером на всех таблицах, которые пишет admin-api;
+-- у teachers этой колонки не было.
+ALTER TABLE t_p90313977_education_center_web.teachers
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+        NEW.updated_at := CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Последняя версия каждой строки: транзакция, которая её изменила, и признак удаления (tombstone).
+-- Водяной знак клиента - xmin снимка на момент чтения: всё, что изменено транзакциями
+-- со старшими номерами, попадёт в следующую дельту.
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.row_versions (
+    entity VARCHAR(50) NOT NULL,
+    row_id INTEGER NOT NULL,
+    change_xid xid8 NOT NULL,
+    deleted BOOLEAN NOT NULL DEFAULT false,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (entity, row_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_row_versions_entity_xid
+ON t_p90313977_education_center_web.row_versions (entity, change_xid);
+
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.record_row_versions() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO t_p90313977_education_center_web.row_versions (entity, row_id, change_xid, deleted, changed_at)
+    SELECT TG_ARGV[0], changed_rows.id, pg_current_xact_id(), TG_OP = 'DELETE', CURRENT_TIMESTAMP
+    FROM changed_rows
+    ON CONFLICT (entity, row_id) DO UPDATE
+    SET change_xid = EXCLUDED.change_xid, deleted = EXCLUDED.deleted, changed_at = EXCLUDED.changed_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггеры уровня оператора с таблицами переходов: пакетные вставки и обновления пишут версии одним запросом
+DO $$
+DECLARE
+    tracked RECORD;
+BEGIN
+    FOR tracked IN
+        SELECT * FROM (VALUES
+            ('teachers', 'teachers'),
+            ('schedule', 'schedule'),
+            ('calendar_events', 'calendar'),
+            ('contacts', 'contacts'),
+            ('reviews', 'reviews'),
+            ('results', 'results'),
+            ('student_bookings', 'bookings'),
+            ('notification_settings', 'notifications')
+        ) AS t(table_name, entity)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON t_p90313977_education_center_web.%I', tracked.table_name || '_touch_updated_at', tracked.table_name);
+        EXECUTE format('CREATE TRIGGER %I BEFORE UPDATE ON t_p90313977_education_center_web.%I '
+                       'FOR EACH ROW EXECUTE FUNCTION t_p90313977_education_center_web.touch_updated_at()',
+                       tracked.table_name || '_touch_updated_at', tracked.table_name);
+        
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON t_p90313977_education_center_web.%I', tracked.table_name || '_versions_insert', tracked.table_name);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON t_p90313977_education_center_web.%I '
+                       'REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT '
+                       'EXECUTE FUNCTION t_p90313977_education_center_web.record_row_versions(%L)',
+                       tracked.table_name || '_versions_insert', tracked.table_name, tracked.entity);
+        
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON t_p90313977_education_center_web.%I', tracked.table_name || '_versions_update', tracked.table_name);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON t_p90313977_education_center_web.%I '
+                       'REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT '
+                       'EXECUTE FUNCTION t_p90313977_education_center_web.record_row_versions(%L)',
+                       tracked.table_name || '_versions_update', tracked.table_name, tracked.entity);
+        
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON t_p90313977_education_center_web.%I', tracked.table_name || '_versions_delete', tracked.table_name);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON t_p90313977_education_center_web.%I '
+                       'REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT '
+                       'EXECUTE FUNCTION t_p90313977_education_center_web.record_row_versions(%L)',
+                       tracked.table_name || '_versions_delete', tracked.table_name, tracked.entity);
+    END LOOP;
+END $$;
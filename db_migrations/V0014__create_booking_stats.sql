@@ -0,0 +1,101 @@
+-- Сводки заявок для дашбордов админки (admin-api entity=stats).
+-- Одна строка на зерно (день или месяц), измерение (total, subject, teacher, status),
+-- начало периода и значение измерения. Измерения хранятся раздельно, поэтому размер
+-- сводки зависит от числа периодов и различных значений, а не от числа заявок;
+-- месячные строки позволяют считать итоги за длинный период без обхода всех дней.
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.booking_stats (
+    grain VARCHAR(5) NOT NULL,
+    dimension VARCHAR(20) NOT NULL,
+    period DATE NOT NULL,
+    key VARCHAR(255) NOT NULL,
+    bookings INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (grain, dimension, period, key)
+);
+
+-- Покрывающий индекс: выборка за период читается только из индекса
+CREATE INDEX IF NOT EXISTS idx_booking_stats_grain_period
+ON t_p90313977_education_center_web.booking_stats (grain, period) INCLUDE (dimension, key, bookings);
+
+-- Строки сводки, в которые попадает заявка
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.booking_stats_keys(
+    created_at TIMESTAMP, selected_subject VARCHAR, selected_teacher VARCHAR, status VARCHAR
+) RETURNS TABLE (grain VARCHAR, dimension VARCHAR, period DATE, key VARCHAR) AS $$
+    SELECT g.grain, d.dimension, g.period, d.key
+    FROM (VALUES
+        ('day', created_at::date),
+        ('month', date_trunc('month', created_at)::date)
+    ) AS g(grain, period)
+    CROSS JOIN (VALUES
+        ('total', ''),
+        ('subject', COALESCE(selected_subject, '')),
+        ('teacher', COALESCE(selected_teacher, '')),
+        ('status', COALESCE(status, 'new'))
+    ) AS d(dimension, key)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Изменение сводки по таблицам переходов: +1 за новые версии строк, -1 за старые.
+-- Выполняется в транзакции записи заявки, так что сводка не расходится с таблицей;
+-- обновления, не меняющие дату, предмет, преподавателя и статус, сводку не трогают.
+-- Запросы статические (а не EXECUTE), чтобы plpgsql кешировал их планы.
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.apply_booking_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO t_p90313977_education_center_web.booking_stats AS stats (grain, dimension, period, key, bookings)
+        SELECT k.grain, k.dimension, k.period, k.key, COUNT(*)
+        FROM new_rows c
+        CROSS JOIN LATERAL t_p90313977_education_center_web.booking_stats_keys(c.created_at, c.selected_subject, c.selected_teacher, c.status) k
+        GROUP BY k.grain, k.dimension, k.period, k.key
+        ORDER BY k.grain, k.dimension, k.period, k.key
+        ON CONFLICT (grain, dimension, period, key) DO UPDATE SET bookings = stats.bookings + EXCLUDED.bookings;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO t_p90313977_education_center_web.booking_stats AS stats (grain, dimension, period, key, bookings)
+        SELECT k.grain, k.dimension, k.period, k.key, -COUNT(*)
+        FROM old_rows c
+        CROSS JOIN LATERAL t_p90313977_education_center_web.booking_stats_keys(c.created_at, c.selected_subject, c.selected_teacher, c.status) k
+        GROUP BY k.grain, k.dimension, k.period, k.key
+        ORDER BY k.grain, k.dimension, k.period, k.key
+        ON CONFLICT (grain, dimension, period, key) DO UPDATE SET bookings = stats.bookings + EXCLUDED.bookings;
+    ELSE
+        INSERT INTO t_p90313977_education_center_web.booking_stats AS stats (grain, dimension, period, key, bookings)
+        SELECT k.grain, k.dimension, k.period, k.key, SUM(c.sign)
+        FROM (
+            SELECT created_at, selected_subject, selected_teacher, status, -1 AS sign FROM old_rows
+            UNION ALL
+            SELECT created_at, selected_subject, selected_teacher, status, 1 FROM new_rows
+        ) c
+        CROSS JOIN LATERAL t_p90313977_education_center_web.booking_stats_keys(c.created_at, c.selected_subject, c.selected_teacher, c.status) k
+        GROUP BY k.grain, k.dimension, k.period, k.key
+        HAVING SUM(c.sign) <> 0
+        ORDER BY k.grain, k.dimension, k.period, k.key
+        ON CONFLICT (grain, dimension, period, key) DO UPDATE SET bookings = stats.bookings + EXCLUDED.bookings;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS student_bookings_stats_insert ON t_p90313977_education_center_web.student_bookings;
+CREATE TRIGGER student_bookings_stats_insert AFTER INSERT ON t_p90313977_education_center_web.student_bookings
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_booking_stats();
+
+DROP TRIGGER IF EXISTS student_bookings_stats_update ON t_p90313977_education_center_web.student_bookings;
+CREATE TRIGGER student_bookings_stats_update AFTER UPDATE ON t_p90313977_education_center_web.student_bookings
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_booking_stats();
+
+DROP TRIGGER IF EXISTS student_bookings_stats_delete ON t_p90313977_education_center_web.student_bookings;
+CREATE TRIGGER student_bookings_stats_delete AFTER DELETE ON t_p90313977_education_center_web.student_bookings
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_booking_stats();
+
+-- Начальное заполнение по уже существующим заявкам (тот же запрос делает POST ?entity=stats)
+DELETE FROM t_p90313977_education_center_web.booking_stats;
+
+INSERT INTO t_p90313977_education_center_web.booking_stats (grain, dimension, period, key, bookings)
+SELECT k.grain, k.dimension, k.period, k.key, COUNT(*)
+FROM t_p90313977_education_center_web.student_bookings b
+CROSS JOIN LATERAL t_p90313977_education_center_web.booking_stats_keys(b.created_at, b.selected_subject, b.selected_teacher, b.status) k
+GROUP BY k.grain, k.dimension, k.period, k.key
+ORDER BY k.grain, k.period;
+
+ANALYZE t_p90313977_education_center_web.booking_stats;
@@ -0,0 +1,7 @@
+-- Снимки хранят и brotli-представление, чтобы public-api отдавал его без повторного сжатия.
+-- NULL - снимок собран без модуля brotli; такой ответ сжимается при первом запросе.
+ALTER TABLE t_p90313977_education_center_web.content_snapshots
+ADD COLUMN IF NOT EXISTS body_br BYTEA;
+
+ALTER TABLE t_p90313977_education_center_web.content_snapshots
+ALTER COLUMN body_br SET STORAGE EXTERNAL;
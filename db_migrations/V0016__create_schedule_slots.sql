@@ -0,0 +1,80 @@
+-- Запись на занятия по расписанию с учётом вместимости.
+-- Начало и конец занятия вычисляются из текстового времени расписания ("09:00" или "09:00 - 10:30"),
+-- поэтому админка продолжает редактировать одно поле; без конца занятие длится час.
+-- Строки с неразобранным временем в свободные места не попадают.
+ALTER TABLE t_p90313977_education_center_web.schedule
+ADD COLUMN IF NOT EXISTS capacity INTEGER NOT NULL DEFAULT 8 CHECK (capacity >= 0),
+ADD COLUMN IF NOT EXISTS slot_start TIME GENERATED ALWAYS AS (
+    make_time(
+        substring(time FROM '^\s*([01]?\d|2[0-3]):[0-5]\d')::int,
+        substring(time FROM '^\s*(?:[01]?\d|2[0-3]):([0-5]\d)')::int,
+        0
+    )
+) STORED,
+ADD COLUMN IF NOT EXISTS slot_end TIME GENERATED ALWAYS AS (
+    COALESCE(
+        make_time(
+            substring(time FROM '^\s*(?:[01]?\d|2[0-3]):[0-5]\d\s*[-–—]\s*([01]?\d|2[0-3]):[0-5]\d')::int,
+            substring(time FROM '^\s*(?:[01]?\d|2[0-3]):[0-5]\d\s*[-–—]\s*(?:[01]?\d|2[0-3]):([0-5]\d)')::int,
+            0
+        ),
+        make_time(
+            substring(time FROM '^\s*([01]?\d|2[0-3]):[0-5]\d')::int,
+            substring(time FROM '^\s*(?:[01]?\d|2[0-3]):([0-5]\d)')::int,
+            0
+        ) + INTERVAL '1 hour'
+    )
+) STORED;
+
+-- Занятость конкретного занятия в конкретный день. Строка появляется при первой записи,
+-- booked меняется только условным UPSERT в submit-booking (занять место, если booked < capacity)
+-- и триггером ниже (освободить место при отмене или удалении заявки).
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.schedule_slots (
+    id SERIAL PRIMARY KEY,
+    schedule_id INTEGER NOT NULL REFERENCES t_p90313977_education_center_web.schedule(id) ON DELETE CASCADE,
+    slot_date DATE NOT NULL,
+    booked INTEGER NOT NULL DEFAULT 0 CHECK (booked >= 0),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Ключ по дате первым: им же читаются свободные места за диапазон дат
+    CONSTRAINT schedule_slots_date_schedule_key UNIQUE (slot_date, schedule_id)
+);
+
+ALTER TABLE t_p90313977_education_center_web.student_bookings
+ADD COLUMN IF NOT EXISTS slot_id INTEGER REFERENCES t_p90313977_education_center_web.schedule_slots(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_slot
+ON t_p90313977_education_center_web.student_bookings (slot_id) WHERE slot_id IS NOT NULL;
+
+-- Отмена заявки освобождает место, возврат из отмены занимает его снова (без проверки вместимости:
+-- это решение администратора); удаление неотменённой заявки тоже освобождает место.
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.release_schedule_slot() RETURNS trigger AS $$
+DECLARE
+    delta INTEGER := 0;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.status IS DISTINCT FROM 'cancelled' THEN
+            delta := -1;
+        END IF;
+    ELSIF NEW.status = 'cancelled' THEN
+        delta := -1;
+    ELSIF OLD.status = 'cancelled' THEN
+        delta := 1;
+    END IF;
+    IF delta <> 0 THEN
+        UPDATE t_p90313977_education_center_web.schedule_slots
+        SET booked = GREATEST(booked + delta, 0), updated_at = CURRENT_TIMESTAMP
+        WHERE id = OLD.slot_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS student_bookings_slot_status ON t_p90313977_education_center_web.student_bookings;
+CREATE TRIGGER student_bookings_slot_status AFTER UPDATE OF status ON t_p90313977_education_center_web.student_bookings
+FOR EACH ROW WHEN (OLD.slot_id IS NOT NULL AND OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION t_p90313977_education_center_web.release_schedule_slot();
+
+DROP TRIGGER IF EXISTS student_bookings_slot_delete ON t_p90313977_education_center_web.student_bookings;
+CREATE TRIGGER student_bookings_slot_delete AFTER DELETE ON t_p90313977_education_center_web.student_bookings
+FOR EACH ROW WHEN (OLD.slot_id IS NOT NULL)
+EXECUTE FUNCTION t_p90313977_education_center_web.release_schedule_slot();
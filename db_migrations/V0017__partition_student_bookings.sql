@@ -0,0 +1,274 @@
+-- Заявки секционируются по месяцу created_at: список, фильтры по периоду и выгрузка
+-- читают только нужные месяцы, а старые месяцы отключаются целиком, без DELETE и раздувания индексов.
+-- Таблица пересоздаётся: секционировать существующую на месте нельзя. id и его последовательность,
+-- вычисляемый телефон, индексы поиска и все триггеры (updated_at, row_versions, booking_stats,
+-- места в расписании) переносятся; триггеры создаются после копирования, чтобы копия
+-- не пересчитывала сводки и версии строк.
+ALTER TABLE t_p90313977_education_center_web.student_bookings RENAME TO student_bookings_unpartitioned;
+ALTER SEQUENCE t_p90313977_education_center_web.student_bookings_id_seq OWNED BY NONE;
+
+-- Первичный ключ секционированной таблицы обязан включать ключ секционирования;
+-- уникальность id по-прежнему обеспечивает последовательность
+CREATE TABLE t_p90313977_education_center_web.student_bookings (
+    id INTEGER NOT NULL DEFAULT nextval('t_p90313977_education_center_web.student_bookings_id_seq'),
+    student_name VARCHAR(255) NOT NULL,
+    student_phone VARCHAR(50) NOT NULL,
+    student_email VARCHAR(255),
+    selected_teacher VARCHAR(255),
+    selected_subject VARCHAR(255),
+    selected_time VARCHAR(50),
+    status VARCHAR(50) DEFAULT 'new',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    student_phone_digits TEXT GENERATED ALWAYS AS (
+        CASE
+            WHEN regexp_replace(student_phone, '\D', '', 'g') ~ '^8\d{10}$'
+                THEN '7' || substr(regexp_replace(student_phone, '\D', '', 'g'), 2)
+            WHEN regexp_replace(student_phone, '\D', '', 'g') ~ '^9\d{9}$'
+                THEN '7' || regexp_replace(student_phone, '\D', '', 'g')
+            ELSE regexp_replace(student_phone, '\D', '', 'g')
+        END
+    ) STORED,
+    slot_id INTEGER
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE t_p90313977_education_center_web.student_bookings_id_seq
+OWNED BY t_p90313977_education_center_web.student_bookings.id;
+
+-- Заявки месяца без своей секции (если обслуживание давно не запускалось) попадают сюда,
+-- а не теряются; обслуживание переносит их в секцию месяца
+CREATE TABLE t_p90313977_education_center_web.student_bookings_default
+PARTITION OF t_p90313977_education_center_web.student_bookings DEFAULT;
+
+-- Компактный архив отключённых месяцев: без вычисляемых колонок и индексов поиска,
+-- BRIN по created_at для выборок и очистки по периоду
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.student_bookings_archive (
+    id INTEGER PRIMARY KEY,
+    student_name VARCHAR(255) NOT NULL,
+    student_phone VARCHAR(50) NOT NULL,
+    student_email VARCHAR(255),
+    selected_teacher VARCHAR(255),
+    selected_subject VARCHAR(255),
+    selected_time VARCHAR(50),
+    status VARCHAR(50),
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP,
+    slot_id INTEGER,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_archive_created
+ON t_p90313977_education_center_web.student_bookings_archive USING brin (created_at);
+
+-- Секция месяца. Строки этого месяца из секции по умолчанию переносятся в новую секцию
+-- при отключённой секции по умолчанию: так на них не срабатывают триггеры мест в расписании,
+-- а сводки и версии строк, посчитанные при вставке, остаются верными.
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.create_student_bookings_partition(period_start DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    partition_table TEXT := 'student_bookings_p' || to_char(period_start, 'YYYYMM');
+    lower_bound TIMESTAMP := date_trunc('month', period_start);
+    upper_bound TIMESTAMP := date_trunc('month', period_start) + INTERVAL '1 month';
+    has_strays BOOLEAN;
+BEGIN
+    IF to_regclass(format('t_p90313977_education_center_web.%I', partition_table)) IS NOT NULL THEN
+        RETURN false;
+    END IF;
+
+    SELECT EXISTS (
+        SELECT 1 FROM t_p90313977_education_center_web.student_bookings_default
+        WHERE created_at >= lower_bound AND created_at < upper_bound
+    ) INTO has_strays;
+
+    IF has_strays THEN
+        ALTER TABLE t_p90313977_education_center_web.student_bookings
+        DETACH PARTITION t_p90313977_education_center_web.student_bookings_default;
+    END IF;
+
+    EXECUTE format('CREATE TABLE t_p90313977_education_center_web.%I '
+                   'PARTITION OF t_p90313977_education_center_web.student_bookings FOR VALUES FROM (%L) TO (%L)',
+                   partition_table, lower_bound, upper_bound);
+
+    IF has_strays THEN
+        EXECUTE format('INSERT INTO t_p90313977_education_center_web.%I '
+                       '(id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status, created_at, updated_at, slot_id) '
+                       'SELECT id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status, created_at, updated_at, slot_id '
+                       'FROM t_p90313977_education_center_web.student_bookings_default WHERE created_at >= $1 AND created_at < $2',
+                       partition_table) USING lower_bound, upper_bound;
+        DELETE FROM t_p90313977_education_center_web.student_bookings_default
+        WHERE created_at >= lower_bound AND created_at < upper_bound;
+        ALTER TABLE t_p90313977_education_center_web.student_bookings
+        ATTACH PARTITION t_p90313977_education_center_web.student_bookings_default DEFAULT;
+    END IF;
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Обслуживание секций (admin-api POST ?entity=partitions, по расписанию):
+-- секции на текущий и months_ahead следующих месяцев и для строк из секции по умолчанию;
+-- месяцы старше retention_months переносятся в архив, секция удаляется, а админка получает
+-- tombstone в row_versions; архив старше archive_retention_months очищается.
+-- Сводки booking_stats архивирование не меняет: дашборды сохраняют историю.
+-- 0 в retention_months или archive_retention_months отключает соответствующий шаг.
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.maintain_student_bookings(
+    months_ahead INTEGER, retention_months INTEGER, archive_retention_months INTEGER
+) RETURNS TABLE (action TEXT, partition_table TEXT, row_count BIGINT) AS $$
+DECLARE
+    current_month DATE := date_trunc('month', CURRENT_TIMESTAMP)::date;
+    period DATE;
+    expired TEXT;
+BEGIN
+    FOR period IN
+        SELECT (current_month + make_interval(months => ahead))::date FROM generate_series(0, months_ahead) ahead
+        UNION
+        SELECT DISTINCT date_trunc('month', created_at)::date FROM t_p90313977_education_center_web.student_bookings_default
+        ORDER BY 1
+    LOOP
+        IF t_p90313977_education_center_web.create_student_bookings_partition(period) THEN
+            action := 'created';
+            partition_table := 'student_bookings_p' || to_char(period, 'YYYYMM');
+            EXECUTE format('SELECT COUNT(*) FROM t_p90313977_education_center_web.%I', partition_table) INTO row_count;
+            RETURN NEXT;
+        END IF;
+    END LOOP;
+
+    IF retention_months > 0 THEN
+        FOR expired IN
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 't_p90313977_education_center_web.student_bookings'::regclass
+              AND c.relname ~ '^student_bookings_p\d{6}$'
+              AND to_date(right(c.relname, 6), 'YYYYMM') < current_month - make_interval(months => retention_months)
+            ORDER BY c.relname
+        LOOP
+            EXECUTE format('ALTER TABLE t_p90313977_education_center_web.student_bookings '
+                           'DETACH PARTITION t_p90313977_education_center_web.%I', expired);
+            EXECUTE format('INSERT INTO t_p90313977_education_center_web.student_bookings_archive '
+                           '(id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status, created_at, updated_at, slot_id) '
+                           'SELECT id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status, created_at, updated_at, slot_id '
+                           'FROM t_p90313977_education_center_web.%I ORDER BY created_at, id ON CONFLICT (id) DO NOTHING', expired);
+            GET DIAGNOSTICS row_count = ROW_COUNT;
+            EXECUTE format('INSERT INTO t_p90313977_education_center_web.row_versions (entity, row_id, change_xid, deleted, changed_at) '
+                           'SELECT ''bookings'', id, pg_current_xact_id(), true, CURRENT_TIMESTAMP FROM t_p90313977_education_center_web.%I '
+                           'ON CONFLICT (entity, row_id) DO UPDATE '
+                           'SET change_xid = EXCLUDED.change_xid, deleted = EXCLUDED.deleted, changed_at = EXCLUDED.changed_at', expired);
+            EXECUTE format('DROP TABLE t_p90313977_education_center_web.%I', expired);
+            action := 'archived';
+            partition_table := expired;
+            RETURN NEXT;
+        END LOOP;
+    END IF;
+
+    IF archive_retention_months > 0 THEN
+        DELETE FROM t_p90313977_education_center_web.student_bookings_archive
+        WHERE created_at < current_month - make_interval(months => archive_retention_months);
+        GET DIAGNOSTICS row_count = ROW_COUNT;
+        IF row_count > 0 THEN
+            action := 'purged';
+            partition_table := 'student_bookings_archive';
+            RETURN NEXT;
+        END IF;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции от первого месяца с заявками до трёх месяцев вперёд
+SELECT t_p90313977_education_center_web.create_student_bookings_partition(period::date)
+FROM generate_series(
+    date_trunc('month', LEAST(
+        (SELECT MIN(COALESCE(created_at, updated_at, CURRENT_TIMESTAMP)) FROM t_p90313977_education_center_web.student_bookings_unpartitioned),
+        CURRENT_TIMESTAMP
+    )),
+    date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) period;
+
+INSERT INTO t_p90313977_education_center_web.student_bookings
+(id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status, created_at, updated_at, slot_id)
+SELECT id, student_name, student_phone, student_email, selected_teacher, selected_subject, selected_time, status,
+       COALESCE(created_at, updated_at, CURRENT_TIMESTAMP), updated_at, slot_id
+FROM t_p90313977_education_center_web.student_bookings_unpartitioned;
+
+DROP TABLE t_p90313977_education_center_web.student_bookings_unpartitioned;
+
+-- Индексы создаются на родительской таблице и наследуются всеми секциями, включая будущие
+ALTER TABLE t_p90313977_education_center_web.student_bookings
+ADD CONSTRAINT student_bookings_pkey PRIMARY KEY (id, created_at);
+
+ALTER TABLE t_p90313977_education_center_web.student_bookings
+ADD CONSTRAINT student_bookings_slot_id_fkey FOREIGN KEY (slot_id)
+REFERENCES t_p90313977_education_center_web.schedule_slots(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_created_id
+ON t_p90313977_education_center_web.student_bookings (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_status_created_id
+ON t_p90313977_education_center_web.student_bookings (status, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_subject_created_id
+ON t_p90313977_education_center_web.student_bookings (selected_subject, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_phone_digits
+ON t_p90313977_education_center_web.student_bookings (student_phone_digits text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_phone_digits_reverse
+ON t_p90313977_education_center_web.student_bookings (reverse(student_phone_digits) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_email_lower
+ON t_p90313977_education_center_web.student_bookings (lower(student_email) text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_search
+ON t_p90313977_education_center_web.student_bookings
+USING gin (to_tsvector('simple', coalesce(student_name, '') || ' ' || coalesce(student_email, '') || ' ' || translate(coalesce(student_email, ''), '@.', '  ')));
+
+CREATE INDEX IF NOT EXISTS idx_student_bookings_slot
+ON t_p90313977_education_center_web.student_bookings (slot_id) WHERE slot_id IS NOT NULL;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS idx_student_bookings_name_trgm
+        ON t_p90313977_education_center_web.student_bookings USING gin (student_name public.gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_student_bookings_email_trgm
+        ON t_p90313977_education_center_web.student_bookings USING gin (student_email public.gin_trgm_ops);
+    END IF;
+END $$;
+
+-- Триггеры уровня строки клонируются в секции; триггеры уровня оператора с таблицами переходов
+-- остаются на родительской таблице и видят строки всех затронутых секций
+CREATE TRIGGER student_bookings_touch_updated_at BEFORE UPDATE ON t_p90313977_education_center_web.student_bookings
+FOR EACH ROW EXECUTE FUNCTION t_p90313977_education_center_web.touch_updated_at();
+
+CREATE TRIGGER student_bookings_versions_insert AFTER INSERT ON t_p90313977_education_center_web.student_bookings
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.record_row_versions('bookings');
+
+CREATE TRIGGER student_bookings_versions_update AFTER UPDATE ON t_p90313977_education_center_web.student_bookings
+REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.record_row_versions('bookings');
+
+CREATE TRIGGER student_bookings_versions_delete AFTER DELETE ON t_p90313977_education_center_web.student_bookings
+REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.record_row_versions('bookings');
+
+CREATE TRIGGER student_bookings_stats_insert AFTER INSERT ON t_p90313977_education_center_web.student_bookings
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_booking_stats();
+
+CREATE TRIGGER student_bookings_stats_update AFTER UPDATE ON t_p90313977_education_center_web.student_bookings
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_booking_stats();
+
+CREATE TRIGGER student_bookings_stats_delete AFTER DELETE ON t_p90313977_education_center_web.student_bookings
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_booking_stats();
+
+CREATE TRIGGER student_bookings_slot_status AFTER UPDATE OF status ON t_p90313977_education_center_web.student_bookings
+FOR EACH ROW WHEN (OLD.slot_id IS NOT NULL AND OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION t_p90313977_education_center_web.release_schedule_slot();
+
+CREATE TRIGGER student_bookings_slot_delete AFTER DELETE ON t_p90313977_education_center_web.student_bookings
+FOR EACH ROW WHEN (OLD.slot_id IS NOT NULL)
+EXECUTE FUNCTION t_p90313977_education_center_web.release_schedule_slot();
+
+ANALYZE t_p90313977_education_center_web.student_bookings;
@@ -0,0 +1,33 @@
+-- Повторяющиеся события календаря: одна строка с правилом вместо строки на каждое занятие.
+-- Правило - подмножество RRULE из RFC 5545: FREQ=DAILY|WEEKLY|MONTHLY, INTERVAL, BYDAY (для WEEKLY),
+-- UNTIL (YYYY-MM-DD или YYYYMMDD) и COUNT; date - первое занятие. Вхождения разворачивает public-api
+-- только в пределах запрошенного периода (entity=calendar&from=&to=).
+ALTER TABLE t_p90313977_education_center_web.calendar_events
+ADD COLUMN IF NOT EXISTS recurrence_rule VARCHAR(255) CHECK (
+    recurrence_rule ~ '^FREQ=(DAILY|WEEKLY|MONTHLY)(;(INTERVAL=[1-9][0-9]{0,2}|COUNT=[1-9][0-9]{0,3}|UNTIL=[0-9]{4}-?[0-9]{2}-?[0-9]{2}|BYDAY=(MO|TU|WE|TH|FR|SA|SU)(,(MO|TU|WE|TH|FR|SA|SU))*))*$'
+);
+
+-- Последний возможный день повторения: UNTIL, а для COUNT у DAILY и WEEKLY - оценка сверху
+-- (у WEEKLY каждая неделя после первой даёт хотя бы одно занятие). MONTHLY пропускает месяцы
+-- без нужного числа, поэтому с COUNT оценки нет; NULL - конец неизвестен или повторение бесконечно
+ALTER TABLE t_p90313977_education_center_web.calendar_events
+ADD COLUMN IF NOT EXISTS recurrence_end DATE GENERATED ALWAYS AS (
+    COALESCE(
+        make_date(
+            substring(recurrence_rule FROM 'UNTIL=([0-9]{4})')::int,
+            substring(recurrence_rule FROM 'UNTIL=[0-9]{4}-?([0-9]{2})')::int,
+            substring(recurrence_rule FROM 'UNTIL=[0-9]{4}-?[0-9]{2}-?([0-9]{2})')::int
+        ),
+        date + substring(recurrence_rule FROM 'COUNT=([0-9]+)')::int
+             * COALESCE(substring(recurrence_rule FROM 'INTERVAL=([0-9]+)')::int, 1)
+             * CASE substring(recurrence_rule FROM '^FREQ=([A-Z]+)') WHEN 'DAILY' THEN 1 WHEN 'WEEKLY' THEN 7 END
+    )
+) STORED;
+
+-- Разовые события читаются диапазоном по date, повторяющиеся - из маленького частичного индекса
+CREATE INDEX IF NOT EXISTS idx_calendar_events_date
+ON t_p90313977_education_center_web.calendar_events (date);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_events_recurring
+ON t_p90313977_education_center_web.calendar_events (date) INCLUDE (recurrence_end)
+WHERE recurrence_rule IS NOT NULL;
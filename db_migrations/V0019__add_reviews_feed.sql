@@ -0,0 +1,104 @@
+-- Лента опубликованных отзывов (public-api entity=reviews_feed): страницы по sort_order и дате
+-- читаются из частичного индекса, в который не попадают скрытые отзывы
+CREATE INDEX IF NOT EXISTS idx_reviews_published_feed
+ON t_p90313977_education_center_web.reviews (sort_order, date DESC, id)
+WHERE is_published;
+
+-- Сводка опубликованных отзывов одной строкой: число, сумма и распределение оценок.
+-- Средняя считается из суммы, так что лендингу не нужно читать всю таблицу отзывов
+CREATE TABLE IF NOT EXISTS t_p90313977_education_center_web.review_stats (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    published INTEGER NOT NULL DEFAULT 0,
+    rated INTEGER NOT NULL DEFAULT 0,
+    rating_sum BIGINT NOT NULL DEFAULT 0,
+    rating_1 INTEGER NOT NULL DEFAULT 0,
+    rating_2 INTEGER NOT NULL DEFAULT 0,
+    rating_3 INTEGER NOT NULL DEFAULT 0,
+    rating_4 INTEGER NOT NULL DEFAULT 0,
+    rating_5 INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Изменение сводки по таблицам переходов: +1 за опубликованные новые версии строк, -1 за старые.
+-- Выполняется в транзакции записи отзыва; правки, не трогающие оценку и публикацию, дают нулевую разницу
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.apply_review_stats() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE t_p90313977_education_center_web.review_stats AS stats
+        SET published = stats.published + d.published, rated = stats.rated + d.rated, rating_sum = stats.rating_sum + d.rating_sum,
+            rating_1 = stats.rating_1 + d.rating_1, rating_2 = stats.rating_2 + d.rating_2, rating_3 = stats.rating_3 + d.rating_3,
+            rating_4 = stats.rating_4 + d.rating_4, rating_5 = stats.rating_5 + d.rating_5, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT COUNT(*) AS published, COUNT(rating) AS rated, COALESCE(SUM(rating), 0) AS rating_sum,
+                   COUNT(*) FILTER (WHERE rating = 1) AS rating_1, COUNT(*) FILTER (WHERE rating = 2) AS rating_2,
+                   COUNT(*) FILTER (WHERE rating = 3) AS rating_3, COUNT(*) FILTER (WHERE rating = 4) AS rating_4,
+                   COUNT(*) FILTER (WHERE rating = 5) AS rating_5
+            FROM new_rows WHERE is_published
+        ) d
+        WHERE stats.id AND d.published <> 0;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE t_p90313977_education_center_web.review_stats AS stats
+        SET published = stats.published - d.published, rated = stats.rated - d.rated, rating_sum = stats.rating_sum - d.rating_sum,
+            rating_1 = stats.rating_1 - d.rating_1, rating_2 = stats.rating_2 - d.rating_2, rating_3 = stats.rating_3 - d.rating_3,
+            rating_4 = stats.rating_4 - d.rating_4, rating_5 = stats.rating_5 - d.rating_5, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT COUNT(*) AS published, COUNT(rating) AS rated, COALESCE(SUM(rating), 0) AS rating_sum,
+                   COUNT(*) FILTER (WHERE rating = 1) AS rating_1, COUNT(*) FILTER (WHERE rating = 2) AS rating_2,
+                   COUNT(*) FILTER (WHERE rating = 3) AS rating_3, COUNT(*) FILTER (WHERE rating = 4) AS rating_4,
+                   COUNT(*) FILTER (WHERE rating = 5) AS rating_5
+            FROM old_rows WHERE is_published
+        ) d
+        WHERE stats.id AND d.published <> 0;
+    ELSE
+        UPDATE t_p90313977_education_center_web.review_stats AS stats
+        SET published = stats.published + d.published, rated = stats.rated + d.rated, rating_sum = stats.rating_sum + d.rating_sum,
+            rating_1 = stats.rating_1 + d.rating_1, rating_2 = stats.rating_2 + d.rating_2, rating_3 = stats.rating_3 + d.rating_3,
+            rating_4 = stats.rating_4 + d.rating_4, rating_5 = stats.rating_5 + d.rating_5, updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT COALESCE(SUM(c.sign), 0) AS published, COALESCE(SUM(c.sign) FILTER (WHERE c.rating IS NOT NULL), 0) AS rated,
+                   COALESCE(SUM(c.sign * c.rating), 0) AS rating_sum,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.rating = 1), 0) AS rating_1, COALESCE(SUM(c.sign) FILTER (WHERE c.rating = 2), 0) AS rating_2,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.rating = 3), 0) AS rating_3, COALESCE(SUM(c.sign) FILTER (WHERE c.rating = 4), 0) AS rating_4,
+                   COALESCE(SUM(c.sign) FILTER (WHERE c.rating = 5), 0) AS rating_5
+            FROM (
+                SELECT rating, -1 AS sign FROM old_rows WHERE is_published
+                UNION ALL
+                SELECT rating, 1 FROM new_rows WHERE is_published
+            ) c
+        ) d
+        WHERE stats.id AND (d.published, d.rated, d.rating_sum, d.rating_1, d.rating_2, d.rating_3, d.rating_4, d.rating_5) <> (0, 0, 0, 0, 0, 0, 0, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS reviews_stats_insert ON t_p90313977_education_center_web.reviews;
+CREATE TRIGGER reviews_stats_insert AFTER INSERT ON t_p90313977_education_center_web.reviews
+REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_review_stats();
+
+DROP TRIGGER IF EXISTS reviews_stats_update ON t_p90313977_education_center_web.reviews;
+CREATE TRIGGER reviews_stats_update AFTER UPDATE ON t_p90313977_education_center_web.reviews
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_review_stats();
+
+DROP TRIGGER IF EXISTS reviews_stats_delete ON t_p90313977_education_center_web.reviews;
+CREATE TRIGGER reviews_stats_delete AFTER DELETE ON t_p90313977_education_center_web.reviews
+REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+EXECUTE FUNCTION t_p90313977_education_center_web.apply_review_stats();
+
+-- Начальное заполнение по уже существующим отзывам
+INSERT INTO t_p90313977_education_center_web.review_stats
+    (id, published, rated, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5, updated_at)
+SELECT true, COUNT(*), COUNT(rating), COALESCE(SUM(rating), 0),
+       COUNT(*) FILTER (WHERE rating = 1), COUNT(*) FILTER (WHERE rating = 2), COUNT(*) FILTER (WHERE rating = 3),
+       COUNT(*) FILTER (WHERE rating = 4), COUNT(*) FILTER (WHERE rating = 5), CURRENT_TIMESTAMP
+FROM t_p90313977_education_center_web.reviews
+WHERE is_published
+ON CONFLICT (id) DO UPDATE
+SET published = EXCLUDED.published, rated = EXCLUDED.rated, rating_sum = EXCLUDED.rating_sum,
+    rating_1 = EXCLUDED.rating_1, rating_2 = EXCLUDED.rating_2, rating_3 = EXCLUDED.rating_3,
+    rating_4 = EXCLUDED.rating_4, rating_5 = EXCLUDED.rating_5, updated_at = EXCLUDED.updated_at;
+
+-- Снимок отзывов теперь содержит только опубликованные: старый пересоберётся при первом чтении
+DELETE FROM t_p90313977_education_center_web.content_snapshots WHERE entity = 'reviews';
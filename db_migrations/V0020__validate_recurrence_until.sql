@@ -0,0 +1,43 @@
+-- Дата UNTIL правила повторения с проверкой календаря: шаблон CHECK из V0018 пропускает
+-- несуществующие даты (UNTIL=20260230), и make_date в recurrence_end падал раньше проверки.
+-- Функция возвращает NULL вместо ошибки, а отдельный CHECK отклоняет такое правило как нарушение ограничения
+CREATE OR REPLACE FUNCTION t_p90313977_education_center_web.recurrence_until(rule TEXT) RETURNS DATE AS $$
+DECLARE
+    parts TEXT[] := regexp_match(rule, 'UNTIL=([0-9]{4})-?([0-9]{2})-?([0-9]{2})');
+BEGIN
+    IF parts IS NULL THEN
+        RETURN NULL;
+    END IF;
+    RETURN make_date(parts[1]::int, parts[2]::int, parts[3]::int);
+EXCEPTION WHEN datetime_field_overflow THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Выражение генерируемой колонки в PostgreSQL 16 не меняется на месте: колонка и её индекс пересоздаются
+DROP INDEX IF EXISTS t_p90313977_education_center_web.idx_calendar_events_recurring;
+
+ALTER TABLE t_p90313977_education_center_web.calendar_events
+DROP COLUMN IF EXISTS recurrence_end;
+
+ALTER TABLE t_p90313977_education_center_web.calendar_events
+ADD COLUMN recurrence_end DATE GENERATED ALWAYS AS (
+    COALESCE(
+        t_p90313977_education_center_web.recurrence_until(recurrence_rule),
+        date + substring(recurrence_rule FROM 'COUNT=([0-9]+)')::int
+             * COALESCE(substring(recurrence_rule FROM 'INTERVAL=([0-9]+)')::int, 1)
+             * CASE substring(recurrence_rule FROM '^FREQ=([A-Z]+)') WHEN 'DAILY' THEN 1 WHEN 'WEEKLY' THEN 7 END
+    )
+) STORED;
+
+ALTER TABLE t_p90313977_education_center_web.calendar_events
+DROP CONSTRAINT IF EXISTS calendar_events_recurrence_until_check;
+
+ALTER TABLE t_p90313977_education_center_web.calendar_events
+ADD CONSTRAINT calendar_events_recurrence_until_check CHECK (
+    recurrence_rule !~ 'UNTIL=' OR t_p90313977_education_center_web.recurrence_until(recurrence_rule) IS NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_calendar_events_recurring
+ON t_p90313977_education_center_web.calendar_events (date) INCLUDE (recurrence_end)
+WHERE recurrence_rule IS NOT NULL;
@@ -1,5 +1,6 @@
 import { useState } from 'react';
 import { Button } from '@/components/ui/button';
+import { Input } from '@/components/ui/input';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import Icon from '@/components/ui/icon';
 import { Booking } from './types';
@@ -7,10 +8,13 @@ import { Booking } from './types';
 interface BookingsTabProps {
   bookings: Booking[];
   onSave: (data: Booking, isNew: boolean) => void;
+  onSearch: (term: string) => void;
+  onLoadMore?: () => void;
 }
 
-const BookingsTab = ({ bookings, onSave }: BookingsTabProps) => {
+const BookingsTab = ({ bookings, onSave, onSearch, onLoadMore }: BookingsTabProps) => {
   const [editItem, setEditItem] = useState<Booking | null>(null);
+  const [searchTerm, setSearchTerm] = useState('');
 
   const getStatusBadge = (status?: string) => {
     const colors: Record<string, string> = {
@@ -48,8 +52,35 @@ const BookingsTab = ({ bookings, onSave }: BookingsTabProps) => {
     onSave({ ...booking, status: newStatus }, false);
   };
 
+  const handleSearch = () => {
+    onSearch(searchTerm.trim());
+  };
+
+  const handleResetSearch = () => {
+    setSearchTerm('');
+    onSearch('');
+  };
+
   return (
     <div className="space-y-4">
+      <div className="flex gap-2">
+        <Input
+          placeholder="Поиск по имени, телефону или email"
+          value={searchTerm}
+          onChange={(e) => setSearchTerm(e.target.value)}
+          onKeyDown={(e) => e.key === 'Enter' && handleSearch()}
+        />
+        <Button onClick={handleSearch}>
+          <Icon name="Search" size={16} className="mr-1" />
+          Найти
+        </Button>
+        {searchTerm && (
+          <Button variant="outline" onClick={handleResetSearch}>
+            Сбросить
+          </Button>
+        )}
+      </div>
+
       {editItem && (
         <Card>
           <CardHeader>
@@ -153,6 +184,14 @@ const BookingsTab = ({ bookings, onSave }: BookingsTabProps) => {
           ))
         )}
       </div>
+
+      {onLoadMore && (
+        <div className="flex justify-center">
+          <Button variant="outline" onClick={onLoadMore}>
+            Показать ещё
+          </Button>
+        </div>
+      )}
     </div>
   );
 };
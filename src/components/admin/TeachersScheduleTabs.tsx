@@ -143,6 +143,13 @@ export const ScheduleTab = ({ schedule, onSave }: ScheduleTabProps) => {
               value={editItem.description || ''}
               onChange={(e) => setEditItem({ ...editItem, description: e.target.value })}
             />
+            <Input
+              type="number"
+              min={0}
+              placeholder="Мест на занятии"
+              value={editItem.capacity ?? ''}
+              onChange={(e) => setEditItem({ ...editItem, capacity: e.target.value === '' ? undefined : Number(e.target.value) })}
+            />
             <div className="flex gap-2">
               <Button onClick={handleSave}>Сохранить</Button>
               <Button variant="outline" onClick={() => setEditItem(null)}>Отмена</Button>
@@ -160,6 +167,9 @@ export const ScheduleTab = ({ schedule, onSave }: ScheduleTabProps) => {
                   <h3 className="font-bold">{item.time}</h3>
                   <p className="text-lg">{item.title}</p>
                   <p className="text-sm text-gray-600">{item.description}</p>
+                  {item.capacity !== undefined && (
+                    <p className="text-sm text-gray-600">Мест: {item.capacity}</p>
+                  )}
                 </div>
                 <Button size="sm" onClick={() => setEditItem({ ...item })}>
                   <Icon name="Edit" size={16} />
@@ -15,6 +15,9 @@ export interface Schedule {
   description?: string;
   teacher_id?: number;
   sort_order?: number;
+  capacity?: number;
+  slot_start?: string | null;
+  slot_end?: string | null;
 }
 
 export interface Contact {
@@ -43,7 +43,7 @@ interface BookingDialogProps {
   setStudentEmail: (email: string) => void;
   teachers: Teacher[];
   subjects: Subject[];
-  availableSlots: Array<{ time: string; available: boolean }>;
+  availableSlots: Array<{ time: string; label?: string; available: boolean }>;
   onBooking: () => void;
 }
 
@@ -120,7 +120,7 @@ const BookingDialog: React.FC<BookingDialogProps> = ({
                   .filter((slot) => slot.available)
                   .map((slot) => (
                     <SelectItem key={slot.time} value={slot.time}>
-                      {slot.time}
+                      {slot.label || slot.time}
                     </SelectItem>
                   ))}
               </SelectContent>
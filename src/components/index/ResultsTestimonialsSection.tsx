@@ -22,14 +22,20 @@ interface Testimonial {
   subject: string;
 }
 
+interface ReviewStats {
+  count: number;
+  average: number | null;
+}
+
 interface ResultsTestimonialsSectionProps {
   results: Result[];
   testimonials: Testimonial[];
+  reviewStats?: ReviewStats | null;
 }
 
 const ResultsTestimonialsSection: React.FC<
   ResultsTestimonialsSectionProps
-> = ({ results, testimonials }) => {
+> = ({ results, testimonials, reviewStats }) => {
   return (
     <>
       {/* Results Section */}
@@ -85,6 +91,14 @@ const ResultsTestimonialsSection: React.FC<
             <p className="text-lg text-muted-foreground max-w-2xl mx-auto">
               Что говорят о нас наши выпускники
             </p>
+            {reviewStats && reviewStats.average !== null && (
+              <p className="mt-4 text-muted-foreground">
+                <Icon name="Star" size={16} className="mr-1 inline text-primary" />
+                Средняя оценка{" "}
+                <span className="font-bold text-primary">{reviewStats.average}</span>{" "}
+                из 5 по {reviewStats.count} отзывам
+              </p>
+            )}
           </div>
           <div className="grid md:grid-cols-2 lg:grid-cols-3 gap-8">
             {testimonials.map((testimonial, index) => (
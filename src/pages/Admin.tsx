@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -14,6 +14,18 @@ import type { Teacher, Schedule, Contact, Review, Booking, NotificationSetting }
 
 const API_AUTH = 'https://functions.poehali.dev/ac68c96a-4b48-4841-afdd-c45fec1a7ad5';
 const API_DATA = 'https://functions.poehali.dev/a30f8752-d13c-41eb-99b2-d8709193a333';
+const BOOKINGS_PAGE_SIZE = 50;
+
+// loadedFrom - created_at последней загруженной строки, пока есть непрочитанные страницы:
+// изменённые строки старше неё не добавляются, их покажет следующая страница
+const mergeRows = (rows: any[], changed: any[], deleted: number[], prepend: boolean, loadedFrom?: string) => {
+  const changedById = new Map(changed.map((row) => [row.id, row]));
+  const removed = new Set(deleted);
+  const known = new Set(rows.map((row) => row.id));
+  const merged = rows.filter((row) => !removed.has(row.id)).map((row) => changedById.get(row.id) ?? row);
+  const added = changed.filter((row) => !known.has(row.id) && !(loadedFrom && row.created_at < loadedFrom));
+  return prepend ? [...added, ...merged] : [...merged, ...added];
+};
 
 const Admin = () => {
   const navigate = useNavigate();
@@ -28,7 +40,20 @@ const Admin = () => {
   const [contacts, setContacts] = useState<Contact[]>([]);
   const [reviews, setReviews] = useState<Review[]>([]);
   const [bookings, setBookings] = useState<Booking[]>([]);
+  const [bookingsCursor, setBookingsCursor] = useState<string | null>(null);
   const [notifications, setNotifications] = useState<NotificationSetting[]>([]);
+  const syncMarks = useRef<Record<string, string>>({});
+  // LSN последней записи: чтения после сохранения не уходят на отстающую реплику
+  const readAfterLsn = useRef('');
+
+  const setters: Record<string, any> = {
+    teachers: setTeachers,
+    schedule: setSchedule,
+    contacts: setContacts,
+    reviews: setReviews,
+    bookings: setBookings,
+    notifications: setNotifications
+  };
 
   useEffect(() => {
     const token = localStorage.getItem('adminToken');
@@ -55,6 +80,8 @@ const Admin = () => {
         setIsAuthenticated(true);
         loadAllData(data.token);
         toast({ title: 'Успешно', description: 'Вы вошли в систему' });
+      } else if (response.status === 429) {
+        toast({ title: 'Ошибка', description: 'Слишком много попыток входа. Попробуйте позже', variant: 'destructive' });
       } else {
         toast({ title: 'Ошибка', description: 'Неверные данные для входа', variant: 'destructive' });
       }
@@ -70,6 +97,20 @@ const Admin = () => {
     navigate('/');
   };
 
+  const expireSession = (response: Response) => {
+    if (response.status !== 401) return false;
+    if (localStorage.getItem('adminToken')) {
+      localStorage.removeItem('adminToken');
+      setIsAuthenticated(false);
+      setAuthToken('');
+      toast({ title: 'Сессия истекла', description: 'Войдите снова', variant: 'destructive' });
+    }
+    return true;
+  };
+
+  const readHeaders = (token: string): Record<string, string> =>
+    readAfterLsn.current ? { 'X-Auth-Token': token, 'X-Read-After-LSN': readAfterLsn.current } : { 'X-Auth-Token': token };
+
   const loadAllData = async (token: string) => {
     await loadData('teachers', token, setTeachers);
     await loadData('schedule', token, setSchedule);
@@ -80,19 +121,96 @@ const Admin = () => {
   };
 
   const loadData = async (entity: string, token: string, setter: any) => {
+    if (entity === 'bookings') {
+      await loadBookings(token);
+      return;
+    }
     try {
-      const response = await fetch(`${API_DATA}?entity=${entity}`, {
-        headers: { 'X-Auth-Token': token }
+      const response = await fetch(`${API_DATA}?entity=${entity}&since=0`, {
+        headers: readHeaders(token)
       });
+      if (expireSession(response)) return;
       const data = await response.json();
       if (response.ok) {
-        setter(Array.isArray(data) ? data : []);
+        setter(Array.isArray(data.items) ? data.items : []);
+        syncMarks.current[entity] = data.since;
       }
     } catch (error) {
       console.error(`Error loading ${entity}:`, error);
     }
   };
 
+  // Заявки читаются страницами limit/cursor; since=0 выгрузил бы всю таблицу, водяной знак для дельт отдаёт первая страница
+  const loadBookings = async (token: string, cursor?: string) => {
+    try {
+      const params = new URLSearchParams({ entity: 'bookings', limit: String(BOOKINGS_PAGE_SIZE) });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`${API_DATA}?${params}`, {
+        headers: readHeaders(token)
+      });
+      if (expireSession(response)) return;
+      const data = await response.json();
+      if (response.ok) {
+        const items: Booking[] = Array.isArray(data.items) ? data.items : [];
+        if (cursor) {
+          setBookings((rows) => mergeRows(rows, items, [], false));
+        } else {
+          setBookings(items);
+          syncMarks.current.bookings = data.since;
+        }
+        setBookingsCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      console.error('Error loading bookings:', error);
+    }
+  };
+
+  const syncEntity = async (entity: string, token: string) => {
+    const since = syncMarks.current[entity];
+    if (!since) {
+      await loadData(entity, token, setters[entity]);
+      return;
+    }
+    try {
+      const response = await fetch(`${API_DATA}?entity=${entity}&since=${since}`, {
+        headers: readHeaders(token)
+      });
+      if (expireSession(response)) return;
+      const data = await response.json();
+      if (response.ok) {
+        if (entity === 'bookings') {
+          setBookings((rows) => mergeRows(rows, data.items || [], data.deleted || [], true, bookingsCursor && rows.length ? rows[rows.length - 1].created_at : undefined));
+        } else {
+          setters[entity]((rows: any[]) => mergeRows(rows, data.items || [], data.deleted || [], false));
+        }
+        syncMarks.current[entity] = data.since;
+      }
+    } catch (error) {
+      console.error(`Error syncing ${entity}:`, error);
+    }
+  };
+
+  const searchBookings = async (term: string) => {
+    if (term.length < 2) {
+      await loadData('bookings', authToken, setBookings);
+      return;
+    }
+    try {
+      const params = new URLSearchParams({ entity: 'bookings', search: term, limit: '100' });
+      const response = await fetch(`${API_DATA}?${params}`, {
+        headers: readHeaders(authToken)
+      });
+      if (expireSession(response)) return;
+      const data = await response.json();
+      if (response.ok) {
+        setBookings(Array.isArray(data.items) ? data.items : []);
+        setBookingsCursor(null);
+      }
+    } catch (error) {
+      console.error('Error searching bookings:', error);
+    }
+  };
+
   const saveEntity = async (entity: string, data: any, isNew: boolean) => {
     try {
       const method = isNew ? 'POST' : 'PUT';
@@ -107,9 +225,11 @@ const Admin = () => {
         body: JSON.stringify(data)
       });
       
+      if (expireSession(response)) return;
       if (response.ok) {
+        readAfterLsn.current = response.headers.get('X-Read-After-LSN') || readAfterLsn.current;
         toast({ title: 'Успешно', description: 'Данные сохранены' });
-        loadAllData(authToken);
+        syncEntity(entity, authToken);
       } else {
         toast({ title: 'Ошибка', description: 'Не удалось сохранить данные', variant: 'destructive' });
       }
@@ -168,7 +288,12 @@ const Admin = () => {
           </TabsList>
 
           <TabsContent value="bookings">
-            <BookingsTab bookings={bookings} onSave={(data, isNew) => saveEntity('bookings', data, isNew)} />
+            <BookingsTab
+              bookings={bookings}
+              onSave={(data, isNew) => saveEntity('bookings', data, isNew)}
+              onSearch={searchBookings}
+              onLoadMore={bookingsCursor ? () => loadBookings(authToken, bookingsCursor) : undefined}
+            />
           </TabsContent>
 
           <TabsContent value="notifications">
@@ -41,6 +41,8 @@ const Index = () => {
   const [schedule, setSchedule] = useState<any[]>([]);
   const [contacts, setContacts] = useState<any[]>([]);
   const [reviews, setReviews] = useState<any[]>([]);
+  const [reviewStats, setReviewStats] = useState<{ count: number; average: number | null } | null>(null);
+  const [availability, setAvailability] = useState<any[]>([]);
 
   const API_URL = 'https://functions.poehali.dev/3fe1afdd-d3fa-410a-8629-ad0d3e8996fe';
 
@@ -48,36 +50,46 @@ const Index = () => {
     loadData();
   }, []);
 
+  useEffect(() => {
+    if (bookingOpen) loadAvailability();
+  }, [bookingOpen]);
+
   const loadData = async () => {
     try {
-      const [teachersRes, scheduleRes, contactsRes, reviewsRes] = await Promise.all([
-        fetch(`${API_URL}?entity=teachers`),
-        fetch(`${API_URL}?entity=schedule`),
-        fetch(`${API_URL}?entity=contacts`),
-        fetch(`${API_URL}?entity=reviews`)
+      const [response, feedResponse] = await Promise.all([
+        fetch(`${API_URL}?entities=teachers,schedule,contacts`),
+        fetch(`${API_URL}?entity=reviews_feed&limit=12`),
       ]);
       
-      if (teachersRes.ok) {
-        const data = await teachersRes.json();
-        setTeachers(data);
-      }
-      if (scheduleRes.ok) {
-        const data = await scheduleRes.json();
-        setSchedule(data);
-      }
-      if (contactsRes.ok) {
-        const data = await contactsRes.json();
-        setContacts(data);
+      if (response.ok) {
+        const data = await response.json();
+        setTeachers(data.teachers || []);
+        setSchedule(data.schedule || []);
+        setContacts(data.contacts || []);
       }
-      if (reviewsRes.ok) {
-        const data = await reviewsRes.json();
-        setReviews(data);
+      // Опубликованные отзывы страницей, средняя оценка - из готовой сводки
+      if (feedResponse.ok) {
+        const feed = await feedResponse.json();
+        setReviews(feed.reviews || []);
+        setReviewStats(feed.stats || null);
       }
     } catch (error) {
       console.error('Error loading data:', error);
     }
   };
 
+  const loadAvailability = async () => {
+    try {
+      const response = await fetch(`${API_URL}?entity=availability`);
+      if (response.ok) {
+        const data = await response.json();
+        setAvailability(data.slots || []);
+      }
+    } catch (error) {
+      console.error('Error loading availability:', error);
+    }
+  };
+
   const results = [
     { exam: "ЕГЭ Математика", averageScore: 87, successRate: 94 },
     { exam: "ОГЭ Русский язык", averageScore: 4.6, successRate: 96 },
@@ -92,7 +104,7 @@ const Index = () => {
     subject: '',
   }));
 
-  const availableSlots = [
+  const defaultSlots = [
     { time: "9:00", available: true },
     { time: "11:00", available: true },
     { time: "13:00", available: false },
@@ -101,6 +113,17 @@ const Index = () => {
     { time: "19:00", available: true },
   ];
 
+  // Занятия из расписания: значение "schedule_id@дата", без расписания - прежний список времени
+  const scheduleSlots = availability.flatMap((slot) =>
+    Object.entries(slot.available || {}).map(([date, seats]) => ({
+      time: `${slot.schedule_id}@${date}`,
+      label: `${date} ${slot.starts_at} — ${slot.subject}${slot.teacher ? `, ${slot.teacher}` : ""} (мест: ${seats})`,
+      available: Number(seats) > 0,
+    })),
+  );
+  const availableSlots: Array<{ time: string; label?: string; available: boolean }> =
+    scheduleSlots.length ? scheduleSlots : defaultSlots;
+
   const handleBooking = async () => {
     if (
       !selectedTeacher ||
@@ -113,6 +136,9 @@ const Index = () => {
       return;
     }
 
+    const [scheduleId, slotDate] = selectedTime.split("@");
+    const timeLabel = availableSlots.find((slot) => slot.time === selectedTime)?.label || selectedTime;
+
     try {
       const response = await fetch(
         "https://functions.poehali.dev/98346566-b607-4709-8500-51e601b9d6e9",
@@ -126,6 +152,7 @@ const Index = () => {
             selected_teacher: selectedTeacher,
             selected_subject: selectedSubject,
             selected_time: selectedTime,
+            ...(slotDate ? { schedule_id: Number(scheduleId), slot_date: slotDate } : {}),
           }),
         }
       );
@@ -136,7 +163,7 @@ const Index = () => {
         alert(`Заявка отправлена!
 Преподаватель: ${selectedTeacher}
 Предмет: ${selectedSubject}
-Время: ${selectedTime}
+Время: ${timeLabel}
 Ученик: ${studentName}
 
 Мы свяжемся с вами в ближайшее время!`);
@@ -147,6 +174,12 @@ const Index = () => {
         setStudentName("");
         setStudentPhone("");
         setStudentEmail("");
+      } else if (response.status === 409) {
+        alert("На это занятие мест больше нет. Выберите другое время.");
+        setSelectedTime("");
+        loadAvailability();
+      } else if (response.status === 429) {
+        alert("Слишком много заявок подряд. Попробуйте через несколько минут.");
       } else {
         alert("Ошибка при отправке заявки. Попробуйте позже.");
       }
@@ -229,12 +262,13 @@ const Index = () => {
       />
 
       {/* Schedule Section */}
-      <ScheduleSection schedule={schedule} availableSlots={availableSlots} />
+      <ScheduleSection schedule={schedule} availableSlots={defaultSlots} />
 
       {/* Results and Testimonials Section */}
       <ResultsTestimonialsSection
         results={results}
         testimonials={testimonials}
+        reviewStats={reviewStats}
       />
 
       {/* Contacts and Footer */}